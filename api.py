@@ -0,0 +1,394 @@
+from datetime import date, datetime, timedelta
+from flask import Blueprint, g, jsonify, request
+from sqlalchemy import insert, select, update
+
+from database import session, utcnow
+from forms import clean_client, clean_project, clean_task, field, to_id, to_number
+from models import ApiToken, Client, Project, Task
+from rollups import hours_report, log_time
+from shards import MOVING_MESSAGE, use_shard, writes_blocked
+from stats import user_data_changed
+
+import hashlib
+import os
+import secrets
+
+api = Blueprint("api", __name__, url_prefix="/api")
+
+PAGE_SIZE = int(os.environ.get("PAGE_SIZE", 50))
+MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", 500))
+MAX_BATCH = int(os.environ.get("API_MAX_BATCH", 1000))
+
+CLIENT_COLUMNS = [
+    Client.id, Client.lastname, Client.firstname, Client.enterprise, Client.address, Client.zip_code,
+    Client.city, Client.country, Client.phone_number, Client.email, Client.note
+]
+PROJECT_COLUMNS = [
+    Project.id, Project.name_project, Project.description, Project.url, Project.hosting_server,
+    Project.status, Project.hourly_rate, Project.client_id,
+    Project.total_time.label("total_time"), Project.total_cost.label("total_cost")
+]
+TASK_COLUMNS = [Task.id, Task.name_task, Task.status, Task.time_spent, Task.project_id]
+
+
+# ==================
+# Jetons d'API
+# ==================
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def create_token(user_id):
+    # Le jeton en clair n'est montré qu'une fois, à sa création
+    token = secrets.token_urlsafe(32)
+
+    session.add(ApiToken(token_hash=hash_token(token), created_at=utcnow(), user_id=user_id))
+
+    return token
+
+
+@api.before_request
+def authenticate():
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+
+    if scheme.lower() != "bearer" or not token:
+        return error("Jeton d'API manquant.", 401)
+
+    user_id = session.scalar(select(ApiToken.user_id).where(ApiToken.token_hash == hash_token(token.strip())))
+
+    if user_id is None:
+        return error("Jeton d'API invalide.", 401)
+
+    # Données de l'utilisateur dans son shard (voir shards.py) ; écritures refusées pendant un déplacement
+    use_shard(user_id)
+
+    if request.method not in ("GET", "HEAD") and writes_blocked(user_id):
+        return error(MOVING_MESSAGE, 503)
+
+    g.api_user_id = user_id
+
+
+# ==========
+# Réponses
+# ==========
+def error(message, status, errors=None):
+    payload = {"error": message}
+
+    if errors:
+        payload["errors"] = [{"index": index, "error": text} for index, text in errors]
+
+    return jsonify(payload), status
+
+
+def json_response(payload):
+    # ETag calculé sur le corps : 304 si le client a déjà cette version
+    response = jsonify(payload)
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.add_etag()
+
+    return response.make_conditional(request)
+
+
+def json_body(key):
+    body = request.get_json(silent=True)
+
+    if not isinstance(body, dict) or not isinstance(body.get(key), list):
+        return None
+
+    return body[key]
+
+
+def page(statement, id_column):
+    cursor = request.args.get("cursor", type=int)
+    size = max(1, min(request.args.get("size", PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+
+    if cursor is not None:
+        statement = statement.where(id_column > cursor)
+
+    rows = session.execute(statement.order_by(id_column).limit(size + 1)).mappings().all()
+    next_cursor = rows[size - 1]["id"] if len(rows) > size else None
+
+    return json_response({"data": [dict(row) for row in rows[:size]], "next_cursor": next_cursor})
+
+
+def owned_project_ids(ids):
+    return set(session.scalars(
+        select(Project.id).where(Project.user_id == g.api_user_id, Project.id.in_(ids))
+    ))
+
+
+# =========
+# Clients
+# =========
+@api.get("/clients")
+def listClients():
+    return page(select(*CLIENT_COLUMNS).where(Client.user_id == g.api_user_id), Client.id)
+
+
+@api.post("/clients")
+def createClient():
+    values, message = clean_client(request.get_json(silent=True) or {})
+
+    if message:
+        return error(message, 422)
+
+    client = Client(**values, user_id=g.api_user_id)
+    session.add(client)
+    session.commit()
+
+    user_data_changed(g.api_user_id)
+
+    return jsonify(id=client.id), 201
+
+
+# ==========
+# Projets
+# ==========
+@api.get("/projects")
+def listProjects():
+    return page(select(*PROJECT_COLUMNS).where(Project.user_id == g.api_user_id), Project.id)
+
+
+@api.get("/projects/<int:project_id>")
+def getProject(project_id):
+    row = session.execute(
+        select(*PROJECT_COLUMNS).where(Project.id == project_id, Project.user_id == g.api_user_id)
+    ).mappings().first()
+
+    if row is None:
+        return error("Projet introuvable.", 404)
+
+    return json_response(dict(row))
+
+
+@api.post("/projects")
+def createProject():
+    values, message = clean_project(request.get_json(silent=True) or {})
+
+    if not message and session.scalar(
+        select(Client.id).where(Client.id == values["client_id"], Client.user_id == g.api_user_id)
+    ) is None:
+        message = "Client inconnu."
+
+    if message:
+        return error(message, 422)
+
+    project = Project(**values, user_id=g.api_user_id)
+    session.add(project)
+    session.commit()
+
+    user_data_changed(g.api_user_id)
+
+    return jsonify(id=project.id), 201
+
+
+# =========
+# Tâches
+# =========
+@api.get("/tasks")
+def listTasks():
+    statement = (
+        select(*TASK_COLUMNS)
+        .join(Project, Project.id == Task.project_id)
+        .where(Project.user_id == g.api_user_id)
+    )
+
+    project_id = request.args.get("project", type=int)
+    if project_id is not None:
+        statement = statement.where(Task.project_id == project_id)
+
+    return page(statement, Task.id)
+
+
+@api.post("/tasks/batch")
+def createTasks():
+    items = json_body("tasks")
+
+    if items is None:
+        return error("Le corps doit contenir une liste « tasks ».", 400)
+    if len(items) > MAX_BATCH:
+        return error(f"{MAX_BATCH} tâches maximum par requête.", 413)
+
+    rows = []
+    errors = []
+
+    for index, item in enumerate(items):
+        values, message = clean_task(item) if isinstance(item, dict) else (None, "Objet attendu.")
+
+        if message:
+            errors.append((index, message))
+        else:
+            rows.append((index, values))
+
+    projects = owned_project_ids({values["project_id"] for _, values in rows})
+    errors += [(index, "Projet inconnu.") for index, values in rows if values["project_id"] not in projects]
+
+    # Tout ou rien, dans une seule transaction
+    if errors:
+        return error("Aucune tâche créée.", 422, sorted(errors))
+
+    # Le temps passé est enregistré comme saisies (voir rollups.py)
+    hours = [values.pop("time_spent") for _, values in rows]
+    ids = session.scalars(
+        insert(Task).returning(Task.id, sort_by_parameter_order=True),
+        [values for _, values in rows]
+    ).all()
+    log_time(session, [(task_id, duration, None) for task_id, duration in zip(ids, hours)])
+    session.commit()
+
+    user_data_changed(g.api_user_id)
+
+    return jsonify(created=ids), 201
+
+
+@api.patch("/tasks/batch")
+def updateTasks():
+    items = json_body("tasks")
+
+    if items is None:
+        return error("Le corps doit contenir une liste « tasks ».", 400)
+    if len(items) > MAX_BATCH:
+        return error(f"{MAX_BATCH} tâches maximum par requête.", 413)
+
+    rows = []
+    errors = []
+    seen = set()
+
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not to_id(item.get("id")):
+            errors.append((index, "L'id de la tâche est obligatoire."))
+            continue
+
+        values = {"id": to_id(item["id"])}
+
+        # Les corrections de temps partent de la valeur lue une fois pour tout le lot
+        if values["id"] in seen:
+            errors.append((index, "Tâche déjà présente dans la requête."))
+            continue
+        seen.add(values["id"])
+
+        for name in ("name_task", "status"):
+            if name in item:
+                values[name] = field(item, name)
+                if not values[name]:
+                    errors.append((index, f"Le champ {name} ne peut pas être vide."))
+
+        if "time_spent" in item:
+            values["time_spent"] = to_number(item["time_spent"])
+            if values["time_spent"] is None:
+                errors.append((index, "Le temps passé doit être un nombre."))
+
+        rows.append((index, values))
+
+    owned = dict(session.execute(
+        select(Task.id, Task.time_spent)
+        .join(Project, Project.id == Task.project_id)
+        .where(Project.user_id == g.api_user_id, Task.id.in_([values["id"] for _, values in rows]))
+    ).all())
+    errors += [(index, "Tâche inconnue.") for index, values in rows if values["id"] not in owned]
+
+    if errors:
+        return error("Aucune tâche modifiée.", 422, sorted(errors))
+
+    # Un nouveau temps passé devient une saisie de correction (écart avec l'actuel)
+    corrections = [
+        (values["id"], values.pop("time_spent") - owned[values["id"]], None)
+        for _, values in rows if "time_spent" in values
+    ]
+
+    # UPDATE groupé par clé primaire (executemany)
+    updates = [values for _, values in rows if len(values) > 1]
+    if updates:
+        session.execute(update(Task), updates)
+
+    log_time(session, corrections)
+    session.commit()
+
+    user_data_changed(g.api_user_id)
+
+    return jsonify(updated=len(rows))
+
+
+# ====================
+# Saisies de temps
+# ====================
+def parse_datetime(value):
+    try:
+        return datetime.fromisoformat(value).replace(tzinfo=None) if value else None
+    except (TypeError, ValueError):
+        return False
+
+
+@api.post("/time-entries")
+def createTimeEntries():
+    items = json_body("entries")
+
+    if items is None:
+        return error("Le corps doit contenir une liste « entries ».", 400)
+    if len(items) > MAX_BATCH:
+        return error(f"{MAX_BATCH} saisies maximum par requête.", 413)
+
+    entries = []
+    errors = []
+
+    for index, item in enumerate(items):
+        item = item if isinstance(item, dict) else {}
+        task_id = to_id(item.get("task"))
+        duration = to_number(item.get("duration"))
+        started_at = parse_datetime(item.get("started_at"))
+
+        if not task_id:
+            errors.append((index, "La tâche est obligatoire."))
+        elif duration is None:
+            errors.append((index, "La durée doit être un nombre."))
+        elif started_at is False:
+            errors.append((index, "started_at doit être une date ISO 8601."))
+        else:
+            entries.append((index, (task_id, duration, started_at)))
+
+    owned = set(session.scalars(
+        select(Task.id)
+        .join(Project, Project.id == Task.project_id)
+        .where(Project.user_id == g.api_user_id, Task.id.in_([entry[0] for _, entry in entries]))
+    ))
+    errors += [(index, "Tâche inconnue.") for index, entry in entries if entry[0] not in owned]
+
+    if errors:
+        return error("Aucune saisie enregistrée.", 422, sorted(errors))
+
+    log_time(session, [entry for _, entry in entries])
+    session.commit()
+
+    user_data_changed(g.api_user_id)
+
+    return jsonify(created=len(entries)), 201
+
+
+# ==========
+# Rapports
+# ==========
+@api.get("/reports/hours")
+def reportHours():
+    # ?period=day|week&group=project|client&from=AAAA-MM-JJ&to=AAAA-MM-JJ (30 derniers jours par défaut)
+    period = request.args.get("period", "day")
+    group = request.args.get("group", "project")
+
+    if period not in ("day", "week") or group not in ("project", "client"):
+        return error("period doit valoir day ou week, group project ou client.", 400)
+
+    try:
+        end = date.fromisoformat(request.args.get("to") or date.today().isoformat())
+        start = date.fromisoformat(request.args.get("from") or (end - timedelta(days=30)).isoformat())
+    except ValueError:
+        return error("from et to doivent être des dates AAAA-MM-JJ.", 400)
+
+    if period == "week":
+        start -= timedelta(days=start.weekday())
+
+    return json_response({
+        "period": period,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "data": hours_report(session, g.api_user_id, period, start, end, group)
+    })
+
@@ -1,76 +1,246 @@
 from dotenv import load_dotenv
-from flask import Flask, flash, redirect, render_template, request, url_for
+from flask import Blueprint, Flask, Response, abort, current_app, flash, redirect, render_template, request, send_file, stream_template, stream_with_context, url_for
 from flask_login import current_user, LoginManager, login_user, logout_user, login_required
-from flask_mail import Mail, Message
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from werkzeug.security import check_password_hash, generate_password_hash
-
-from models import Base, User, Client, Project, Task
-
+from flask_mail import Mail
+from jinja2 import FileSystemBytecodeCache
+
+from api import api, create_token
+from assets import init_assets
+from csvio import CSV_COLUMNS, export_csv, import_csv
+from database import env_flag, get_engine, init_session, session, shard_names
+from events import init_events, publish_deleted, publish_rows, stream, subscribed
+from forms import clean_client, clean_project, clean_task, to_number
+from fragments import evict, fragment_cache, init_fragments
+from instrumentation import init_instrumentation
+from mailer import init_mailer, outbox_sender, queue_email
+from metrics import init_metrics, metrics_response
+from models import ApiToken, User, Client, Project, Task
+from passwords import PasswordBusy, hash_password, verify_password
+from purge import delete_account, init_purge, purger
+from rebalance import init_rebalance
+from reports import FORMATS, ReportBusy, init_reports, invoices, month_bounds, previous_month, report_file
+from rollups import log_time, rebuild_rollups, reconcile_entries
+from search import install_search, rebuild_search, search
+from shards import assign_shard, init_shards, use_shard
+from stats import dashboard_cache, dashboard_stats, user_data_changed
+from totals import check_totals, repair_totals
+from users import load_cached_user, user_cache, user_changed
+from versions import conditional
+
+import click
+
+import hmac
 import os
 
 load_dotenv()
 
+JINJA_CACHE_DIR = os.environ.get("JINJA_CACHE_DIR")
+
+# =======================
+# Blueprint et extensions
+# =======================
+# Les routes sont déclarées sur le blueprint main, l'application est assemblée par create_app().
+# Rien ne touche la base au démarrage : le moteur est créé à la première requête SQL
+# (voir database.py) et le schéma est mis à jour à part (python migrations.py).
+main = Blueprint('main', __name__, cli_group=None)
+
+login_manager = LoginManager()
+login_manager.login_view = 'main.index'
+
+mail = Mail()
+
+@login_manager.user_loader
+def load_user(user_id):
+    # Copie légère mise en cache (voir users.py) : pas de requête à chaque page
+    user = load_cached_user(int(user_id))
+
+    # Les requêtes de la session sur les données de l'utilisateur vont dans son shard
+    if user is not None:
+        use_shard(user.id)
+
+    return user
+
+
 # ============
 # Config Flask
 # ============
-app = Flask('__name__')
-app.secret_key = os.environ.get('SECRET_KEY')
+def create_app():
+    app = Flask(__name__)
+    app.secret_key = os.environ.get('SECRET_KEY')
+    app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_SIZE', 16 * 1024 * 1024))
 
+    # Gabarits compilés gardés sur disque : un worker neuf ne recompile pas (flask compile-templates)
+    if JINJA_CACHE_DIR:
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(os.path.join(app.root_path, JINJA_CACHE_DIR))
 
-# =================
-# Config SQLAlchemy
-# =================
-db = os.environ.get('DB_PATH')
+    # Fichiers statiques empreintes et précompressés (voir assets.py)
+    init_assets(app)
 
-engine = create_engine(db)
+    # Lignes de tableau mises en cache par version (voir fragments.py)
+    init_fragments(app)
 
-try:
-    Base.metadata.create_all(bind=engine)
+    # Mises à jour en direct (SSE), si LIVE_EVENTS est activé (voir events.py)
+    init_events(app)
 
-    Session = sessionmaker(bind=engine)
-    session = Session()
+    # Requêtes SQL comptées et chronométrées par requête HTTP, en-tête Server-Timing (voir instrumentation.py)
+    init_instrumentation(app)
 
-    print("DB success!")
+    # Métriques Prometheus sur /metrics (voir metrics.py)
+    init_metrics(app)
 
-except Exception as ex:
-    print(ex)
+    # Moteur, pool et session par requête : voir database.py
+    init_session(app)
 
+    # Données des utilisateurs réparties entre plusieurs bases (DB_SHARDS) : voir shards.py, rebalance.py
+    init_shards(app)
+    init_rebalance(app)
 
-# ==================
-# Config Flask-Login
-# ==================
-login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'index'
+    # API JSON : authentification par jeton (Authorization: Bearer ...), indépendante de Flask-Login
+    app.json.compact = True
+    app.register_blueprint(api)
+    app.register_blueprint(main)
 
-@login_manager.user_loader
-def load_user(user_id):
-    return session.query(User).get(int(user_id))
+    login_manager.init_app(app)
+
+    # Flask-Mail
+    app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
+    app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 587))
+    app.config['MAIL_USE_TLS'] = env_flag('MAIL_USE_TLS', True)
+    app.config['MAIL_USE_SSL'] = False
+    app.config['MAIL_USERNAME'] = os.environ.get("EMAIL_ADDRESS")
+    app.config['MAIL_PASSWORD'] = os.environ.get('PASSWORD_MAIL')
+    app.config['MAIL_DEFAULT_SENDER'] = os.environ.get("EMAIL_ADDRESS")
+
+    mail.init_app(app)
+
+    # Les e-mails passent par la table outbox_emails, envoyée en tâche de fond (voir mailer.py)
+    init_mailer(app)
+    init_purge(app)
+
+    # Factures et relevés d'activité générés dans un pool de processus (voir reports.py)
+    init_reports(app)
+
+    return app
+
+
+# ==========================
+# Pagination des listes
+# ==========================
+PAGE_SIZE = int(os.environ.get("PAGE_SIZE", 50))
+MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", 500))
+STREAM_LISTS = env_flag("STREAM_LISTS", False)
+
+def keyset(query, column, descending=True):
+    # Pagination par curseur sur l'id : ?cursor=<dernier id affiché>&size=<taille>
+    # Query ou select() (vues asynchrones, voir asgi.py) : filter / order_by / limit existent sur les deux
+    cursor = request.args.get("cursor", type=int)
+    size = max(1, min(request.args.get("size", PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+
+    if cursor is not None:
+        query = query.filter(column < cursor if descending else column > cursor)
+
+    return query.order_by(column.desc() if descending else column).limit(size + 1), size
+
+def split_page(rows, size):
+    # Une ligne de plus que la page : il reste une page suivante
+    next_cursor = rows[size - 1].id if len(rows) > size else None
+
+    return rows[:size], next_cursor
+
+def keyset_page(query, column, descending=True):
+    query, size = keyset(query, column, descending)
+
+    return split_page(query.all(), size)
+
+def render_list(template, **context):
+    # En mode streaming, le début de la page part avant la fin du rendu du tableau
+    if STREAM_LISTS:
+        return stream_template(template, **context)
+
+    return render_template(template, **context)
+
+def deleted(endpoint, message):
+    # Suppression envoyée par script.js (fetch) : ni message ni rechargement, la ligne est
+    # retirée de la page par l'événement SSE
+    if request.headers.get("X-Live"):
+        return Response(status=204)
+
+    flash(message, "success")
+    return redirect(url_for(endpoint))
+
+
+@main.cli.command("compile-templates")
+def compile_templates_command():
+    """Compile tous les gabarits dans JINJA_CACHE_DIR (à lancer au build)."""
+    if not JINJA_CACHE_DIR:
+        raise click.ClickException("JINJA_CACHE_DIR n'est pas défini.")
+
+    names = current_app.jinja_env.list_templates(extensions=["html"])
+
+    for name in names:
+        current_app.jinja_env.get_template(name)
+
+    click.echo(f"{len(names)} gabarit(s) compilé(s) dans {JINJA_CACHE_DIR}.")
+
+
+@main.cli.command("rebuild-search")
+def rebuild_search_command():
+    """Reconstruit l'index de recherche plein texte."""
+    for shard in shard_names():
+        with get_engine(shard).begin() as connection:
+            install_search(connection)
+            rebuild_search(connection)
+
+    click.echo("Index de recherche reconstruit.")
+
+
+@main.cli.command("check-totals")
+@click.option("--repair", is_flag=True, help="Recalcule les totaux incohérents.")
+def check_totals_command(repair):
+    """Vérifie projects.total_time par rapport à la somme des tâches."""
+    total = 0
 
-# ==================
-# Config Flask-Mail
-# ==================
-app.config['MAIL_SERVER'] = 'smtp.gmail.com'
-app.config['MAIL_PORT'] = 587
-app.config['MAIL_USE_TLS'] = True
-app.config['MAIL_USE_SSL'] = False
-app.config['MAIL_USERNAME'] = os.environ.get("EMAIL_ADDRESS")
-app.config['MAIL_PASSWORD'] = os.environ.get('PASSWORD_MAIL')
-app.config['MAIL_DEFAULT_SENDER'] = os.environ.get("EMAIL_ADDRESS")
+    for shard in shard_names():
+        with get_engine(shard).begin() as connection:
+            mismatches = check_totals(connection)
+            total += len(mismatches)
 
-mail = Mail(app)
+            for project_id, stored, actual in mismatches:
+                click.echo(f"Projet {project_id} ({shard}) : {stored} h enregistrées, {actual} h réelles")
+
+            if repair and mismatches:
+                repair_totals(connection, [row[0] for row in mismatches])
+                click.echo(f"{len(mismatches)} projet(s) corrigé(s) ({shard}).")
+
+    if not total:
+        click.echo("Tous les totaux sont cohérents.")
+    elif not repair:
+        raise SystemExit(1)
+
+
+@main.cli.command("rebuild-rollups")
+def rebuild_rollups_command():
+    """Resynchronise tasks.time_spent avec les saisies puis recalcule les agrégats."""
+    reconciled = 0
+
+    for shard in shard_names():
+        with get_engine(shard).begin() as connection:
+            reconciled += reconcile_entries(connection)
+            rebuild_rollups(connection)
+
+    click.echo(f"{reconciled} tâche(s) resynchronisée(s), agrégats recalculés.")
 
 
 # ======
 # Routes
 # ======
-@app.route('/', methods=["GET", "POST"])
+BUSY_MESSAGE = "Le serveur est très sollicité, veuillez réessayer dans quelques secondes."
+
+@main.route('/', methods=["GET", "POST"])
 def index():
     # Si l'utilisateur est déjà connecté
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
 
     # Si l'utilisateur soumet le formulaire de connexion
     if request.method == "POST":
@@ -80,36 +250,47 @@ def index():
         # Vérifier que les champs sont remplis
         if not email:
             flash("L'email est obligatoire.", "error")
-            return redirect(url_for('index'))
+            return redirect(url_for('main.index'))
         if not password:
             flash("Le mot de passe est obligatoire.", "error")
-            return redirect(url_for('index'))
+            return redirect(url_for('main.index'))
         
         user = session.query(User).filter_by(email=email).first()
 
+        try:
+            valid, new_hash = verify_password(user.password, password) if user else (False, None)
+        except PasswordBusy:
+            flash(BUSY_MESSAGE, "error")
+            return redirect(url_for('main.index'))
+
         # Si l'utilisateur existe et que le mot de passe correspond
-        if user and check_password_hash(user.password, password):
+        if valid:
+            # Paramètres de hachage modifiés depuis l'inscription : on enregistre le nouveau hash
+            if new_hash:
+                user.password = new_hash
+                session.commit()
+
             login_user(user)
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
         elif not user:
             flash("Cet email est inconnu.", "error")
-            return redirect(url_for('index'))
+            return redirect(url_for('main.index'))
         else:
             flash("Mot de passe incorrect", "error")
-            return redirect(url_for('index'))
+            return redirect(url_for('main.index'))
         
     return render_template('index.html')
 
 
-@app.route('/logout')
+@main.route('/logout')
 @login_required
 def logout():
     logout_user()
 
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
 
-@app.route('/register', methods=["GET", "POST"])
+@main.route('/register', methods=["GET", "POST"])
 def register():
 
     if request.method == "POST":
@@ -122,24 +303,24 @@ def register():
         # Vérifier que tous les champs sont remplis
         if not lastname:
             flash("Le nom est obligatoire.", "error")
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
         if not firstname:
             flash("Le prénom est obligatoire.", "error")
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
         if not email:
             flash("L'email est obligatoire.", "error")
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
         if not password:
             flash("Le mot de passe est obligatoire.", "error")
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
         if not confirmation:
             flash("La confirmation est obligatoire.", "error")
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
         
         # Vérifier que le mot de passe et la confirmation correspondent
         if password != confirmation:
             flash("Le mot de passe et la confirmation ne correspondent pas.", "error")
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
 
         # Vérifier que l'email n'existe pas dans la base de données
         check_user = session.query(User).filter_by(email=email).first()
@@ -147,7 +328,11 @@ def register():
         # Si l'utilisateur n'existe pas dans la base de données
         if not check_user:
             # Crypter le mot de passe
-            hashed_password = generate_password_hash(password)
+            try:
+                hashed_password = hash_password(password)
+            except PasswordBusy:
+                flash(BUSY_MESSAGE, "error")
+                return redirect(url_for('main.register'))
 
             # Ajouter le nouvel utilisateur
             new_user = User(
@@ -158,26 +343,31 @@ def register():
             )
 
             session.add(new_user)
-            session.commit()
+            session.flush()
+
+            # Shard des données du compte (ligne d'annuaire dans la même transaction)
+            assign_shard(new_user.id)
 
-            msg = Message("Bienvenue sur HackDesk", recipients=[email])
-            msg.html = render_template("emails/welcome.html", firstname=firstname, lastname=lastname)
-            mail.send(msg)
+            # E-mail de bienvenue enregistré dans la même transaction que l'utilisateur
+            queue_email(email, "Bienvenue sur HackDesk", render_template("emails/welcome.html", firstname=firstname, lastname=lastname))
+
+            session.commit()
+            outbox_sender.wake()
 
             # Connecter l'utilisateur
             login_user(new_user)
 
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
         
         else:
             # Informer que le compte existe déjà
             flash("Un compte existe déjà avec cette adresse email. Connectez-vous!", "error")
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
 
     return render_template('register.html')
 
 
-@app.route('/reinitialisation-password', methods=["GET", "POST"])
+@main.route('/reinitialisation-password', methods=["GET", "POST"])
 def reinitialisationPassword():
     if request.method == "POST":
         lastname = request.form.get("lastname").upper()
@@ -189,24 +379,24 @@ def reinitialisationPassword():
         # Vérifier que tous les champs sont remplis
         if not lastname:
             flash("Le nom est obligatoire.", "error")
-            return redirect(url_for('reinitialisationPassword'))
+            return redirect(url_for('main.reinitialisationPassword'))
         if not firstname:
             flash("Le prénom est obligatoire.", "error")
-            return redirect(url_for('reinitialisationPassword'))
+            return redirect(url_for('main.reinitialisationPassword'))
         if not email:
             flash("L'email est obligatoire.", "error")
-            return redirect(url_for('reinitialisationPassword'))
+            return redirect(url_for('main.reinitialisationPassword'))
         if not password:
             flash("Le mot de passe est obligatoire.", "error")
-            return redirect(url_for('reinitialisationPassword'))
+            return redirect(url_for('main.reinitialisationPassword'))
         if not confirmation:
             flash("La confirmation est obligatoire.", "error")
-            return redirect(url_for('reinitialisationPassword'))
+            return redirect(url_for('main.reinitialisationPassword'))
 
         # Vérifier que le mot de passe et la confirmation correspondent
         if password != confirmation:
             flash("Le mot de passe et la confirmation ne correspondent pas.", "error")
-            return redirect(url_for('reinitialisationPassword'))
+            return redirect(url_for('main.reinitialisationPassword'))
         
         # Vérifier si toutes les informations données sont justes
         user = session.query(User).filter_by(lastname=lastname, firstname=firstname, email=email).first()
@@ -214,21 +404,26 @@ def reinitialisationPassword():
         # Si c'est juste, modifier le mot de passe
         if user:
 
-            hashed_password = generate_password_hash(password)
+            try:
+                hashed_password = hash_password(password)
+            except PasswordBusy:
+                flash(BUSY_MESSAGE, "error")
+                return redirect(url_for('main.reinitialisationPassword'))
+
             user.password = hashed_password
 
-            session.commit()
-            
             # Envoyer un email à l'utilisateur pour l'informer du changement de mot de passe
-            msg = Message("Réinitialisation de votre mot de passe", recipients=[email])
-            msg.html = render_template("emails/reinitialisation.html", firstname=firstname, lastname=lastname)
-            mail.send(msg)
+            queue_email(email, "Réinitialisation de votre mot de passe", render_template("emails/reinitialisation.html", firstname=firstname, lastname=lastname))
+
+            session.commit()
+            user_changed(user.id)
+            outbox_sender.wake()
 
             flash("Le mot de passe a bien été modifié.", "success")
 
             login_user(user)
 
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
 
     return render_template('reinitialisation-password.html')
@@ -237,18 +432,63 @@ def reinitialisationPassword():
 # ================
 # Routes Dashboard
 # ================
-@app.route('/dashboard')
+# @conditional : les pages de lecture répondent 304 si les données n'ont pas changé (voir versions.py)
+@main.route('/dashboard')
 @login_required
+@conditional
 def dashboard():
-    total_projects = session.query(Project).filter_by(user_id=current_user.id).count()
-    cours_projects = session.query(Project).filter_by(user_id=current_user.id, status="En cours").count()
-    end_projects = session.query(Project).filter_by(user_id=current_user.id, status="Terminé").count()
-    total_clients =session.query(Client).filter_by(user_id=current_user.id).count()
-    
-    return render_template('dashboard/dashboard.html', total_projects=total_projects, cours_projects=cours_projects, end_projects=end_projects, total_clients=total_clients)
+    stats = dashboard_stats(current_user.id)
+
+    return render_template('dashboard/dashboard.html', **stats)
+
+
+@main.route('/events')
+@login_required
+def events():
+    # Flux SSE de la page ouverte (voir events.py) ; ?counters=1 : compteurs du tableau de bord
+    return stream(current_user.id, dashboard_stats if request.args.get("counters") else None)
 
 
-@app.route('/profile', methods=["GET", "POST"])
+@main.route('/search')
+@login_required
+@conditional
+def searchAll():
+    terms = request.args.get("q", "").strip()
+    results = search(session, current_user.id, terms) if terms else None
+
+    return render_template('dashboard/search.html', terms=terms, results=results)
+
+
+def require_metrics_token():
+    # Routes de supervision : Authorization: Bearer <METRICS_TOKEN>, sinon 404
+    token = os.environ.get('METRICS_TOKEN')
+    scheme, _, given = request.headers.get('Authorization', '').partition(' ')
+
+    if not token or scheme.lower() != 'bearer' or not hmac.compare_digest(given.strip(), token):
+        abort(404)
+
+
+@main.route('/metrics')
+def metrics():
+    require_metrics_token()
+
+    return metrics_response()
+
+
+@main.route('/cache-stats')
+def cacheStats():
+    # Compteurs des caches mémoire de ce processus
+    require_metrics_token()
+
+    return dict(
+        pid=os.getpid(),
+        users=user_cache.stats(),
+        dashboard=dashboard_cache.stats(),
+        fragments=fragment_cache.stats()
+    )
+
+
+@main.route('/profile', methods=["GET", "POST"])
 @login_required
 def profile():
     user = session.query(User).filter_by(id=current_user.id).first()
@@ -260,109 +500,114 @@ def profile():
 
         if not lastname:
             flash("Le nom est obligatoire.", "error")
-            return redirect(url_for('profile'))
+            return redirect(url_for('main.profile'))
         if not firstname:
             flash("Le prénom est obligatoire.", "error")
-            return redirect(url_for('profile'))
+            return redirect(url_for('main.profile'))
         if not email:
             flash("L'email est obligatoire.", "error")
-            return redirect(url_for('profile'))
+            return redirect(url_for('main.profile'))
 
         user.lastname = lastname
         user.firstname = firstname
         user.email = email
 
         session.commit()
+        user_changed(user.id)
 
         flash("Les informations ont été mises à jour.", "success")
 
-        return redirect(url_for('profile'))
+        return redirect(url_for('main.profile'))
     
     return render_template('dashboard/profile.html', user=user)
 
-@app.route('/delete-account', methods=['GET', 'POST'])
+
+@main.route('/api-token', methods=['POST'])
+@login_required
+def createApiToken():
+    user = session.query(User).filter_by(id=current_user.id).first()
+    api_token = create_token(user.id)
+
+    session.commit()
+
+    # Affiché une seule fois : seul son empreinte est enregistrée
+    return render_template('dashboard/profile.html', user=user, api_token=api_token)
+
+
+@main.route('/revoke-api-tokens', methods=['POST'])
+@login_required
+def revokeApiTokens():
+    session.query(ApiToken).filter_by(user_id=current_user.id).delete()
+    session.commit()
+
+    flash("Les jetons d'API ont été révoqués.", "success")
+    return redirect(url_for('main.profile'))
+
+@main.route('/delete-account', methods=['GET', 'POST'])
 @login_required
 def deleteAccount():
     if request.method == "POST":
         user = session.query(User).filter_by(id=current_user.id).first()
 
         if user:
-            session.delete(user)
+            # Gros compte : fermé tout de suite, vidé par lots en tâche de fond (voir purge.py)
+            job = delete_account(user)
             session.commit()
+            user_data_changed(user.id)
+            user_changed(user.id)
+
+            if job is not None:
+                purger.wake()
 
             flash("Compte supprimé avec succès.", "success")
 
         else:
             flash("Une erreur s'est produite. Veuillez réessayer s'il-vous-plaît.", "error")
 
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
 
-@app.route('/projects')
+@main.route('/projects')
 @login_required
+@conditional
 def projects():
-    projects = session.query(Project).filter_by(user_id=current_user.id).all()
+    # Temps total dénormalisé : aucune agrégation sur les tâches
+    projects, next_cursor = keyset_page(
+        session.query(Project).filter_by(user_id=current_user.id),
+        Project.id
+    )
 
-    return render_template('dashboard/projects.html', projects=projects)
+    return render_list('dashboard/projects.html', projects=projects, next_cursor=next_cursor)
 
 
-@app.route('/add-a-project', methods=["GET", "POST"])
+@main.route('/add-a-project', methods=["GET", "POST"])
 @login_required
 def addAProject():
     clients = session.query(Client).filter_by(user_id=current_user.id).all()
 
     if request.method == "POST":
-        name_project = request.form.get("name_project")
-        description = request.form.get("description")
-        url = request.form.get("url")
-        hosting_server = request.form.get("hosting_server")
-        status = request.form.get("status")
-        hourly_rate = request.form.get("hourly_rate")
-        client = request.form.get("client")
+        # Vérifier que tous les champs sont remplis (règles dans forms.py)
+        project, error = clean_project(request.form)
 
-        client = int(client)
+        if error:
+            flash(error, "error")
+            return redirect(url_for('main.addAProject'))
 
-        # Vérifier que tous les champs sont remplis
-        if not name_project:
-            flash("Le nom est obligatoire.", "error")
-            return redirect(url_for('addAProject'))
-        if not description:
-            flash("La description est obligatoire.", "error")
-            return redirect(url_for('addAProject'))
-        if not url:
-            url = "Aucune"
-        if not hosting_server:
-            hosting_server = "Aucun"
-        if not status:
-            flash("Le statut est obligatoire.", "error")
-            return redirect(url_for('addAProject'))
-        if not hourly_rate:
-            hourly_rate = 0
-        if not client:
-            flash("Le client est obligatoire.", "error")
-            return redirect(url_for('addAProject'))
-        
-        newProject = Project(
-            name_project=name_project,
-            description=description,
-            url=url,
-            hosting_server=hosting_server,
-            status=status,
-            hourly_rate=hourly_rate,
-            client_id=client,
-            user_id=current_user.id
-        )
+        newProject = Project(**project, user_id=current_user.id)
 
         session.add(newProject)
         session.commit()
+        publish_rows(current_user.id, newProject)
+        user_data_changed(current_user.id)
         
-        return redirect(url_for('projects'))
+        return redirect(url_for('main.projects'))
 
     return render_template('dashboard/add-a-project.html', clients=clients)
 
 
-@app.route('/view-project/<int:project_id>', methods=["GET", "POST"])
+@main.route('/view-project/<int:project_id>', methods=["GET", "POST"])
 @login_required
+@conditional
 def viewProject(project_id):
     project = session.query(Project).filter_by(id=project_id).first()
     tasks = (
@@ -374,7 +619,7 @@ def viewProject(project_id):
     return render_template('dashboard/view-project.html', project=project, tasks=tasks)
 
 
-@app.route('/edit-project/<int:project_id>', methods=["GET", "POST"])
+@main.route('/edit-project/<int:project_id>', methods=["GET", "POST"])
 @login_required
 def editProject(project_id):
     project = session.query(Project).filter_by(id=project_id).first()
@@ -390,22 +635,22 @@ def editProject(project_id):
         # Vérifier que tous les champs sont remplis
         if not name_project:
             flash("Le nom est obligatoire.", "error")
-            return redirect(url_for('editProject', project_id=project_id))
+            return redirect(url_for('main.editProject', project_id=project_id))
         if not description:
             flash("La description est obligatoire.", "error")
-            return redirect(url_for('editProject', project_id=project_id))
+            return redirect(url_for('main.editProject', project_id=project_id))
         if not url:
             flash("L'URL est obligatoire.", "error")
-            return redirect(url_for('editProject', project_id=project_id))
+            return redirect(url_for('main.editProject', project_id=project_id))
         if not hosting_server:
             flash("Le serveur d'hébergement est obligatoire.", "error")
-            return redirect(url_for('editProject', project_id=project_id))
+            return redirect(url_for('main.editProject', project_id=project_id))
         if not status:
             flash("Le statut est obligatoire.", "error")
-            return redirect(url_for('editProject', project_id=project_id))
+            return redirect(url_for('main.editProject', project_id=project_id))
         if not hourly_rate:
             flash("Le tarif horaire est obligatoire.", "error")
-            return redirect(url_for('editProject', project_id=project_id))
+            return redirect(url_for('main.editProject', project_id=project_id))
 
         
         # Mettre à jour les informations
@@ -417,87 +662,89 @@ def editProject(project_id):
         project.hourly_rate=hourly_rate
 
         session.commit()
+        evict("projects", project_id)
+        publish_rows(current_user.id, project)
+        user_data_changed(current_user.id)
         
         flash("Les modifications ont bien été sauvegardées.", "success")
-        return redirect(url_for('editProject', project_id=project_id))
+        return redirect(url_for('main.editProject', project_id=project_id))
     
     return render_template('dashboard/edit-project.html', project=project)
 
 
-@app.route('/delete-project/<int:project_id>', methods=['GET', 'POST'])
+@main.route('/delete-project/<int:project_id>', methods=['GET', 'POST'])
 @login_required
 def deleteProject(project_id):
     if request.method == "POST":
         project = session.query(Project).filter_by(id=project_id).first()
 
         if project:
+            # Tâches supprimées en cascade : évincées du cache et retirées des pages ouvertes
+            tasks = [row.id for row in session.query(Task.id).filter_by(project_id=project_id)]
+
             session.delete(project)
             session.commit()
+            evict("projects", project_id)
+            evict("tasks", *tasks)
+            publish_deleted(current_user.id, f"projects-{project_id}", *[f"tasks-{id}" for id in tasks])
+            user_data_changed(current_user.id)
 
-            flash("Projet supprimé avec succès.", "success")
+            return deleted('main.projects', "Projet supprimé avec succès.")
 
         else:
             flash("Une erreur s'est produite. Veuillez réessayer s'il-vous-plaît.", "error")
 
-        return redirect(url_for('projects'))
+        return redirect(url_for('main.projects'))
 
 
-@app.route('/tasks')
+@main.route('/tasks')
 @login_required
+@conditional
 def tasks():
-    tasks = (
+    tasks, next_cursor = keyset_page(
         session.query(Task)
         .join(Project)
-        .filter(Project.user_id == current_user.id)
-        .all()
+        .filter(Project.user_id == current_user.id),
+        Task.id,
+        descending=False
     )
 
-    return render_template('dashboard/tasks.html', tasks=tasks)
+    return render_list('dashboard/tasks.html', tasks=tasks, next_cursor=next_cursor)
 
 
-@app.route('/add-a-task', methods=["GET", "POST"])
+@main.route('/add-a-task', methods=["GET", "POST"])
 @login_required
 def addATask():
     projects = session.query(Project).filter_by(user_id=current_user.id).all()
 
     if request.method == "POST":
-        name_task = request.form.get("name_task")
-        status = request.form.get("status")
-        time_spent = request.form.get("time_spent")
-        project = request.form.get("project")
+        # Vérifier que tous les champs sont remplis (règles dans forms.py)
+        task, error = clean_task(request.form)
 
-        project = int(project)
+        if error:
+            flash(error, "error")
+            return redirect(url_for('main.addAProject'))
 
-        # Vérifier que tous les champs sont remplis
-        if not name_task:
-            flash("Le nom est obligatoire.", "error")
-            return redirect(url_for('addAProject'))
-        if not status:
-            flash("Le statut est obligatoire.", "error")
-            return redirect(url_for('addAProject'))
-        if not time_spent:
-            time_spent = 0
-
-        if not project or project == 0:
-            flash("Le projet est obligatoire.", "error")
-            return redirect(url_for('addAProject'))
-
-        newTask = Task(
-            name_task=name_task,
-            status=status,
-            time_spent=time_spent,
-            project_id=project
-        )
+        # Le temps passé est enregistré comme une saisie (voir rollups.py)
+        hours = task.pop("time_spent")
+        newTask = Task(**task)
 
         session.add(newTask)
+        session.flush()
+        log_time(session, [(newTask.id, hours, None)])
         session.commit()
+        evict("projects", newTask.project_id)
+        # Temps total du projet recalculé par trigger : sa ligne change aussi
+        if subscribed(current_user.id):
+            publish_rows(current_user.id, newTask, newTask.projects)
+        user_data_changed(current_user.id)
         
-        return redirect(url_for('tasks'))
+        return redirect(url_for('main.tasks'))
 
     return render_template('dashboard/add-a-task.html', projects=projects)
 
 
-@app.route('/edit-task/<int:task_id>', methods=["GET", "POST"])
+@main.route('/edit-task/<int:task_id>', methods=["GET", "POST"])
 @login_required
 def editTask(task_id):
     task = session.query(Task).filter_by(id=task_id).first()
@@ -510,120 +757,103 @@ def editTask(task_id):
         # Vérifier que tous les champs sont remplis
         if not name_task:
             flash("Le nom est obligatoire.", "error")
-            return redirect(url_for('editTask', task_id=task_id))
+            return redirect(url_for('main.editTask', task_id=task_id))
         if not status:
             flash("Le statut est obligatoire.", "error")
-            return redirect(url_for('editTask', task_id=task_id))
+            return redirect(url_for('main.editTask', task_id=task_id))
         if not time_spent:
             flash("Le temps passé est obligatoire.", "error")
-            return redirect(url_for('editTask', task_id=task_id))
+            return redirect(url_for('main.editTask', task_id=task_id))
+        if to_number(time_spent) is None:
+            flash("Le temps passé doit être un nombre.", "error")
+            return redirect(url_for('main.editTask', task_id=task_id))
 
         # Mettre à jour les informations
         task.name_task=name_task
         task.status=status
-        task.time_spent=time_spent
+
+        # L'écart de temps devient une saisie de correction
+        log_time(session, [(task.id, to_number(time_spent) - task.time_spent, None)])
 
         session.commit()
+        evict("tasks", task_id)
+        evict("projects", task.project_id)
+        if subscribed(current_user.id):
+            publish_rows(current_user.id, task, task.projects)
+        user_data_changed(current_user.id)
         
         flash("Les modifications ont bien été sauvegardées.", "success")
-        return redirect(url_for('tasks'))
+        return redirect(url_for('main.tasks'))
     
     return render_template('dashboard/edit-task.html', task=task)
 
 
-@app.route('/delete-task/<int:task_id>', methods=['GET', 'POST'])
+@main.route('/delete-task/<int:task_id>', methods=['GET', 'POST'])
 @login_required
 def deleteTask(task_id):
     if request.method == "POST":
         task = session.query(Task).filter_by(id=task_id).first()
 
         if task:
+            project_id = task.project_id
+
             session.delete(task)
             session.commit()
+            evict("tasks", task_id)
+            evict("projects", project_id)
+            publish_deleted(current_user.id, f"tasks-{task_id}")
+            # Temps total du projet recalculé par trigger
+            if subscribed(current_user.id):
+                publish_rows(current_user.id, session.get(Project, project_id))
+            user_data_changed(current_user.id)
 
-            flash("Tâche supprimée avec succès.", "success")
+            return deleted('main.tasks', "Tâche supprimée avec succès.")
 
         else:
             flash("Une erreur s'est produite. Veuillez réessayer s'il-vous-plaît.", "error")
 
-        return redirect(url_for('tasks'))
+        return redirect(url_for('main.tasks'))
 
 
-@app.route('/clients')
+@main.route('/clients')
 @login_required
+@conditional
 def clients():
-    clients = session.query(Client).filter_by(user_id=current_user.id).all()
+    clients, next_cursor = keyset_page(
+        session.query(Client).filter_by(user_id=current_user.id),
+        Client.id
+    )
 
-    return render_template('dashboard/clients.html', clients=clients)
+    return render_list('dashboard/clients.html', clients=clients, next_cursor=next_cursor)
 
 
-@app.route('/add-a-client', methods=["GET", "POST"])
+@main.route('/add-a-client', methods=["GET", "POST"])
 @login_required
 def addAClient():
     if request.method == "POST":
-        lastname = request.form.get("lastname").upper()
-        firstname = request.form.get("firstname").capitalize()
-        enterprise = request.form.get("enterprise")
-        address = request.form.get("address")
-        zip_code = request.form.get("zip_code")
-        city = request.form.get("city").capitalize()
-        country = request.form.get("country").capitalize()
-        phone_number = request.form.get("phone_number")
-        email = request.form.get("email").lower()
-        note = request.form.get("note")
+        # Vérifier que tous les champs sont remplis (règles dans forms.py)
+        client, error = clean_client(request.form)
+
+        if error:
+            flash(error, "error")
+            return redirect(url_for('main.addAClient'))
 
-        # Vérifier que tous les champs sont remplis
-        if not lastname:
-            flash("Le nom est obligatoire.", "error")
-            return redirect(url_for('addAClient'))
-        if not firstname:
-            flash("Le prénom est obligatoire.", "error")
-            return redirect(url_for('addAClient'))
-        if not enterprise:
-            enterprise = ""
-        if not address:
-            address = ""
-        if not zip_code:
-            zip_code = ""
-        if not city:
-            city = ""
-        if not country:
-            country = ""
-        if not phone_number :
-            flash("Le numéro de téléphone est obligatoire.", "error")
-            return redirect(url_for('addAClient'))
-        if not email :
-            flash("L'email est obligatoire.", "error")
-            return redirect(url_for('addAClient'))
-        if not note :
-            note = ""
-        
         # Ajouter le client
-        newClient = Client(
-            lastname=lastname,
-            firstname=firstname,
-            enterprise=enterprise,
-            address=address,
-            zip_code=zip_code,
-            city=city,
-            country=country,
-            phone_number=phone_number,
-            email=email,
-            note=note,
-            user_id=current_user.id
-            
-        )
+        newClient = Client(**client, user_id=current_user.id)
 
         session.add(newClient)
         session.commit()
+        publish_rows(current_user.id, newClient)
+        user_data_changed(current_user.id)
         
-        return redirect(url_for('clients'))
+        return redirect(url_for('main.clients'))
 
     return render_template('dashboard/add-a-client.html')
 
 
-@app.route('/view-client/<int:client_id>', methods=["GET", "POST"])
+@main.route('/view-client/<int:client_id>', methods=["GET", "POST"])
 @login_required
+@conditional
 def viewClient(client_id):
     client = session.query(Client).filter_by(id=client_id).first()
     projects = session.query(Project).filter_by(client_id=client_id).all()
@@ -631,88 +861,155 @@ def viewClient(client_id):
     return render_template('dashboard/view-client.html', client=client, projects=projects)
 
 
-@app.route('/edit-client/<int:client_id>', methods=["GET", "POST"])
+@main.route('/edit-client/<int:client_id>', methods=["GET", "POST"])
 @login_required
 def editClient(client_id):
     client = session.query(Client).filter_by(id=client_id).first()
 
     if request.method == "POST":
-        lastname = request.form.get("lastname").upper()
-        firstname=request.form.get("firstname").capitalize()
-        enterprise=request.form.get("enterprise")
-        address=request.form.get("address")
-        zip_code=request.form.get("zip_code")
-        city=request.form.get("city").capitalize()
-        country=request.form.get("country").capitalize()
-        phone_number=request.form.get("phone_number")
-        email=request.form.get("email").lower()
-        note=request.form.get("note")
+        # Vérifier que tous les champs sont remplis (règles dans forms.py)
+        values, error = clean_client(request.form)
 
-        # Vérifier que tous les champs sont remplis
-        if not lastname:
-            flash("Le nom est obligatoire.", "error")
-            return redirect(url_for('addAClient'))
-        if not firstname:
-            flash("Le prénom est obligatoire.", "error")
-            return redirect(url_for('addAClient'))
-        if not enterprise:
-            enterprise = ""
-        if not address:
-            address = ""
-        if not zip_code:
-            zip_code = ""
-        if not city:
-            city = ""
-        if not country:
-            country = ""
-        if not phone_number :
-            flash("Le numéro de téléphone est obligatoire.", "error")
-            return redirect(url_for('addAClient'))
-        if not email :
-            flash("L'email est obligatoire.", "error")
-            return redirect(url_for('addAClient'))
-        if not note :
-            note = ""
+        if error:
+            flash(error, "error")
+            return redirect(url_for('main.addAClient'))
 
         # Mettre à jour les informations
-        client.lastname=lastname
-        client.firstname=firstname
-        client.enterprise=enterprise
-        client.address=address
-        client.zip_code=zip_code
-        client.city=city
-        client.country=country
-        client.phone_number=phone_number
-        client.email=email
-        client.note=note
+        for name, value in values.items():
+            setattr(client, name, value)
 
         session.commit()
+        evict("clients", client_id)
+        publish_rows(current_user.id, client)
+        user_data_changed(current_user.id)
         
         flash("Les modifications ont bien été sauvegardées.", "success")
-        return redirect(url_for('clients'))
+        return redirect(url_for('main.clients'))
     
     return render_template('dashboard/edit-client.html', client=client)
 
 
-@app.route('/delete-client/<int:client_id>', methods=['GET', 'POST'])
+@main.route('/delete-client/<int:client_id>', methods=['GET', 'POST'])
 @login_required
 def deleteClient(client_id):
     if request.method == "POST":
         client = session.query(Client).filter_by(id=client_id).first()
 
         if client:
+            # Projets et tâches supprimés en cascade : évincés du cache et retirés des pages ouvertes
+            projects = [row.id for row in session.query(Project.id).filter_by(client_id=client_id)]
+            tasks = [row.id for row in session.query(Task.id).join(Project).filter(Project.client_id == client_id)]
+
             session.delete(client)
             session.commit()
+            evict("clients", client_id)
+            evict("projects", *projects)
+            evict("tasks", *tasks)
+            publish_deleted(
+                current_user.id, f"clients-{client_id}",
+                *[f"projects-{id}" for id in projects], *[f"tasks-{id}" for id in tasks]
+            )
+            user_data_changed(current_user.id)
 
-            flash("Client supprimé avec succès.", "success")
+            return deleted('main.clients', "Client supprimé avec succès.")
 
         else:
             flash("Une erreur s'est produite. Veuillez réessayer s'il-vous-plaît.", "error")
 
-        return redirect(url_for('clients'))
+        return redirect(url_for('main.clients'))
+
+
+# ===================
+# Import / Export CSV
+# ===================
+@main.route('/import-export')
+@login_required
+def importExport():
+    return render_template('dashboard/import-export.html', columns=CSV_COLUMNS)
+
+
+@main.route('/import/<kind>', methods=['POST'])
+@login_required
+def importCsv(kind):
+    if kind not in CSV_COLUMNS:
+        abort(404)
+
+    file = request.files.get("file")
+
+    if not file or not file.filename:
+        flash("Le fichier CSV est obligatoire.", "error")
+        return redirect(url_for('main.importExport'))
+
+    inserted, errors = import_csv(session, current_user.id, kind, file.stream)
+
+    if errors:
+        flash(f"Import annulé : {len(errors)} ligne(s) invalide(s).", "error")
+        return render_template('dashboard/import-export.html', columns=CSV_COLUMNS, kind=kind, errors=errors)
+
+    user_data_changed(current_user.id)
+
+    flash(f"{inserted} ligne(s) importée(s).", "success")
+    return redirect(url_for('main.importExport'))
+
+
+@main.route('/export/<kind>.csv')
+@login_required
+def exportCsv(kind):
+    if kind not in CSV_COLUMNS:
+        abort(404)
+
+    return Response(
+        stream_with_context(export_csv(session, current_user.id, kind)),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename=hackdesk-{kind}.csv"}
+    )
+
+# ========
+# Rapports
+# ========
+@main.route('/reports')
+@login_required
+def reports():
+    period = request.args.get("period") or previous_month()
+
+    try:
+        month_bounds(period)
+    except ValueError:
+        abort(404)
+
+    return render_template('dashboard/reports.html', period=period, invoices=invoices(session, current_user.id, period))
+
+
+@main.route('/reports/<period>/activity.<fmt>', defaults={"client_id": None})
+@main.route('/reports/<period>/invoice-<int:client_id>.<fmt>')
+@login_required
+def downloadReport(period, fmt, client_id):
+    try:
+        path = report_file(session, current_user.id, period, fmt, client_id)
+    except ReportBusy:
+        flash(BUSY_MESSAGE, "error")
+        return redirect(url_for('main.reports', period=period))
+
+    if path is None:
+        abort(404)
+
+    kind = "activite" if client_id is None else f"facture-{client_id}"
+
+    # Le nom du fichier est sa clé de contenu : ETag stable, 304 et Range gérés par send_file
+    return send_file(
+        path,
+        mimetype=FORMATS[fmt],
+        as_attachment=fmt == "csv",
+        download_name=f"hackdesk-{kind}-{period}.{fmt}",
+        etag=os.path.splitext(os.path.basename(path))[0],
+        conditional=True
+    )
 
 # ===
 # Run
 # ===
+# gunicorn app:app, flask --app app ... : une application par processus
+app = create_app()
+
 if __name__ == '__main__':
-    app.run()
\ No newline at end of file
+    app.run()
@@ -0,0 +1,209 @@
+from a2wsgi import WSGIMiddleware
+from a2wsgi.wsgi import build_environ
+from flask import current_app, render_template, session as flask_session
+from flask_login import current_user
+from functools import wraps
+from sqlalchemy import select
+from werkzeug.exceptions import HTTPException
+
+from app import create_app, keyset, render_list, split_page
+from database import async_session, dispose_async_engine
+from models import Client, Project, Task
+from passwords import hash_pool
+from reports import report_pool
+from shards import async_use_shard
+from stats import async_dashboard_stats
+from users import warm_cached_user
+from versions import async_conditional
+
+import io
+import os
+
+
+# ==========================
+# Mode asynchrone (ASGI)
+# ==========================
+# uvicorn asgi:application --workers 2
+# Les pages de lecture (tableau de bord, listes, fiches) sont servies par des vues async def
+# sur SQLAlchemy asyncio : pendant qu'une requête attend la base, le worker en sert d'autres.
+# Tout le reste (formulaires, API, exports...) passe par l'application Flask synchrone,
+# exécutée dans un pool de threads (a2wsgi). Les routes, gabarits, sessions, messages flash,
+# ETag et hooks before/after_request sont ceux de l'application Flask.
+SYNC_THREADS = int(os.environ.get("ASGI_SYNC_THREADS", 10))
+# Flux SSE simultanés (voir events.py) : servis par ces threads
+os.environ.setdefault("WORKER_THREADS", str(SYNC_THREADS))
+
+
+def async_login_required(view):
+    # login_required de Flask-Login ne sait pas attendre une coroutine
+    @wraps(view)
+    async def wrapper(db, *args, **kwargs):
+        if not current_user.is_authenticated:
+            return current_app.login_manager.unauthorized()
+
+        return await view(db, *args, **kwargs)
+
+    return wrapper
+
+
+# ==========================
+# Vues asynchrones
+# ==========================
+# Mêmes requêtes que les vues de app.py, sur la session AsyncSession de la requête
+@async_login_required
+@async_conditional
+async def dashboard(db):
+    stats = await async_dashboard_stats(db, current_user.id)
+
+    return render_template('dashboard/dashboard.html', **stats)
+
+
+@async_login_required
+@async_conditional
+async def projects(db):
+    query, size = keyset(select(Project).where(Project.user_id == current_user.id), Project.id)
+    projects, next_cursor = split_page((await db.scalars(query)).all(), size)
+
+    return render_list('dashboard/projects.html', projects=projects, next_cursor=next_cursor)
+
+
+@async_login_required
+@async_conditional
+async def tasks(db):
+    query, size = keyset(
+        select(Task).join(Project).where(Project.user_id == current_user.id),
+        Task.id,
+        descending=False
+    )
+    tasks, next_cursor = split_page((await db.scalars(query)).all(), size)
+
+    return render_list('dashboard/tasks.html', tasks=tasks, next_cursor=next_cursor)
+
+
+@async_login_required
+@async_conditional
+async def clients(db):
+    query, size = keyset(select(Client).where(Client.user_id == current_user.id), Client.id)
+    clients, next_cursor = split_page((await db.scalars(query)).all(), size)
+
+    return render_list('dashboard/clients.html', clients=clients, next_cursor=next_cursor)
+
+
+@async_login_required
+@async_conditional
+async def viewProject(db, project_id):
+    project = await db.scalar(select(Project).where(Project.id == project_id))
+    tasks = (await db.scalars(select(Task).join(Project).where(Project.id == project_id))).all()
+
+    return render_template('dashboard/view-project.html', project=project, tasks=tasks)
+
+
+@async_login_required
+@async_conditional
+async def viewClient(db, client_id):
+    client = await db.scalar(select(Client).where(Client.id == client_id))
+    projects = (await db.scalars(select(Project).where(Project.client_id == client_id))).all()
+
+    return render_template('dashboard/view-client.html', client=client, projects=projects)
+
+
+# Endpoint Flask -> vue asynchrone ; les autres endpoints restent synchrones
+ASYNC_VIEWS = {
+    "main.dashboard": dashboard,
+    "main.projects": projects,
+    "main.tasks": tasks,
+    "main.clients": clients,
+    "main.viewProject": viewProject,
+    "main.viewClient": viewClient,
+}
+
+
+# ==========================
+# Application ASGI
+# ==========================
+class AsyncApplication:
+    def __init__(self, app):
+        self.app = app
+        self.wsgi = WSGIMiddleware(app, workers=SYNC_THREADS)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+
+        if scope["type"] == "http" and scope["method"] in ("GET", "HEAD"):
+            environ = build_environ(scope, io.BytesIO())
+            view, args = self.match(environ)
+
+            if view is not None:
+                return await self.handle(environ, view, args, send)
+
+        await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                # Processus de hachage et de rendu des rapports, connexions : fermés avec le worker
+                hash_pool.shutdown()
+                report_pool.shutdown()
+                await dispose_async_engine()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def match(self, environ):
+        # Routage de l'application Flask : mêmes URL, mêmes convertisseurs (<int:...>)
+        try:
+            endpoint, args = self.app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return None, None
+
+        return ASYNC_VIEWS.get(endpoint), args
+
+    async def dispatch(self, view, args):
+        # Équivalent de Flask.full_dispatch_request, la vue étant attendue
+        app = self.app
+
+        try:
+            response = app.preprocess_request()
+
+            if response is None:
+                async with async_session() as db:
+                    user_id = flask_session.get("_user_id")
+                    if user_id is not None:
+                        await warm_cached_user(db, int(user_id))
+                        await async_use_shard(db, int(user_id))
+
+                    response = await view(db, **args)
+        except Exception as ex:
+            response = app.handle_user_exception(ex)
+
+        return app.finalize_request(response)
+
+    async def handle(self, environ, view, args, send):
+        # Contexte de requête Flask : request, g, session, current_user, url_for dans la vue et les gabarits
+        with self.app.request_context(environ):
+            try:
+                response = await self.dispatch(view, args)
+            except Exception as ex:
+                response = self.app.handle_exception(ex)
+
+            await send({
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in response.headers.items()],
+            })
+
+            # Corps rendu dans le contexte (réponses en streaming comprises) ; rien pour HEAD et 304
+            try:
+                for chunk in response.get_app_iter(environ):
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            finally:
+                response.close()
+
+            await send({"type": "http.response.body", "body": b""})
+
+
+application = AsyncApplication(create_app())
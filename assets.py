@@ -0,0 +1,208 @@
+from flask import request, send_from_directory
+from markupsafe import Markup
+
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+
+# Dépendances de build facultatives (requirements-build.txt)
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+# =================================
+# Pipeline des fichiers statiques
+# =================================
+# `python assets.py` copie static/ dans static/dist/ avec une empreinte du contenu dans le nom,
+# précompresse les fichiers texte (.gz, .br) et génère des variantes WebP redimensionnées des images.
+# manifest.json associe chaque chemin d'origine à sa version empreinte : url_for('static', ...)
+# le lit, et les fichiers de dist/ sont servis avec un cache « immutable » d'un an.
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+DIST = "dist"
+MANIFEST = "manifest.json"
+
+IGNORED = (".DS_Store", ".scss", ".map")
+IGNORED_DIRS = ("dist", "images/images inutilsees")
+COMPRESSIBLE = (".css", ".js", ".svg", ".ttf", ".ico", ".json")
+RESIZABLE = (".png", ".jpg", ".jpeg", ".webp")
+IMAGE_WIDTHS = [int(width) for width in os.environ.get("ASSET_IMAGE_WIDTHS", "200,400,800,1600").split(",")]
+IMMUTABLE = 365 * 24 * 3600
+
+CSS_URL = re.compile(r"url\((['\"]?)([^'\")]+)\1\)")
+SOURCE_MAP = re.compile(r"/\*# sourceMappingURL=.*?\*/")
+
+
+# =======
+# Build
+# =======
+def fingerprint(path, content):
+    stem, ext = posixpath.splitext(path)
+    return f"{stem}.{hashlib.sha256(content).hexdigest()[:10]}{ext}"
+
+
+def write(dist, path, content):
+    target = os.path.join(dist, path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+
+    with open(target, "wb") as file:
+        file.write(content)
+
+    # Versions précompressées, gardées seulement si elles sont plus petites
+    if path.endswith(COMPRESSIBLE):
+        compressed = [(".gz", gzip.compress(content, 9, mtime=0))]
+        if brotli:
+            compressed.append((".br", brotli.compress(content, quality=11)))
+
+        for suffix, data in compressed:
+            if len(data) < len(content):
+                with open(target + suffix, "wb") as file:
+                    file.write(data)
+
+
+def sources(static_dir):
+    for root, dirs, files in os.walk(static_dir):
+        relative_root = os.path.relpath(root, static_dir).replace(os.sep, "/")
+        relative_root = "" if relative_root == "." else relative_root
+        dirs[:] = [name for name in dirs if posixpath.join(relative_root, name) not in IGNORED_DIRS]
+
+        for name in sorted(files):
+            if not name.endswith(IGNORED):
+                yield posixpath.join(relative_root, name)
+
+
+def rewrite_css(path, css, manifest):
+    # Les url(...) relatives pointent vers les fichiers empreintes (même arborescence dans dist/)
+    directory = posixpath.dirname(path)
+
+    def replace(match):
+        url = match.group(2)
+        if url.startswith(("data:", "http:", "https:", "/", "#")):
+            return match.group(0)
+
+        target = posixpath.normpath(posixpath.join(directory, url))
+        if target not in manifest:
+            return match.group(0)
+
+        return f"url({posixpath.relpath(manifest[target]['file'], directory)})"
+
+    return SOURCE_MAP.sub("", CSS_URL.sub(replace, css))
+
+
+def resize(dist, path, content):
+    # Variantes WebP pour srcset : une par largeur inférieure à l'original, plus l'original
+    variants = {}
+
+    with Image.open(io.BytesIO(content)) as image:
+        widths = [width for width in IMAGE_WIDTHS if width < image.width] + [image.width]
+
+        for width in widths:
+            height = round(image.height * width / image.width)
+            buffer = io.BytesIO()
+            image.resize((width, height), Image.LANCZOS).save(buffer, "WEBP", quality=80, method=6)
+
+            variant = fingerprint(f"{posixpath.splitext(path)[0]}-{width}w.webp", buffer.getvalue())
+            write(dist, variant, buffer.getvalue())
+            variants[width] = variant
+
+    return variants
+
+
+def build(static_dir=STATIC_DIR):
+    dist = os.path.join(static_dir, DIST)
+    shutil.rmtree(dist, ignore_errors=True)
+
+    manifest = {}
+    paths = list(sources(static_dir))
+
+    # Les CSS en dernier : leurs url(...) référencent les autres fichiers
+    for path in sorted(paths, key=lambda path: path.endswith(".css")):
+        with open(os.path.join(static_dir, path), "rb") as file:
+            content = file.read()
+
+        if path.endswith(".css"):
+            content = rewrite_css(path, content.decode("utf-8"), manifest).encode("utf-8")
+
+        entry = {"file": fingerprint(path, content)}
+        write(dist, entry["file"], content)
+
+        if Image and path.endswith(RESIZABLE):
+            entry["variants"] = resize(dist, path, content)
+
+        manifest[path] = entry
+
+    with open(os.path.join(dist, MANIFEST), "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+
+    return manifest
+
+
+# ==========================
+# Utilisation dans Flask
+# ==========================
+def load_manifest(static_dir):
+    try:
+        with open(os.path.join(static_dir, DIST, MANIFEST)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        # Pas de build (développement) : les fichiers d'origine sont servis tels quels
+        return {}
+
+
+def init_assets(app):
+    manifest = load_manifest(app.static_folder)
+
+    @app.url_defaults
+    def fingerprinted_static(endpoint, values):
+        if endpoint == "static" and values.get("filename") in manifest:
+            values["filename"] = f"{DIST}/{manifest[values['filename']]['file']}"
+
+    def srcset(filename):
+        variants = manifest.get(filename, {}).get("variants", {})
+        return Markup(", ".join(
+            f"{app.static_url_path}/{DIST}/{variants[width]} {width}w" for width in sorted(variants, key=int)
+        ))
+
+    app.jinja_env.globals["srcset"] = srcset
+
+    def static(filename):
+        if not filename.startswith(DIST + "/"):
+            return app.send_static_file(filename)
+
+        # Nom empreinte : le contenu ne change jamais, la version précompressée est servie si acceptée
+        mimetype = mimetypes.guess_type(filename)[0]
+        encodings = [("br", ".br"), ("gzip", ".gz")]
+        response = None
+
+        for encoding, suffix in encodings:
+            if encoding in request.accept_encodings and os.path.isfile(os.path.join(app.static_folder, filename + suffix)):
+                response = send_from_directory(app.static_folder, filename + suffix, mimetype=mimetype, max_age=IMMUTABLE)
+                response.headers["Content-Encoding"] = encoding
+                break
+
+        if response is None:
+            response = send_from_directory(app.static_folder, filename, max_age=IMMUTABLE)
+
+        response.headers["Cache-Control"] = f"public, max-age={IMMUTABLE}, immutable"
+        response.vary.add("Accept-Encoding")
+
+        return response
+
+    app.view_functions["static"] = static
+
+
+if __name__ == "__main__":
+    manifest = build()
+    print(f"{len(manifest)} fichier(s) dans static/{DIST}/")
@@ -0,0 +1,175 @@
+from datetime import date, timedelta
+from run import ROUTES, user_contexts
+
+import click
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, ROOT)
+
+# Mois précédent : couvert par les saisies du jeu de données (seed.py)
+MONTH = (date.today().replace(day=1) - timedelta(days=1)).strftime("%Y-%m")
+
+# Routes absentes du bench (API JSON, exports, rapports) : (nom, méthode, chemin, corps JSON)
+EXTRA_ROUTES = [
+    ("api_clients", "GET", lambda ctx: "/api/clients", None),
+    ("api_clients_page2", "GET", lambda ctx: f"/api/clients?cursor={ctx['client']}", None),
+    ("api_projects", "GET", lambda ctx: "/api/projects", None),
+    ("api_project", "GET", lambda ctx: f"/api/projects/{ctx['project']}", None),
+    ("api_tasks", "GET", lambda ctx: "/api/tasks", None),
+    ("api_tasks_project", "GET", lambda ctx: f"/api/tasks?project={ctx['project']}", None),
+    ("api_hours_project", "GET", lambda ctx: "/api/reports/hours?period=day&group=project", None),
+    ("api_hours_client", "GET", lambda ctx: "/api/reports/hours?period=week&group=client", None),
+    ("api_time_entries", "POST", lambda ctx: "/api/time-entries", lambda ctx: {
+        "entries": [{"task": ctx["task"], "duration": 0.5}]}),
+    ("api_tasks_patch", "PATCH", lambda ctx: "/api/tasks/batch", lambda ctx: {
+        "tasks": [{"id": ctx["task"], "status": "En cours"}]}),
+    ("export_clients", "GET", lambda ctx: "/export/clients.csv", None),
+    ("export_projects", "GET", lambda ctx: "/export/projects.csv", None),
+    ("reports", "GET", lambda ctx: f"/reports?period={MONTH}", None),
+    ("report_activity", "GET", lambda ctx: f"/reports/{MONTH}/activity.csv", None),
+    ("report_invoice", "GET", lambda ctx: f"/reports/{MONTH}/invoice-{ctx['client']}.csv", None),
+]
+
+STATEMENT = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", re.IGNORECASE)
+SCAN = re.compile(r"^SCAN (\w+)")
+
+
+# =====================================
+# Audit des plans d'exécution (SQLite)
+# =====================================
+# Rejoue les routes du bench (et celles de l'API) sur une copie de la base, note chaque
+# requête SQL émise puis passe EXPLAIN QUERY PLAN dessus, avec ses vrais paramètres.
+# Un parcours complet d'une table (SCAN <table>, avec ou sans index) est un échec :
+# chaque route ne doit lire que les lignes de l'utilisateur connecté.
+def full_scans(connection, tables, statement, parameters):
+    plan = connection.execute(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+    details = [row[3] for row in plan]
+
+    # Les tables FTS5 (VIRTUAL TABLE INDEX ...) sont interrogées par MATCH, pas parcourues
+    scans = [
+        detail for detail in details
+        if (match := SCAN.match(detail)) and match.group(1) in tables and "VIRTUAL TABLE" not in detail
+    ]
+
+    return scans, details
+
+
+def check_status(name, response):
+    # Requête refusée (422, 404...) : ses écritures ne seraient pas auditées
+    if response.status_code >= 400:
+        raise click.ClickException(f"{name} : réponse HTTP {response.status_code}, route non auditée")
+
+
+def capture(database):
+    os.environ["DB_PATH"] = f"sqlite:///{database}"
+    os.environ.setdefault("SECRET_KEY", "bench")
+    os.environ["PASSWORD_HASH_WORKERS"] = "0"
+    os.environ["REPORT_WORKERS"] = "0"
+    os.environ["REPORT_DIR"] = os.path.join(os.path.dirname(database), "reports")
+
+    from api import create_token
+    from app import create_app
+    from database import get_engine, session
+    from migrations import migrate
+    from sqlalchemy import event, text
+
+    engine = get_engine()
+    migrate(engine)
+
+    app = create_app()
+    app.config["TESTING"] = True
+
+    ctx = user_contexts(database, 1)[0]
+    current = {"route": None}
+    statements = {}
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if current["route"] is None or not STATEMENT.match(statement):
+            return
+
+        if executemany:
+            parameters = parameters[0]
+
+        statements.setdefault(statement, (current["route"], parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+
+    client = app.test_client()
+    client.post("/", data=dict(email=ctx["email"], password="bench-password"))
+
+    with app.app_context():
+        user_id = session.scalar(text("SELECT id FROM users WHERE email = :email"), {"email": ctx["email"]})
+        token = create_token(user_id)
+        session.commit()
+
+    headers = {"Authorization": f"Bearer {token}"}
+
+    for name, method, path, data in ROUTES:
+        current["route"] = name
+        response = client.open(path(ctx), method=method, data=data(ctx) if data else None)
+        response.close()
+        check_status(name, response)
+
+    for name, method, path, body in EXTRA_ROUTES:
+        current["route"] = name
+        response = client.open(path(ctx), method=method, headers=headers, json=body(ctx) if body else None)
+        response.close()
+        check_status(name, response)
+
+    current["route"] = None
+
+    return statements
+
+
+@click.command()
+@click.argument("database", type=click.Path(exists=True, dir_okay=False))
+@click.option("--verbose", is_flag=True, help="Affiche le plan de chaque requête, même sans parcours complet.")
+@click.option("--json", "as_json", is_flag=True, help="Sortie JSON (route, requête, plan).")
+def main(database, verbose, as_json):
+    """Vérifie qu'aucune requête des routes ne parcourt une table entière (base créée par bench/seed.py)."""
+    workdir = tempfile.mkdtemp(prefix="hackdesk-audit-")
+    copy = os.path.join(workdir, "audit.db")
+    shutil.copy(database, copy)
+
+    try:
+        statements = capture(copy)
+
+        connection = sqlite3.connect(copy)
+        tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        report = []
+
+        for statement, (route, parameters) in statements.items():
+            scans, plan = full_scans(connection, tables, statement, parameters)
+            report.append(dict(route=route, statement=" ".join(statement.split()), plan=plan, scans=scans))
+
+        connection.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    failures = [entry for entry in report if entry["scans"]]
+
+    if as_json:
+        click.echo(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        for entry in report:
+            if entry["scans"] or verbose:
+                click.echo(f"{'ÉCHEC' if entry['scans'] else 'ok':<6} {entry['route']:<20} {entry['statement'][:160]}")
+                for detail in entry["plan"]:
+                    click.echo(f"{'':<28}{detail}")
+
+        click.echo(f"{len(report)} requête(s) analysée(s), {len(failures)} avec un parcours complet de table.")
+
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,498 @@
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+
+import click
+import json
+import os
+import platform
+import resource
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINES = os.path.join(ROOT, "bench", "baselines")
+BENCH_PASSWORD = "bench-password"
+
+sys.path.insert(0, ROOT)
+
+
+# ==========================
+# Routes mesurées
+# ==========================
+# (nom, méthode, chemin, données du formulaire) : le chemin et les données reçoivent
+# le contexte de l'utilisateur simulé (ses ids de client, projet et tâche).
+# Les suppressions prennent leurs ids dans des réserves (ctx["victims"]) qui épargnent
+# le client, le projet et la tâche des autres routes. Avant une suppression, sa réserve est
+# complétée par des lignes créées pour l'occasion (add_victims) ; elle n'a pas d'échauffement.
+VICTIMS = {"delete_task": "tasks", "delete_project": "projects", "delete_client": "clients"}
+
+ROUTES = [
+    ("login", "POST", lambda ctx: "/", lambda ctx: dict(email=ctx["email"], password=BENCH_PASSWORD)),
+    ("dashboard", "GET", lambda ctx: "/dashboard", None),
+    ("projects", "GET", lambda ctx: "/projects", None),
+    ("projects_page2", "GET", lambda ctx: f"/projects?cursor={ctx['cursor']}", None),
+    ("tasks", "GET", lambda ctx: "/tasks", None),
+    ("clients", "GET", lambda ctx: "/clients", None),
+    ("search", "GET", lambda ctx: "/search?q=site", None),
+    ("view_project", "GET", lambda ctx: f"/view-project/{ctx['project']}", None),
+    ("view_client", "GET", lambda ctx: f"/view-client/{ctx['client']}", None),
+    ("edit_project_form", "GET", lambda ctx: f"/edit-project/{ctx['project']}", None),
+    ("edit_task_form", "GET", lambda ctx: f"/edit-task/{ctx['task']}", None),
+    ("edit_client_form", "GET", lambda ctx: f"/edit-client/{ctx['client']}", None),
+    ("add_project_form", "GET", lambda ctx: "/add-a-project", None),
+    ("add_task_form", "GET", lambda ctx: "/add-a-task", None),
+    ("profile", "GET", lambda ctx: "/profile", None),
+    ("export_tasks", "GET", lambda ctx: "/export/tasks.csv", None),
+    ("add_client", "POST", lambda ctx: "/add-a-client", lambda ctx: dict(
+        lastname="Bench", firstname="Client", enterprise="", address="", zip_code="", city="", country="",
+        phone_number="0600000000", email="bench@bench.test", note="")),
+    ("add_project", "POST", lambda ctx: "/add-a-project", lambda ctx: dict(
+        name_project="Bench", description="Projet de bench", url="", hosting_server="", status="En cours",
+        hourly_rate="50", client=ctx["client"])),
+    ("add_task", "POST", lambda ctx: "/add-a-task", lambda ctx: dict(
+        name_task="Bench", status="En cours", time_spent="1.5", project=ctx["project"])),
+    ("edit_project", "POST", lambda ctx: f"/edit-project/{ctx['project']}", lambda ctx: dict(
+        name_project="Bench modifié", description="Projet de bench", url="Aucune", hosting_server="Aucun",
+        status="En cours", hourly_rate="55")),
+    ("edit_task", "POST", lambda ctx: f"/edit-task/{ctx['task']}", lambda ctx: dict(
+        name_task="Bench modifiée", status="En cours", time_spent=str(ctx["tick"] % 7 + 1))),
+    ("edit_client", "POST", lambda ctx: f"/edit-client/{ctx['client']}", lambda ctx: dict(
+        lastname="Bench", firstname="Client modifié", enterprise="", address="", zip_code="", city="", country="",
+        phone_number="0600000000", email="bench@bench.test", note=str(ctx["tick"]))),
+    ("delete_task", "POST", lambda ctx: f"/delete-task/{ctx['victims']['tasks'].pop()}", lambda ctx: {}),
+    # Cascades : tâches et saisies du projet, projets et tâches du client
+    ("delete_project", "POST", lambda ctx: f"/delete-project/{ctx['victims']['projects'].pop()}", lambda ctx: {}),
+    ("delete_client", "POST", lambda ctx: f"/delete-client/{ctx['victims']['clients'].pop()}", lambda ctx: {}),
+]
+
+
+# ==========================
+# Clients HTTP
+# ==========================
+class QueryCounter:
+    # Compte les requêtes SQL du thread courant (mode test client uniquement)
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.local = threading.local()
+        event.listen(engine, "before_cursor_execute", self.count)
+
+    def count(self, *args):
+        self.local.count = getattr(self.local, "count", 0) + 1
+
+    def reset(self):
+        self.local.count = 0
+
+    def value(self):
+        return getattr(self.local, "count", 0)
+
+
+class FlaskDriver:
+    def __init__(self, app, counter):
+        self.client = app.test_client()
+        self.counter = counter
+
+    def request(self, method, path, data):
+        self.counter.reset()
+        response = self.client.open(path, method=method, data=data)
+        response.close()
+        return response.status_code, self.counter.value()
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpDriver:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()), NoRedirect())
+
+    def request(self, method, path, data):
+        body = urlencode(data).encode() if data is not None else None
+
+        try:
+            with self.opener.open(urllib.request.Request(self.base_url + path, data=body, method=method)) as response:
+                response.read()
+                return response.status, None
+        except HTTPError as error:
+            return error.code, None
+
+
+# ==========================
+# Données des utilisateurs
+# ==========================
+def user_contexts(database, count):
+    # Utilisateurs qui ont au moins un client, un projet et une tâche
+    connection = sqlite3.connect(database)
+    rows = connection.execute("""
+        SELECT users.id, users.email,
+            (SELECT min(id) FROM clients WHERE user_id = users.id),
+            (SELECT min(id) FROM projects WHERE user_id = users.id)
+        FROM users
+        WHERE EXISTS (SELECT 1 FROM tasks JOIN projects ON projects.id = tasks.project_id WHERE projects.user_id = users.id)
+        ORDER BY users.id LIMIT ?
+    """, (count,)).fetchall()
+    contexts = []
+
+    for user_id, email, client_id, project_id in rows:
+        task_ids = [row[0] for row in connection.execute(
+            "SELECT tasks.id FROM tasks JOIN projects ON projects.id = tasks.project_id WHERE projects.user_id = ? ORDER BY tasks.id",
+            (user_id,)
+        )]
+        projects = connection.execute(
+            "SELECT id, client_id FROM projects WHERE user_id = ? ORDER BY id DESC", (user_id,)
+        ).fetchall()
+        project_ids = [row[0] for row in projects]
+        task_project = connection.execute("SELECT project_id FROM tasks WHERE id = ?", (task_ids[0],)).fetchone()[0]
+
+        # Clients gardés : celui du contexte et ceux du projet et de la tâche du contexte.
+        # Les projets supprimés sont pris chez ces clients, les clients supprimés ailleurs.
+        kept_projects = {project_id, task_project}
+        kept_clients = {client_id} | {client for id, client in projects if id in kept_projects}
+        client_victims = [row[0] for row in connection.execute(
+            "SELECT id FROM clients WHERE user_id = ? ORDER BY id", (user_id,)
+        ) if row[0] not in kept_clients]
+        project_victims = [id for id, client in projects if client in kept_clients and id not in kept_projects]
+
+        contexts.append(dict(
+            user_id=user_id, email=email, client=client_id, project=project_id, task=task_ids[0],
+            cursor=project_ids[min(len(project_ids), 50) - 1], tick=0,
+            victims=dict(tasks=task_ids[1:], projects=project_victims, clients=client_victims),
+        ))
+
+    connection.close()
+
+    if not contexts:
+        raise click.ClickException("Aucun utilisateur avec des tâches : lancez d'abord bench/seed.py.")
+
+    return contexts
+
+
+def add_victims(database, ctx, kind, count):
+    # Complète la réserve d'une suppression à `count` ids, juste avant la route : les listes
+    # mesurées avant ne voient pas ces lignes. Projets et clients créés ont la taille moyenne
+    # de ceux de l'utilisateur (projets par client, tâches par projet, saisies par tâche).
+    from rollups import INSERT_ENTRY
+
+    pool = ctx["victims"][kind]
+    missing = count - len(pool)
+
+    if missing <= 0:
+        return
+
+    connection = sqlite3.connect(database)
+    user_id = ctx["user_id"]
+    clients, projects, tasks, entries = connection.execute("""
+        SELECT (SELECT count(*) FROM clients WHERE user_id = :user),
+            (SELECT count(*) FROM projects WHERE user_id = :user),
+            (SELECT count(*) FROM tasks JOIN projects ON projects.id = tasks.project_id WHERE projects.user_id = :user),
+            (SELECT count(*) FROM time_entries WHERE user_id = :user)
+    """, {"user": user_id}).fetchone()
+    per_client = max(round(projects / max(clients, 1)), 1)
+    per_project = max(round(tasks / max(projects, 1)), 1)
+    per_task = round(entries / max(tasks, 1))
+
+    def add_tasks(project_id, number):
+        ids = []
+        for n in range(number):
+            ids.append(connection.execute(
+                "INSERT INTO tasks (name_task, status, time_spent, project_id) VALUES (?, 'En cours', 0, ?)",
+                (f"Bench suppression {n}", project_id)
+            ).lastrowid)
+        connection.executemany(INSERT_ENTRY.text, [
+            {"task_id": task_id, "started_at": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()), "duration": 1}
+            for task_id in ids for _ in range(per_task)
+        ])
+        return ids
+
+    def add_project(client_id):
+        project_id = connection.execute(
+            "INSERT INTO projects (name_project, status, hourly_rate, total_time, user_id, client_id) "
+            "VALUES ('Bench suppression', 'En cours', 50, 0, ?, ?)", (user_id, client_id)
+        ).lastrowid
+        add_tasks(project_id, per_project)
+        return project_id
+
+    for _ in range(missing):
+        if kind == "tasks":
+            pool.extend(add_tasks(ctx["project"], 1))
+        elif kind == "projects":
+            pool.append(add_project(ctx["client"]))
+        else:
+            client_id = connection.execute(
+                "INSERT INTO clients (lastname, firstname, phone_number, email, user_id) "
+                "VALUES ('BENCH', 'Suppression', '0600000000', 'bench@bench.test', ?)", (user_id,)
+            ).lastrowid
+            for _ in range(per_client):
+                add_project(client_id)
+            pool.append(client_id)
+
+    connection.commit()
+    connection.close()
+
+
+# ==========================
+# Mesures
+# ==========================
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, round(fraction * (len(values) - 1)))]
+
+
+def peak_rss_kb(pid=None):
+    if pid is None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Processus serveur et ses workers : pic de mémoire (VmHWM) de chacun, additionné
+    total = 0
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/status") as file:
+                status = dict(line.split(":", 1) for line in file if ":" in line)
+        except OSError:
+            continue
+        if int(entry) == pid or int(status.get("PPid", "0").strip()) == pid:
+            total += int(status.get("VmHWM", "0 kB").split()[0])
+    return total
+
+
+def run_route(route, drivers, contexts, requests, concurrency, warmup):
+    name, method, path, data = route
+    latencies = []
+    queries = []
+    errors = 0
+    lock = threading.Lock()
+
+    def worker(index):
+        nonlocal errors
+        driver, ctx = drivers[index], contexts[index]
+
+        # Pas d'échauffement pour une suppression : chaque requête consomme un id de la réserve
+        skipped = 0 if name in VICTIMS else warmup
+
+        for iteration in range(skipped + requests // concurrency):
+            if name in VICTIMS and not ctx["victims"][VICTIMS[name]]:
+                break
+            ctx["tick"] += 1
+
+            # Connexion mesurée depuis une session déconnectée
+            if name == "login":
+                driver.request("GET", "/logout", None)
+
+            started = time.perf_counter()
+            status, count = driver.request(method, path(ctx), data(ctx) if data else None)
+            elapsed = time.perf_counter() - started
+
+            if iteration < skipped:
+                continue
+
+            with lock:
+                latencies.append(elapsed)
+                if count is not None:
+                    queries.append(count)
+                if status >= 400:
+                    errors += 1
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+
+    # Aucune requête mesurée (réserve vide) : route marquée non mesurée
+    if not latencies:
+        return dict(requests=0, errors=errors, p50_ms=None, p95_ms=None, p99_ms=None, throughput_rps=None, queries=None)
+
+    return dict(
+        requests=len(latencies),
+        errors=errors,
+        p50_ms=round(percentile(latencies, 0.50) * 1000, 3),
+        p95_ms=round(percentile(latencies, 0.95) * 1000, 3),
+        p99_ms=round(percentile(latencies, 0.99) * 1000, 3),
+        # Requêtes mesurées par seconde, tous utilisateurs simulés confondus
+        throughput_rps=round(len(latencies) * concurrency / sum(latencies), 1),
+        queries=round(sum(queries) / len(queries), 2) if queries else None,
+    )
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database, workers, threads, asgi=False):
+    port = free_port()
+    env = dict(os.environ, DB_PATH=f"sqlite:///{database}", SECRET_KEY=os.environ.get("SECRET_KEY", "bench"))
+
+    if asgi:
+        # Mode asynchrone (asgi.py) : une boucle d'événements par worker, pas de threads
+        command = [sys.executable, "-m", "uvicorn", "asgi:application", "--port", str(port),
+                   "--workers", str(workers), "--log-level", "warning"]
+    else:
+        command = [sys.executable, "-m", "gunicorn", "app:app", "-b", f"127.0.0.1:{port}", "-w", str(workers),
+                   "--worker-class", "gthread", "--threads", str(threads), "--log-level", "warning"]
+
+    server = subprocess.Popen(command, cwd=ROOT, env=env)
+
+    for _ in range(200):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return server, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.1)
+
+    server.terminate()
+    raise click.ClickException(f"{command[2]} n'a pas démarré.")
+
+
+# ==========================
+# Référence et comparaison
+# ==========================
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    click.echo(f"\n{'route':<20} {'p95 ref':>10} {'p95':>10} {'écart':>8} {'req. ref':>9} {'req.':>6}")
+
+    for name, current in results["routes"].items():
+        reference = baseline["routes"].get(name)
+        if reference is None or reference["p95_ms"] is None or current["p95_ms"] is None:
+            continue
+
+        change = (current["p95_ms"] - reference["p95_ms"]) / reference["p95_ms"] * 100 if reference["p95_ms"] else 0
+        more_queries = current["queries"] is not None and reference["queries"] is not None \
+            and current["queries"] > reference["queries"]
+        flag = ""
+
+        if change > threshold or more_queries:
+            regressions.append(name)
+            flag = "  <- régression"
+
+        click.echo(
+            f"{name:<20} {reference['p95_ms']:>10.2f} {current['p95_ms']:>10.2f} {change:>7.1f}% "
+            f"{reference['queries'] if reference['queries'] is not None else '-':>9} "
+            f"{current['queries'] if current['queries'] is not None else '-':>6}{flag}"
+        )
+
+    return regressions
+
+
+@click.command()
+@click.argument("database")
+@click.option("--requests", "count", type=int, default=50, show_default=True, help="Requêtes par route.")
+@click.option("--warmup", type=int, default=2, show_default=True, help="Requêtes non mesurées par route et utilisateur.")
+@click.option("--concurrency", type=int, default=1, show_default=True, help="Utilisateurs simulés en parallèle.")
+@click.option("--server", is_flag=True, help="Passe par un gunicorn local au lieu du test client Flask.")
+@click.option("--workers", type=int, default=1, show_default=True, help="Workers gunicorn (avec --server).")
+@click.option("--threads", type=int, default=4, show_default=True, help="Threads par worker (avec --server).")
+@click.option("--asgi", is_flag=True, help="Avec --server : uvicorn et les vues asynchrones (asgi.py) au lieu de gunicorn.")
+@click.option("--only", multiple=True, help="Limite aux routes nommées (répétable).")
+@click.option("--save", help="Enregistre les résultats dans bench/baselines/<nom>.json.")
+@click.option("--compare", "baseline", help="Compare à bench/baselines/<nom>.json.")
+@click.option("--threshold", type=float, default=10.0, show_default=True, help="Hausse du p95 (%) signalée.")
+@click.option("--fail-on-regression", is_flag=True, help="Code de sortie 1 en cas de régression.")
+def main(database, count, warmup, concurrency, server, workers, threads, asgi, only, save, baseline, threshold, fail_on_regression):
+    """Mesure chaque route sur une copie de DATABASE (créée par bench/seed.py)."""
+    # Les écritures du bench ne touchent pas la base d'origine
+    workdir = tempfile.mkdtemp(prefix="hackdesk-bench-")
+    copy = os.path.join(workdir, "bench.db")
+    shutil.copy(database, copy)
+
+    contexts = user_contexts(copy, concurrency)
+    concurrency = len(contexts)
+    routes = [route for route in ROUTES if not only or route[0] in only or route[0] == "login"]
+    process = None
+
+    # Une base générée avec un schéma plus ancien reçoit les migrations du code mesuré
+    os.environ["DB_PATH"] = f"sqlite:///{copy}"
+    from database import get_engine
+    from migrations import migrate
+
+    migrate(get_engine())
+
+    try:
+        if server:
+            process, base_url = start_server(copy, workers, threads, asgi)
+            drivers = [HttpDriver(base_url) for _ in contexts]
+        else:
+            os.environ.setdefault("SECRET_KEY", "bench")
+
+            from app import create_app
+
+            app = create_app()
+            app.config["TESTING"] = True
+            counter = QueryCounter(get_engine())
+            drivers = [FlaskDriver(app, counter) for _ in contexts]
+
+        results = {}
+        for route in routes:
+            if route[0] in VICTIMS:
+                for ctx in contexts:
+                    add_victims(copy, ctx, VICTIMS[route[0]], warmup + count // concurrency)
+
+            results[route[0]] = run_route(route, drivers, contexts, count, concurrency, warmup)
+            stats = results[route[0]]
+
+            if not stats["requests"]:
+                click.echo(f"{route[0]:<20} non mesurée" + (f"  {stats['errors']} erreur(s)" if stats["errors"] else ""))
+                continue
+
+            click.echo(
+                f"{route[0]:<20} p50 {stats['p50_ms']:>8.2f} ms  p95 {stats['p95_ms']:>8.2f} ms  "
+                f"p99 {stats['p99_ms']:>8.2f} ms  {stats['throughput_rps']:>7.1f} req/s  "
+                f"{stats['queries'] if stats['queries'] is not None else '-':>5} req. SQL"
+                + (f"  {stats['errors']} erreur(s)" if stats["errors"] else "")
+            )
+
+        rss = peak_rss_kb(process.pid if process else None)
+        click.echo(f"\nPic de mémoire : {rss / 1024:.1f} Mo")
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = dict(
+        revision=git_revision(),
+        python=platform.python_version(),
+        mode=("uvicorn" if asgi else "gunicorn") if server else "test-client",
+        database=os.path.basename(database),
+        requests=count,
+        warmup=warmup,
+        concurrency=concurrency,
+        peak_rss_kb=rss,
+        routes=results,
+    )
+
+    if save:
+        os.makedirs(BASELINES, exist_ok=True)
+        with open(os.path.join(BASELINES, f"{save}.json"), "w") as file:
+            json.dump(output, file, indent=2, sort_keys=True)
+            file.write("\n")
+
+    if baseline:
+        with open(os.path.join(BASELINES, f"{baseline}.json")) as file:
+            regressions = compare(output, json.load(file), threshold)
+
+        if regressions and fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
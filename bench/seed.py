@@ -0,0 +1,140 @@
+from datetime import datetime, timedelta
+from werkzeug.security import generate_password_hash
+
+import click
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BENCH_PASSWORD = "bench-password"
+PRESETS = {
+    # utilisateurs, clients, projets, tâches (totaux) : clients répartis entre les utilisateurs,
+    # projets entre les clients, tâches au hasard entre les projets
+    "small": (10, 50, 200, 5000),
+    "large": (1000, 200, 2000, 50000),
+}
+PROJECT_STATUSES = ["En cours", "En attente", "Terminé"]
+TASK_STATUSES = ["À faire", "Bloquée", "En cours", "Terminée"]
+WORDS = ["site", "api", "refonte", "audit", "migration", "boutique", "blog", "tableau", "mobile", "paiement",
+         "recherche", "export", "facture", "serveur", "design", "sécurité", "newsletter", "portail"]
+CHUNK = 5000
+
+
+# ==========================================
+# Génération d'une base de test synthétique
+# ==========================================
+# Les données passent par les mêmes triggers que l'application (totaux, saisies de temps,
+# agrégats, recherche, row_version) : la base obtenue est cohérente.
+def chunks(rows):
+    for start in range(0, len(rows), CHUNK):
+        yield rows[start:start + CHUNK]
+
+
+def words(rng, count):
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+
+def seed(path, users, clients, projects, tasks, entries, days, random_seed):
+    os.environ["DB_PATH"] = f"sqlite:///{os.path.abspath(path)}"
+
+    # Crée le schéma, les index et les triggers de l'application
+    from database import get_engine
+    from migrations import migrate
+    from models import Client, Project, Task, User
+    from rollups import INSERT_ENTRY
+    from sqlalchemy import insert, text
+
+    engine = get_engine()
+    migrate(engine)
+
+    rng = random.Random(random_seed)
+    password = generate_password_hash(BENCH_PASSWORD)
+    now = datetime.utcnow().replace(microsecond=0)
+
+    with engine.begin() as connection:
+        connection.execute(insert(User), [
+            dict(lastname=f"BENCH{n}", firstname=f"Utilisateur{n}", email=f"user{n}@bench.test", password=password)
+            for n in range(users)
+        ])
+        user_ids = [row[0] for row in connection.execute(text("SELECT id FROM users ORDER BY id"))]
+
+        for rows in chunks([
+            dict(
+                lastname=f"CLIENT{n}", firstname=words(rng, 1).capitalize(), enterprise=words(rng, 2).title(),
+                address=f"{n} rue {words(rng, 1)}", zip_code=f"{rng.randint(1000, 99999):05d}", city="Paris",
+                country="France", phone_number=f"06{rng.randint(0, 99999999):08d}", email=f"client{n}@bench.test",
+                note=words(rng, 8), user_id=user_ids[n % users]
+            )
+            for n in range(clients)
+        ]):
+            connection.execute(insert(Client), rows)
+        client_rows = connection.execute(text("SELECT id, user_id FROM clients ORDER BY id")).all()
+
+        for rows in chunks([
+            dict(
+                name_project=f"{words(rng, 2).capitalize()} {n}", description=words(rng, 12),
+                url=f"https://p{n}.bench.test", hosting_server="Aucun", status=rng.choice(PROJECT_STATUSES),
+                hourly_rate=rng.choice([30, 45, 60, 80, 100]),
+                client_id=client_rows[n % clients][0], user_id=client_rows[n % clients][1]
+            )
+            for n in range(projects)
+        ]):
+            connection.execute(insert(Project), rows)
+        project_ids = [row[0] for row in connection.execute(text("SELECT id FROM projects ORDER BY id"))]
+
+        for rows in chunks([
+            dict(name_task=f"{words(rng, 3).capitalize()} {n}", status=rng.choice(TASK_STATUSES),
+                 time_spent=0.0, project_id=rng.choice(project_ids))
+            for n in range(tasks)
+        ]):
+            connection.execute(insert(Task), rows)
+
+        # Saisies de temps réparties sur les derniers jours : remplissent time_spent, totaux et agrégats
+        task_ids = [row[0] for row in connection.execute(text("SELECT id FROM tasks ORDER BY id"))]
+        for rows in chunks([
+            dict(task_id=task_id, duration=rng.choice([0.25, 0.5, 1, 1.5, 2, 3, 4]),
+                 started_at=now - timedelta(days=rng.randint(0, days), hours=rng.randint(0, 23)))
+            for task_id in task_ids
+            for _ in range(rng.randint(0, entries * 2))
+        ]):
+            connection.execute(INSERT_ENTRY, rows)
+
+
+@click.command()
+@click.argument("path")
+@click.option("--preset", type=click.Choice(list(PRESETS)), default="small", show_default=True)
+@click.option("--users", type=int, help="Nombre d'utilisateurs (remplace le preset).")
+@click.option("--clients", type=int, help="Nombre total de clients.")
+@click.option("--projects", type=int, help="Nombre total de projets.")
+@click.option("--tasks", type=int, help="Nombre total de tâches.")
+@click.option("--entries", type=int, default=2, show_default=True, help="Saisies de temps moyennes par tâche.")
+@click.option("--days", type=int, default=90, show_default=True, help="Période couverte par les saisies.")
+@click.option("--seed", "random_seed", type=int, default=1, show_default=True)
+@click.option("--force", is_flag=True, help="Remplace le fichier s'il existe.")
+def main(path, preset, users, clients, projects, tasks, entries, days, random_seed, force):
+    """Crée une base SQLite synthétique pour les benchmarks (bench/run.py)."""
+    if os.path.exists(path):
+        if not force:
+            raise click.ClickException(f"{path} existe déjà (--force pour le remplacer).")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    default_users, default_clients, default_projects, default_tasks = PRESETS[preset]
+    counts = (users or default_users, clients or default_clients, projects or default_projects, tasks or default_tasks)
+
+    started = time.perf_counter()
+    seed(path, *counts, entries, days, random_seed)
+
+    click.echo(
+        f"{counts[0]} utilisateurs, {counts[1]} clients, {counts[2]} projets, {counts[3]} tâches "
+        f"en {time.perf_counter() - started:.1f} s -> {path}"
+    )
+    click.echo(f"Connexion : user0@bench.test / {BENCH_PASSWORD}")
+
+
+if __name__ == "__main__":
+    main()
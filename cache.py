@@ -0,0 +1,122 @@
+from collections import OrderedDict
+from threading import Lock
+
+import sys
+import time
+
+
+# =====================
+# Cache mémoire borné
+# =====================
+# LRU en mémoire (par processus), borné en nombre d'entrées, avec expiration
+class TTLCache:
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, size=len(self._data), maxsize=self.maxsize)
+
+
+# ==========================
+# Cache de fragments HTML
+# ==========================
+# LRU borné en octets ; les clés commencent par (base, type, id) pour pouvoir évincer une entité
+class FragmentCache:
+    def __init__(self, maxbytes=8 * 1024 * 1024):
+        self.maxbytes = maxbytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._entities = {}
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+
+            if value is None:
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        size = sys.getsizeof(value)
+
+        if size > self.maxbytes:
+            return
+
+        with self._lock:
+            self._remove(key)
+            self._data[key] = value
+            self._entities.setdefault(key[:3], set()).add(key)
+            self.bytes += size
+
+            while self.bytes > self.maxbytes:
+                self._remove(next(iter(self._data)))
+
+    def evict(self, shard, kind, entity_id):
+        with self._lock:
+            for key in list(self._entities.get((shard, kind, entity_id), ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._entities.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, size=len(self._data), bytes=self.bytes, maxbytes=self.maxbytes)
+
+    def _remove(self, key):
+        value = self._data.pop(key, None)
+
+        if value is None:
+            return
+
+        self.bytes -= sys.getsizeof(value)
+        keys = self._entities.get(key[:3])
+        keys.discard(key)
+        if not keys:
+            del self._entities[key[:3]]
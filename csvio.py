@@ -0,0 +1,139 @@
+from sqlalchemy import insert, select
+
+from forms import clean_client, clean_project, clean_task
+from models import Client, Project, Task
+from rollups import log_time
+
+import csv
+import io
+import os
+
+CHUNK_SIZE = int(os.environ.get("IMPORT_CHUNK_SIZE", 500))
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", 1000))
+
+# Colonnes CSV : mêmes noms que les champs des formulaires d'ajout
+CSV_COLUMNS = {
+    "clients": ["lastname", "firstname", "enterprise", "address", "zip_code", "city", "country", "phone_number", "email", "note"],
+    "projects": ["name_project", "description", "url", "hosting_server", "status", "hourly_rate", "client"],
+    "tasks": ["name_task", "status", "time_spent", "project"],
+}
+CSV_MODELS = {"clients": Client, "projects": Project, "tasks": Task}
+
+
+# ============
+# Import CSV
+# ============
+def owned_ids(session, model, user_id):
+    return set(session.scalars(select(model.id).where(model.user_id == user_id)))
+
+
+def import_csv(session, user_id, kind, stream):
+    # Tout ou rien : une seule ligne invalide et rien n'est inséré.
+    # Fichier illisible (encodage, CSV mal formé) : une erreur sur le fichier entier (ligne 1)
+    try:
+        rows, errors = read_csv(session, user_id, kind, stream)
+    except UnicodeDecodeError:
+        return 0, [(1, "Le fichier doit être encodé en UTF-8.")]
+    except csv.Error as ex:
+        return 0, [(1, f"Fichier CSV illisible : {ex}")]
+
+    if errors:
+        return 0, errors
+
+    # executemany par paquets, dans la transaction de la session
+    for start in range(0, len(rows), CHUNK_SIZE):
+        chunk = rows[start:start + CHUNK_SIZE]
+
+        if kind != "tasks":
+            session.execute(insert(CSV_MODELS[kind]), chunk)
+            continue
+
+        # Le temps passé des tâches est enregistré comme saisies
+        hours = [values.pop("time_spent") for values in chunk]
+        ids = session.scalars(insert(Task).returning(Task.id, sort_by_parameter_order=True), chunk).all()
+        log_time(session, [(task_id, duration, None) for task_id, duration in zip(ids, hours)])
+
+    session.commit()
+
+    return len(rows), []
+
+
+def read_csv(session, user_id, kind, stream):
+    # Lignes validées et erreurs par numéro de ligne ; le décodage se fait au fil de la lecture
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+
+    missing = [name for name in CSV_COLUMNS[kind] if name not in (reader.fieldnames or [])]
+    if missing:
+        return [], [(1, "Colonnes manquantes : " + ", ".join(missing))]
+
+    rows = []
+    errors = []
+
+    if kind == "clients":
+        clean = clean_client
+    elif kind == "projects":
+        clean = clean_project
+        client_ids = owned_ids(session, Client, user_id)
+    else:
+        clean = clean_task
+        project_ids = owned_ids(session, Project, user_id)
+
+    # La ligne 1 est l'en-tête
+    for line, data in enumerate(reader, start=2):
+        values, error = clean(data)
+
+        if not error and kind == "projects" and values["client_id"] not in client_ids:
+            error = "Client inconnu."
+        if not error and kind == "tasks" and values["project_id"] not in project_ids:
+            error = "Projet inconnu."
+
+        if error:
+            errors.append((line, error))
+            continue
+
+        if kind != "tasks":
+            values["user_id"] = user_id
+
+        rows.append(values)
+
+    return rows, errors
+
+
+# ============
+# Export CSV
+# ============
+def export_statement(kind, user_id):
+    if kind == "clients":
+        columns = [getattr(Client, name) for name in CSV_COLUMNS["clients"]]
+        return select(Client.id, *columns).where(Client.user_id == user_id).order_by(Client.id)
+
+    if kind == "projects":
+        columns = [getattr(Project, name) for name in CSV_COLUMNS["projects"][:-1]]
+        return select(Project.id, *columns, Project.client_id).where(Project.user_id == user_id).order_by(Project.id)
+
+    return (
+        select(Task.id, Task.name_task, Task.status, Task.time_spent, Task.project_id)
+        .join(Project, Project.id == Task.project_id)
+        .where(Project.user_id == user_id)
+        .order_by(Task.id)
+    )
+
+
+def export_csv(session, user_id, kind):
+    # Curseur côté serveur : les lignes sont lues et envoyées par paquets
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(["id"] + CSV_COLUMNS[kind])
+
+    result = session.execute(
+        export_statement(kind, user_id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+
+    for rows in result.partitions():
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    yield buffer.getvalue()
@@ -0,0 +1,260 @@
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from flask import g, has_app_context
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.elements import TextClause
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session as OrmSession, scoped_session, sessionmaker
+
+from metrics import commit_failures, observe_pool
+from threading import Lock
+
+import os
+
+load_dotenv()
+
+# ====================
+# Config du pool SQL
+# ====================
+def env_flag(name, default=False):
+    value = os.environ.get(name)
+
+    if value is None:
+        return default
+
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def utcnow():
+    # Dates stockées en UTC, sans fuseau (colonnes DateTime SQLite)
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def engine_options(url):
+    options = {
+        "pool_pre_ping": env_flag("DB_POOL_PRE_PING", True),
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+    }
+
+    # Une base SQLite en mémoire utilise un pool à connexion unique sans taille
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return options
+
+    options["pool_size"] = int(os.environ.get("DB_POOL_SIZE", 5))
+    options["max_overflow"] = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+    options["pool_timeout"] = int(os.environ.get("DB_POOL_TIMEOUT", 30))
+
+    return options
+
+
+def configure_sqlite(engine):
+    busy_timeout = int(os.environ.get("SQLITE_BUSY_TIMEOUT", 5000))
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL : les lectures ne bloquent plus l'écriture (et inversement)
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={busy_timeout}")
+        # ON DELETE CASCADE : SQLite ne contrôle les clés étrangères que sur demande
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+
+def build_engine(db):
+    url = make_url(db)
+    engine = create_engine(url, **engine_options(url))
+
+    if url.get_backend_name() == "sqlite":
+        configure_sqlite(engine)
+
+    return engine
+
+
+# ===================================
+# Bases de données partagées (shards)
+# ===================================
+# DB_PATH est la base principale : annuaire (comptes, jetons d'API, e-mails, purges,
+# table user_shards) et premier shard. DB_SHARDS en ajoute d'autres, chacune avec le
+# schéma complet (python migrations.py les met toutes à jour) :
+#   DB_SHARDS=4 : hackdesk-1.db ... hackdesk-3.db à côté de DB_PATH (shards "1" à "3")
+#   DB_SHARDS=eu=postgresql://...,s2=sqlite:///s2.db : noms et URL explicites
+# Les données d'un utilisateur (SHARDED_TABLES, index de recherche) vivent dans un seul shard,
+# choisi par l'annuaire (voir shards.py) ; chaque base a son propre verrou d'écriture SQLite.
+MAIN = "main"
+
+SHARDED_TABLES = {
+    "clients", "projects", "tasks", "time_entries", "daily_rollups", "weekly_rollups", "user_versions",
+}
+
+
+def shard_urls(value, main_url):
+    value = (value or "").strip()
+
+    if not value:
+        return {}
+
+    if value.isdigit():
+        url = make_url(main_url)
+        stem, ext = os.path.splitext(url.database)
+
+        return {
+            str(number): url.set(database=f"{stem}-{number}{ext}").render_as_string(hide_password=False)
+            for number in range(1, int(value))
+        }
+
+    return dict(item.strip().split("=", 1) for item in value.split(",") if item.strip())
+
+
+SHARDS = shard_urls(os.environ.get("DB_SHARDS"), os.environ.get("DB_PATH"))
+
+
+def shard_names():
+    return [MAIN, *SHARDS]
+
+
+def shard_url(shard):
+    if shard == MAIN:
+        return os.environ.get('DB_PATH')
+
+    if shard not in SHARDS:
+        raise KeyError(f"Shard inconnu : {shard}")
+
+    return SHARDS[shard]
+
+
+# ========================
+# Moteur créé à la demande
+# ========================
+# Rien n'est ouvert à l'import : le démarrage d'un worker ne touche pas la base.
+# Avec gunicorn --preload, un moteur créé dans le maître n'est pas partagé :
+# chaque processus enfant repart avec un pool vide. Un moteur (et un pool) par shard.
+_engines = {}
+_engine_lock = Lock()
+
+
+def get_engine(shard=MAIN):
+    engine = _engines.get(shard)
+
+    if engine is None:
+        with _engine_lock:
+            engine = _engines.get(shard)
+
+            if engine is None:
+                engine = build_engine(shard_url(shard))
+                observe_pool(engine)
+                _engines[shard] = engine
+
+    return engine
+
+
+# =======================================
+# Moteur asynchrone (mode ASGI, asgi.py)
+# =======================================
+# Même base, même pool et mêmes PRAGMA, par un pilote asyncio : aiosqlite, asyncpg.
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+_async_engines = {}
+
+
+def build_async_engine(db):
+    url = make_url(db)
+    url = url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+    engine = create_async_engine(url, **engine_options(url))
+
+    if url.get_backend_name() == "sqlite":
+        configure_sqlite(engine.sync_engine)
+
+    return engine
+
+
+def get_async_engine(shard=MAIN):
+    engine = _async_engines.get(shard)
+
+    if engine is None:
+        with _engine_lock:
+            engine = _async_engines.get(shard)
+
+            if engine is None:
+                engine = build_async_engine(shard_url(shard))
+                observe_pool(engine.sync_engine)
+                _async_engines[shard] = engine
+
+    return engine
+
+
+async def dispose_async_engine():
+    for engine in list(_async_engines.values()):
+        await engine.dispose()
+
+
+def dispose_after_fork():
+    # close=False : les connexions du parent restent à lui, l'enfant les oublie seulement
+    for engine in list(_engines.values()):
+        engine.dispose(close=False)
+
+    for engine in list(_async_engines.values()):
+        engine.sync_engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=dispose_after_fork)
+
+
+def routed_to_shard(mapper, clause):
+    # Modèles des tables partagées ; le SQL brut (saisies, index de recherche) aussi
+    if mapper is not None:
+        return mapper.local_table.name in SHARDED_TABLES
+
+    return isinstance(clause, TextClause)
+
+
+def pinned_shard():
+    # Réponses en flux (CSV, SSE, pages) : lues après le teardown qui remplace la session,
+    # le shard de la requête reste dans g
+    if has_app_context():
+        return g.get("shard", MAIN)
+
+    return MAIN
+
+
+class MeteredSession(OrmSession):
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        # Sans bind explicite : la base principale, ou le shard choisi par use_shard (voir
+        # shards.py) pour les données de l'utilisateur. Moteurs créés au premier usage.
+        if self.bind is not None or kwargs.get("bind") is not None:
+            return super().get_bind(mapper, clause=clause, **kwargs)
+
+        shard = self.info.get("shard") or pinned_shard() if routed_to_shard(mapper, clause) else MAIN
+
+        if self.info.get("async"):
+            return get_async_engine(shard).sync_engine
+
+        return get_engine(shard)
+
+    # Les commits en échec sont comptés (hackdesk_db_commit_failures_total)
+    def commit(self):
+        try:
+            super().commit()
+        except Exception:
+            commit_failures.inc()
+            raise
+
+
+# Une session par requête (par thread), créée au premier usage et fermée au teardown
+Session = sessionmaker(class_=MeteredSession)
+session = scoped_session(Session)
+
+
+def async_session():
+    # Une session par requête asynchrone : async with async_session() as db
+    # Mêmes règles de routage que la session synchrone, sur les moteurs asyncio
+    return AsyncSession(sync_session_class=MeteredSession, expire_on_commit=False, info={"async": True})
+
+
+def init_session(app):
+    @app.teardown_appcontext
+    def remove_session(exception=None):
+        # Annule une transaction restée ouverte (commit raté) puis rend la connexion au pool
+        session.remove()
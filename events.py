@@ -0,0 +1,233 @@
+from collections import defaultdict
+from flask import Response, get_template_attribute, stream_with_context
+from queue import Empty, Full, Queue
+from threading import Lock
+
+from database import env_flag, session
+from versions import data_version
+
+import json
+import os
+import time
+
+# Désactivé par défaut : chaque page ouverte garderait un thread du worker (voir stream)
+LIVE_EVENTS = env_flag("LIVE_EVENTS")
+KEEPALIVE = float(os.environ.get("SSE_KEEPALIVE", 15))
+MAX_AGE = float(os.environ.get("SSE_MAX_AGE", 300))
+# Threads laissés aux autres requêtes du worker
+RESERVED_THREADS = int(os.environ.get("SSE_RESERVED_THREADS", 2))
+# Threads par worker, si le serveur ne les indique pas (WORKER_THREADS, voir gunicorn.conf.py)
+DEFAULT_THREADS = 8
+QUEUE_SIZE = 100
+RETRY_MS = 3000
+
+# Lignes de tableau rendues pour chaque table (macros de dashboard/partials/rows.html)
+ROW_MACROS = {
+    "projects": ("project_row", "client_project_row"),
+    "tasks": ("task_row",),
+    "clients": ("client_row",),
+}
+
+
+def max_streams():
+    # SSE_MAX_STREAMS, sinon les threads du worker moins la réserve
+    if os.environ.get("SSE_MAX_STREAMS"):
+        return int(os.environ["SSE_MAX_STREAMS"])
+
+    threads = int(os.environ.get("WORKER_THREADS") or DEFAULT_THREADS)
+
+    return max(threads - RESERVED_THREADS, 1)
+
+
+# ===============================
+# Événements en direct (SSE)
+# ===============================
+# Chaque page ouverte écoute /events. Les routes d'écriture publient les lignes modifiées
+# (HTML des lignes de tableau, rendues une fois) et les suppressions, puis user_data_changed
+# publie la nouvelle version des données. script.js remplace les lignes sans recharger la page.
+# La diffusion est propre au processus : une écriture faite par un autre worker est repérée
+# par la version (user_versions), relue à chaque keepalive, et la page est rechargée.
+class Broker:
+    def __init__(self):
+        self._lock = Lock()
+        self._queues = defaultdict(set)
+        self._count = 0
+        self._limit = None
+
+    def subscribe(self, user_id):
+        # None au-delà de max_streams() : chaque flux garde un thread du worker.
+        # Limite lue au premier flux, dans le worker (après le fork et post_fork)
+        with self._lock:
+            if self._limit is None:
+                self._limit = max_streams()
+
+            if self._count >= self._limit:
+                return None
+
+            queue = Queue(QUEUE_SIZE)
+            self._queues[user_id].add(queue)
+            self._count += 1
+
+            return queue
+
+    def unsubscribe(self, user_id, queue):
+        with self._lock:
+            self._queues[user_id].discard(queue)
+            self._count -= 1
+
+            if not self._queues[user_id]:
+                del self._queues[user_id]
+
+    def subscribed(self, user_id):
+        return user_id in self._queues
+
+    def publish(self, user_id, kind, data):
+        with self._lock:
+            queues = list(self._queues.get(user_id, ()))
+
+        for queue in queues:
+            try:
+                queue.put_nowait((kind, data))
+            except Full:
+                # Page qui ne lit plus : la file est vidée, la page sera rechargée
+                drain(queue)
+                queue.put_nowait(("refresh", {}))
+
+
+def drain(queue):
+    try:
+        while True:
+            queue.get_nowait()
+    except Empty:
+        pass
+
+
+broker = Broker()
+
+
+def publish(user_id, kind, data):
+    broker.publish(user_id, kind, data)
+
+
+def subscribed(user_id):
+    return broker.subscribed(user_id)
+
+
+def publish_rows(user_id, *entities):
+    # Rendu seulement si une page écoute ; les lignes passent par le cache de fragments
+    if not subscribed(user_id):
+        return
+
+    for entity in entities:
+        table = entity.__tablename__
+        parent = None
+
+        if table == "projects":
+            parent = f"clients-{entity.client_id}"
+        elif table == "tasks":
+            parent = f"projects-{entity.project_id}"
+
+        rows = {
+            macro: str(get_template_attribute("dashboard/partials/rows.html", macro)(entity))
+            for macro in ROW_MACROS[table]
+        }
+
+        publish(user_id, "row", {"entity": f"{table}-{entity.id}", "parent": parent, "rows": rows})
+
+
+def publish_deleted(user_id, *entities):
+    # entities : "table-id" (les enfants supprimés en cascade compris)
+    if entities:
+        publish(user_id, "delete", {"entities": list(entities)})
+
+
+def message(kind, data):
+    return f"event: {kind}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+# ==========================
+# Flux d'une page
+# ==========================
+def current_version(user_id):
+    version = data_version(user_id)[0]
+    # La connexion revient au pool entre deux lectures : le flux dure plusieurs minutes
+    session.close()
+
+    return version
+
+
+def stream(user_id, counters=None):
+    # counters : fonction des compteurs du tableau de bord, renvoyés à chaque changement.
+    # 204 sans LIVE_EVENTS : EventSource ne se reconnecte pas
+    if not LIVE_EVENTS:
+        return Response(status=204)
+
+    queue = broker.subscribe(user_id)
+
+    if queue is None:
+        return Response(status=503, headers={"Retry-After": "30"})
+
+    try:
+        version = current_version(user_id)
+    except Exception:
+        broker.unsubscribe(user_id, queue)
+        raise
+
+    def changed():
+        if counters is not None:
+            data = counters(user_id, version)
+            session.close()
+            return message("counters", data)
+
+        return message("refresh", {})
+
+    def generate():
+        nonlocal version
+        # Lignes reçues depuis la dernière version : le changement est déjà affiché
+        patched = False
+        deadline = time.monotonic() + MAX_AGE
+
+        yield f"retry: {RETRY_MS}\n\n"
+
+        # Flux fermé après MAX_AGE : le navigateur se reconnecte, le thread est rendu
+        while time.monotonic() < deadline:
+            try:
+                kind, data = queue.get(timeout=KEEPALIVE)
+            except Empty:
+                latest = current_version(user_id)
+
+                if latest != version:
+                    version = latest
+                    yield changed()
+                else:
+                    yield ": keepalive\n\n"
+                continue
+
+            if kind == "version":
+                version = data["version"]
+
+                if counters is not None or not patched:
+                    yield changed()
+
+                patched = False
+            elif kind == "refresh":
+                yield message(kind, data)
+            elif counters is None:
+                # Le tableau de bord n'affiche que les compteurs : pas de lignes
+                patched = True
+                yield message(kind, data)
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    # Appelé par le serveur à la fermeture, même si le flux n'a jamais démarré
+    response.call_on_close(lambda: broker.unsubscribe(user_id, queue))
+
+    return response
+
+
+def init_events(app):
+    # layout.html : les pages n'ouvrent /events que si LIVE_EVENTS est activé
+    app.jinja_env.globals["live_events"] = LIVE_EVENTS
@@ -0,0 +1,102 @@
+import math
+
+
+# ===========================================
+# Validation des clients, projets et tâches
+# ===========================================
+# Règles partagées par les formulaires, l'import CSV et l'API.
+# Chaque fonction renvoie (valeurs, None) ou (None, message d'erreur).
+
+def field(data, name):
+    # Les valeurs JSON peuvent être des nombres : tout est ramené à du texte
+    value = data.get(name)
+
+    return "" if value is None else str(value).strip()
+
+
+def to_number(value):
+    try:
+        number = float(str(value).replace(",", "."))
+    except ValueError:
+        return None
+
+    # "nan", "inf" : acceptés par float, refusés comme temps ou taux horaire
+    return number if math.isfinite(number) else None
+
+
+def to_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def clean_client(data):
+    client = dict(
+        lastname=field(data, "lastname").upper(),
+        firstname=field(data, "firstname").capitalize(),
+        enterprise=field(data, "enterprise"),
+        address=field(data, "address"),
+        zip_code=field(data, "zip_code"),
+        city=field(data, "city").capitalize(),
+        country=field(data, "country").capitalize(),
+        phone_number=field(data, "phone_number"),
+        email=field(data, "email").lower(),
+        note=field(data, "note")
+    )
+
+    if not client["lastname"]:
+        return None, "Le nom est obligatoire."
+    if not client["firstname"]:
+        return None, "Le prénom est obligatoire."
+    if not client["phone_number"]:
+        return None, "Le numéro de téléphone est obligatoire."
+    if not client["email"]:
+        return None, "L'email est obligatoire."
+
+    return client, None
+
+
+def clean_project(data):
+    project = dict(
+        name_project=field(data, "name_project"),
+        description=field(data, "description"),
+        url=field(data, "url") or "Aucune",
+        hosting_server=field(data, "hosting_server") or "Aucun",
+        status=field(data, "status"),
+        hourly_rate=to_number(field(data, "hourly_rate") or 0),
+        client_id=to_id(field(data, "client"))
+    )
+
+    if not project["name_project"]:
+        return None, "Le nom est obligatoire."
+    if not project["description"]:
+        return None, "La description est obligatoire."
+    if not project["status"]:
+        return None, "Le statut est obligatoire."
+    if project["hourly_rate"] is None:
+        return None, "Le tarif horaire doit être un nombre."
+    if not project["client_id"]:
+        return None, "Le client est obligatoire."
+
+    return project, None
+
+
+def clean_task(data):
+    task = dict(
+        name_task=field(data, "name_task"),
+        status=field(data, "status"),
+        time_spent=to_number(field(data, "time_spent") or 0),
+        project_id=to_id(field(data, "project"))
+    )
+
+    if not task["name_task"]:
+        return None, "Le nom est obligatoire."
+    if not task["status"]:
+        return None, "Le statut est obligatoire."
+    if task["time_spent"] is None:
+        return None, "Le temps passé doit être un nombre."
+    if not task["project_id"]:
+        return None, "Le projet est obligatoire."
+
+    return task, None
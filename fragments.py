@@ -0,0 +1,66 @@
+from flask_login import current_user
+from markupsafe import Markup
+from sqlalchemy import text
+
+from cache import FragmentCache
+from shards import current_shard
+from totals import column_names
+
+import os
+
+
+# ====================================
+# Cache des lignes de tableau (HTML)
+# ====================================
+# Chaque client, projet et tâche porte un row_version incrémenté par trigger à chaque UPDATE
+# (formulaires, API, mais aussi temps total et temps passé recalculés par les autres triggers).
+# Une ligne rendue est gardée sous la clé (shard, table, id, compte, nom du fragment, row_version) :
+# une ligne modifiée change de clé, l'ancienne sort du LRU ou est évincée par la route.
+# Les id ne sont uniques que dans un shard (voir database.py) : le shard fait partie de la clé ;
+# ils ne sont jamais réutilisés (AUTOINCREMENT, voir models.py) et le compte connecté fait aussi
+# partie de la clé : une ligne mise en cache n'est jamais rendue à un autre compte.
+VERSIONED_TABLES = ("clients", "projects", "tasks")
+
+fragment_cache = FragmentCache(maxbytes=int(os.environ.get("FRAGMENT_CACHE_BYTES", 8 * 1024 * 1024)))
+
+
+def trigger(table):
+    # WHEN évite de se redéclencher sur sa propre mise à jour
+    return f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_row_version AFTER UPDATE ON {table}
+        WHEN new.row_version = old.row_version BEGIN
+            UPDATE {table} SET row_version = old.row_version + 1 WHERE id = new.id;
+        END
+    """
+
+
+def install_fragments(connection):
+    for table in VERSIONED_TABLES:
+        if "row_version" not in column_names(connection, table):
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN row_version INTEGER NOT NULL DEFAULT 0"))
+
+        connection.execute(text(trigger(table)))
+
+
+def cached(name, entity, caller):
+    # {% call cached("nom", entite) %}<tr>...</tr>{% endcall %}
+    key = (current_shard(), entity.__tablename__, entity.id, current_user.id, name, entity.row_version)
+    html = fragment_cache.get(key)
+
+    if html is None:
+        html = Markup(caller())
+        fragment_cache.set(key, html)
+
+    return html
+
+
+def init_fragments(app):
+    app.jinja_env.globals["cached"] = cached
+
+
+def evict(kind, *ids, shard=None):
+    # Lignes supprimées ou modifiées, pour tous les comptes ; dans ce processus seulement
+    shard = shard or current_shard()
+
+    for entity_id in ids:
+        fragment_cache.evict(shard, kind, entity_id)
@@ -0,0 +1,30 @@
+from prometheus_client import multiprocess
+
+import os
+import shutil
+
+
+# =====================================
+# Métriques Prometheus multi-processus
+# =====================================
+# Chargé automatiquement par gunicorn depuis le dossier courant.
+def on_starting(server):
+    # Valeurs d'un démarrage précédent : repartir d'un dossier vide
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)
+
+
+# ===================
+# Threads des workers
+# ===================
+def post_fork(server, worker):
+    # Flux SSE simultanés par worker (voir events.py) : calculés d'après --threads
+    os.environ["WORKER_THREADS"] = str(server.cfg.threads)
@@ -0,0 +1,131 @@
+from collections import Counter
+from flask import before_render_template, current_app, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from database import env_flag
+
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 200))
+N_PLUS_ONE_THRESHOLD = int(os.environ.get("N_PLUS_ONE_THRESHOLD", 5))
+DETECT_N_PLUS_ONE = env_flag("DETECT_N_PLUS_ONE", False)
+SERVER_TIMING = env_flag("SERVER_TIMING", True)
+
+IN_LIST = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)|\(__\[POSTCOMPILE_\w+\]\)")
+SPACES = re.compile(r"\s+")
+
+
+# ================================
+# Instrumentation SQL par requête
+# ================================
+# Les événements sont posés sur la classe Engine : tous les moteurs sont couverts.
+# Pour chaque requête HTTP : nombre de requêtes SQL, temps SQL, temps de rendu des gabarits,
+# renvoyés dans l'en-tête Server-Timing. Les requêtes plus lentes que SLOW_QUERY_MS sont journalisées.
+# En debug / test (ou DETECT_N_PLUS_ONE) : une même forme de requête répétée plus de
+# N_PLUS_ONE_THRESHOLD fois dans une requête HTTP est signalée (N+1).
+class RequestStats:
+    __slots__ = ("started", "queries", "db_time", "template_time", "template_started", "shapes")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_started = None
+        self.shapes = Counter()
+
+
+def current_stats():
+    return g.get("request_stats") if has_request_context() else None
+
+
+def statement_shape(statement):
+    # Les listes IN de longueur variable ont toutes la même forme
+    return IN_LIST.sub("(?)", SPACES.sub(" ", statement).strip())
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.query_started = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "query_started", None)
+    if started is None:
+        return
+
+    elapsed = time.perf_counter() - started
+    stats = current_stats()
+
+    if elapsed * 1000 > SLOW_QUERY_MS:
+        logger.warning(
+            "Requête SQL lente (%.1f ms) sur %s : %s",
+            elapsed * 1000, request.path if stats is not None else "-", SPACES.sub(" ", statement)
+        )
+
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+
+        if stats.shapes is not None:
+            stats.shapes[statement_shape(statement)] += 1
+
+
+def start_template(sender, template, context, **extra):
+    stats = current_stats()
+    if stats is not None:
+        stats.template_started = time.perf_counter()
+
+
+def end_template(sender, template, context, **extra):
+    stats = current_stats()
+    if stats is not None and stats.template_started is not None:
+        stats.template_time += time.perf_counter() - stats.template_started
+        stats.template_started = None
+
+
+def init_instrumentation(app):
+    if not event.contains(Engine, "before_cursor_execute", before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+
+    before_render_template.connect(start_template, app)
+    template_rendered.connect(end_template, app)
+
+    @app.before_request
+    def start_request_stats():
+        g.request_stats = RequestStats()
+
+        # Compter les formes de requêtes coûte un peu : seulement en debug / test
+        if not (current_app.debug or current_app.testing or DETECT_N_PLUS_ONE):
+            g.request_stats.shapes = None
+
+    @app.after_request
+    def server_timing(response):
+        stats = current_stats()
+
+        if SERVER_TIMING and stats is not None:
+            response.headers["Server-Timing"] = (
+                f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} SQL", '
+                f"template;dur={stats.template_time * 1000:.1f}, "
+                f"total;dur={(time.perf_counter() - stats.started) * 1000:.1f}"
+            )
+
+        return response
+
+    @app.teardown_request
+    def detect_n_plus_one(exception):
+        # Après le corps : les réponses en streaming ont fini leurs requêtes
+        stats = current_stats()
+        if stats is None or not stats.shapes:
+            return
+
+        for shape, count in stats.shapes.items():
+            if count > N_PLUS_ONE_THRESHOLD:
+                logger.warning("N+1 probable sur %s : %d fois « %s »", request.path, count, shape)
@@ -0,0 +1,214 @@
+from contextlib import ExitStack
+from datetime import timedelta
+from flask import current_app
+from flask_mail import Message
+from sqlalchemy import or_, select, update
+from threading import Event, Lock, Thread
+
+from database import env_flag, session, utcnow
+from metrics import mail_errors, mail_seconds, mail_sent
+from models import OutboxEmail
+
+import click
+import logging
+import os
+import smtplib
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.environ.get("MAIL_OUTBOX_BATCH_SIZE", 20))
+MAX_ATTEMPTS = int(os.environ.get("MAIL_OUTBOX_MAX_ATTEMPTS", 8))
+POLL_INTERVAL = float(os.environ.get("MAIL_OUTBOX_POLL_INTERVAL", 5))
+IDLE_TIMEOUT = float(os.environ.get("MAIL_OUTBOX_IDLE_TIMEOUT", 60))
+CLAIM_TIMEOUT = timedelta(minutes=5)
+
+
+def backoff(attempts):
+    # 30 s, 1 min, 2 min, ... plafonné à 1 h
+    return timedelta(seconds=min(30 * 2 ** (attempts - 1), 3600))
+
+
+# ==========================
+# Mise en file d'un e-mail
+# ==========================
+def queue_email(recipient, subject, html):
+    # Ajouté à la session courante : enregistré dans la même transaction que la modification
+    now = utcnow()
+
+    session.add(OutboxEmail(
+        recipient=recipient,
+        subject=subject,
+        html=html,
+        next_attempt_at=now,
+        created_at=now
+    ))
+
+
+# ====================
+# Envoi de la file
+# ====================
+def claim_batch(limit):
+    # Réserve un lot d'e-mails dus ; une seule écriture, sûre entre plusieurs workers
+    now = utcnow()
+    token = uuid.uuid4().hex
+
+    due = (
+        select(OutboxEmail.id)
+        .where(
+            OutboxEmail.status == "pending",
+            OutboxEmail.next_attempt_at <= now,
+            or_(OutboxEmail.claimed_until.is_(None), OutboxEmail.claimed_until < now)
+        )
+        .order_by(OutboxEmail.id)
+        .limit(limit)
+    )
+
+    session.execute(
+        update(OutboxEmail)
+        .where(OutboxEmail.id.in_(due))
+        .values(claimed_by=token, claimed_until=now + CLAIM_TIMEOUT)
+    )
+    session.commit()
+
+    return session.scalars(
+        select(OutboxEmail).where(OutboxEmail.claimed_by == token).order_by(OutboxEmail.id)
+    ).all()
+
+
+def mark_failed(email, error):
+    email.attempts += 1
+    email.last_error = str(error)
+    email.claimed_by = None
+    email.claimed_until = None
+
+    if email.attempts >= MAX_ATTEMPTS:
+        email.status = "failed"
+        logger.error("E-mail %s abandonné après %s essais : %s", email.id, email.attempts, error)
+    else:
+        email.next_attempt_at = utcnow() + backoff(email.attempts)
+
+
+class OutboxSender:
+    def __init__(self):
+        self._connection = None
+        self._stack = ExitStack()
+        self._lock = Lock()
+        self._start_lock = Lock()
+        self._wakeup = Event()
+        self._thread = None
+
+    # Connexion SMTP gardée ouverte entre les lots
+    def connection(self):
+        if self._connection is None:
+            self._connection = self._stack.enter_context(current_app.extensions["mail"].connect())
+
+        return self._connection
+
+    def close(self):
+        try:
+            self._stack.close()
+        except smtplib.SMTPException:
+            pass
+
+        self._connection = None
+
+    def deliver(self, email):
+        msg = Message(email.subject, recipients=[email.recipient], html=email.html)
+
+        try:
+            self.connection().send(msg)
+        except smtplib.SMTPServerDisconnected:
+            # Connexion fermée par le serveur pendant l'inactivité : on rouvre une fois
+            self.close()
+            self.connection().send(msg)
+
+    def send_batch(self, limit=BATCH_SIZE):
+        with self._lock:
+            emails = claim_batch(limit)
+
+            for email in emails:
+                started = time.perf_counter()
+
+                try:
+                    self.deliver(email)
+                except (smtplib.SMTPException, OSError) as ex:
+                    mail_errors.labels(type(ex).__name__).inc()
+                    self.close()
+                    mark_failed(email, ex)
+                else:
+                    mail_seconds.observe(time.perf_counter() - started)
+                    mail_sent.inc()
+                    email.status = "sent"
+                    email.sent_at = utcnow()
+                    email.claimed_by = None
+                    email.claimed_until = None
+
+                session.commit()
+
+            return len(emails)
+
+    def wake(self):
+        self._wakeup.set()
+
+    def start(self, app):
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self.run, args=(app,), name="mail-outbox", daemon=True)
+                self._thread.start()
+
+    def run(self, app):
+        idle_since = None
+
+        while True:
+            try:
+                with app.app_context():
+                    sent = self.send_batch()
+
+                    if sent:
+                        idle_since = None
+                        continue
+
+                    if idle_since is None:
+                        idle_since = utcnow()
+                    elif (utcnow() - idle_since).total_seconds() > IDLE_TIMEOUT:
+                        self.close()
+
+            except Exception:
+                logger.exception("Erreur dans l'envoi de la file d'e-mails")
+                self.close()
+
+            self._wakeup.wait(POLL_INTERVAL)
+            self._wakeup.clear()
+
+
+outbox_sender = OutboxSender()
+
+
+def init_mailer(app):
+    # Thread d'envoi démarré à la première requête (après le fork des workers gunicorn)
+    if env_flag("MAIL_OUTBOX_WORKER", True):
+        @app.before_request
+        def start_outbox_sender():
+            outbox_sender.start(app)
+
+    @app.cli.command("send-outbox")
+    def send_outbox_command():
+        """Envoie tous les e-mails en attente puis s'arrête."""
+        total = 0
+
+        try:
+            while True:
+                sent = outbox_sender.send_batch()
+                total += sent
+
+                if not sent:
+                    break
+        finally:
+            outbox_sender.close()
+
+        click.echo(f"{total} e-mail(s) traité(s).")
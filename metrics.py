@@ -0,0 +1,109 @@
+from dotenv import load_dotenv
+
+# PROMETHEUS_MULTIPROC_DIR doit être connu avant d'importer prometheus_client
+load_dotenv()
+
+from flask import Response, g, request
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import REGISTRY, multiprocess
+from sqlalchemy import event
+
+import os
+import time
+
+
+# ========================
+# Métriques Prometheus
+# ========================
+# Avec plusieurs workers gunicorn, PROMETHEUS_MULTIPROC_DIR pointe vers un dossier partagé :
+# chaque processus y écrit ses valeurs et /metrics les additionne (voir gunicorn.conf.py).
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+if MULTIPROCESS:
+    # Hors gunicorn (commandes flask, scripts) le dossier peut ne pas encore exister
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+requests_total = Counter(
+    "hackdesk_requests_total", "Requêtes HTTP traitées", ["endpoint", "method", "status"]
+)
+request_seconds = Histogram(
+    "hackdesk_request_duration_seconds", "Durée des requêtes HTTP", ["endpoint", "method"], buckets=LATENCY_BUCKETS
+)
+template_seconds = Histogram(
+    "hackdesk_template_render_seconds", "Temps de rendu des gabarits par requête", ["endpoint"], buckets=LATENCY_BUCKETS
+)
+db_seconds = Histogram(
+    "hackdesk_db_seconds", "Temps passé en SQL par requête", ["endpoint"], buckets=LATENCY_BUCKETS
+)
+
+pool_size = Gauge("hackdesk_db_pool_size", "Taille du pool de connexions", multiprocess_mode="livesum")
+pool_checked_out = Gauge("hackdesk_db_pool_checked_out", "Connexions empruntées", multiprocess_mode="livesum")
+pool_overflow = Gauge("hackdesk_db_pool_overflow", "Connexions ouvertes au-delà du pool", multiprocess_mode="livesum")
+
+commit_failures = Counter("hackdesk_db_commit_failures_total", "session.commit() en échec")
+
+mail_seconds = Histogram("hackdesk_mail_send_seconds", "Durée d'envoi d'un e-mail", buckets=LATENCY_BUCKETS)
+mail_sent = Counter("hackdesk_mail_sent_total", "E-mails envoyés")
+mail_errors = Counter("hackdesk_mail_errors_total", "Envois d'e-mail en échec", ["error"])
+
+
+def observe_pool(engine):
+    pool = engine.pool
+
+    # StaticPool / SingletonThreadPool (SQLite en mémoire) n'ont ni taille ni débordement
+    if hasattr(pool, "size"):
+        pool_size.set(pool.size())
+
+    def update_overflow():
+        if hasattr(pool, "overflow"):
+            pool_overflow.set(max(pool.overflow(), 0))
+
+    @event.listens_for(engine, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        pool_checked_out.inc()
+        update_overflow()
+
+    @event.listens_for(engine, "checkin")
+    def checkin(dbapi_connection, connection_record):
+        pool_checked_out.dec()
+        update_overflow()
+
+
+def metrics_response():
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def init_metrics(app):
+    # Le pool est observé à la création du moteur (database.get_engine)
+    from instrumentation import current_stats
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        endpoint = request.endpoint or "inconnu"
+
+        requests_total.labels(endpoint, request.method, response.status_code).inc()
+        if "metrics_started" in g:
+            request_seconds.labels(endpoint, request.method).observe(time.perf_counter() - g.metrics_started)
+
+        return response
+
+    @app.teardown_request
+    def record_request_stats(exception):
+        # Temps SQL et de rendu mesurés par instrumentation.py (réponses en streaming comprises)
+        stats = current_stats()
+        if stats is not None:
+            endpoint = request.endpoint or "inconnu"
+            template_seconds.labels(endpoint).observe(stats.template_time)
+            db_seconds.labels(endpoint).observe(stats.db_time)
@@ -0,0 +1,252 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateTable
+
+from database import get_engine, shard_names, utcnow
+from fragments import install_fragments
+from models import Base, PurgeJob, UserShard
+from rollups import install_rollups
+from search import install_search
+from totals import install_totals
+
+import click
+
+
+# =================================
+# Migrations de schéma versionnées
+# =================================
+# Lancées une fois, hors démarrage de l'application : `python migrations.py`.
+# Chaque migration s'exécute dans sa propre transaction et son numéro est noté dans
+# schema_migrations ; une base à jour ne coûte qu'une lecture de cette table.
+# Une base créée avant les migrations les repasse toutes : elles sont idempotentes.
+# Une nouvelle table ou colonne = une nouvelle migration en fin de liste (create_all ne
+# tourne qu'une fois, dans la migration 1).
+CREATE_TABLE = text("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name VARCHAR(150) NOT NULL,
+        applied_at DATETIME NOT NULL
+    )
+""")
+
+
+def create_tables(connection):
+    # Tables et index déclarés dans models.py
+    Base.metadata.create_all(connection)
+
+
+# Index sur des colonnes texte jamais filtrées (ou doublons de la clé primaire) :
+# chacun coûtait une écriture de plus à chaque INSERT / UPDATE
+UNUSED_INDEXES = [
+    "ix_users_id", "ix_users_lastname", "ix_users_firstname",
+    "ix_clients_id", "ix_clients_lastname", "ix_clients_firstname", "ix_clients_enterprise",
+    "ix_clients_zip_code", "ix_clients_phone_number", "ix_clients_email",
+    "ix_projects_id", "ix_projects_name_project",
+    "ix_tasks_id", "ix_tasks_name_task",
+]
+
+
+def access_path_indexes(connection):
+    # Index des chemins d'accès réels (user_id, project_id, client_id...) : voir models.py
+    for name in UNUSED_INDEXES:
+        connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def purge_jobs(connection):
+    # Suppression des gros comptes par lots (voir purge.py)
+    if "deleted_at" not in [column["name"] for column in inspect(connection).get_columns("users")]:
+        connection.execute(text("ALTER TABLE users ADD COLUMN deleted_at DATETIME"))
+
+    PurgeJob.__table__.create(connection, checkfirst=True)
+
+
+# Tables dont les clés étrangères passent en ON DELETE CASCADE, parents d'abord
+CASCADE_TABLES = ["clients", "projects", "tasks", "api_tokens", "time_entries"]
+
+
+def rebuild_table(connection, name):
+    # SQLite ne modifie pas une clé étrangère existante : nouvelle table, copie, échange
+    table = Base.metadata.tables[name]
+    existing = {column["name"] for column in inspect(connection).get_columns(name)}
+    columns = ", ".join(column.name for column in table.columns if column.name in existing)
+    ddl = str(CreateTable(table).compile(connection)).replace(f"CREATE TABLE {name} (", f"CREATE TABLE {name}_new (", 1)
+
+    connection.execute(text(ddl))
+    connection.execute(text(f"INSERT INTO {name}_new ({columns}) SELECT {columns} FROM {name}"))
+    connection.execute(text(f"DROP TABLE {name}"))
+    connection.execute(text(f"ALTER TABLE {name}_new RENAME TO {name}"))
+
+    for index in table.indexes:
+        index.create(connection)
+
+
+def rebuild_tables(connection, names):
+    # Les triggers citent les tables reconstruites : supprimés puis réinstallés
+    triggers = connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger'")).scalars().all()
+    for trigger in triggers:
+        connection.execute(text(f"DROP TRIGGER {trigger}"))
+
+    for name in names:
+        rebuild_table(connection, name)
+
+    install_search(connection)
+    install_totals(connection)
+    install_rollups(connection)
+    install_fragments(connection)
+
+
+def cascade_deletes(connection):
+    rebuilt = [
+        name for name in CASCADE_TABLES
+        if any(row[6] != "CASCADE" for row in connection.execute(text(f"PRAGMA foreign_key_list({name})")))
+    ]
+
+    if not rebuilt:
+        return
+
+    rebuild_tables(connection, rebuilt)
+
+    # Lignes orphelines (parent supprimé hors ORM) : supprimées, triggers compris, jusqu'à la dernière
+    while orphans := connection.execute(text("PRAGMA foreign_key_check")).all():
+        for table, rowid, _, _ in orphans:
+            connection.execute(text(f"DELETE FROM {table} WHERE rowid = :rowid"), {"rowid": rowid})
+
+
+# Tables des lignes mises en cache (voir fragments.py)
+AUTOINCREMENT_TABLES = ["clients", "projects", "tasks"]
+
+
+def autoincrement_ids(connection):
+    # Sans AUTOINCREMENT, SQLite redonne le plus grand id libéré à l'insertion suivante
+    rebuilt = [
+        name for name in AUTOINCREMENT_TABLES
+        if "AUTOINCREMENT" not in connection.execute(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": name}
+        ).scalar().upper()
+    ]
+
+    if rebuilt:
+        rebuild_tables(connection, rebuilt)
+
+
+def user_shards(connection):
+    # Annuaire des shards (voir shards.py) ; créée aussi dans les shards, vide
+    UserShard.__table__.create(connection, checkfirst=True)
+
+
+def sqlite_only(install):
+    def migration(connection):
+        # FTS5 et triggers : SQLite uniquement
+        if connection.dialect.name == "sqlite":
+            install(connection)
+
+    return migration
+
+
+MIGRATIONS = [
+    (1, "tables", create_tables),
+    (2, "recherche plein texte", sqlite_only(install_search)),
+    (3, "temps total des projets", sqlite_only(install_totals)),
+    (4, "saisies de temps et agrégats", sqlite_only(install_rollups)),
+    (5, "versions des lignes", sqlite_only(install_fragments)),
+    (6, "index des chemins d'accès", access_path_indexes),
+    (7, "suppression des comptes par lots", purge_jobs),
+    (8, "suppressions en cascade", sqlite_only(cascade_deletes)),
+    (9, "annuaire des shards", user_shards),
+    (10, "id jamais réutilisés", sqlite_only(autoincrement_ids)),
+]
+
+
+def applied_versions(connection):
+    connection.execute(CREATE_TABLE)
+
+    return {row[0] for row in connection.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def pending_migrations(engine=None):
+    with (engine or get_engine()).begin() as connection:
+        applied = applied_versions(connection)
+
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+
+def apply(connection, version, name, migration):
+    migration(connection)
+    connection.execute(
+        text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:version, :name, :now)"),
+        {"version": version, "name": name, "now": utcnow()}
+    )
+
+
+def apply_sqlite(connection, version, name, migration):
+    # Reconstruction de tables : contrôle des clés étrangères coupé (possible hors transaction
+    # seulement), puis vérifié avant le commit : la migration ne doit pas créer d'orphelins.
+    # BEGIN explicite : pysqlite n'en ouvre pas avant un CREATE / DROP, la migration ne serait
+    # pas annulée d'un bloc.
+    connection.exec_driver_sql("PRAGMA foreign_keys=OFF")
+    connection.exec_driver_sql("BEGIN")
+
+    try:
+        before = set(connection.exec_driver_sql("PRAGMA foreign_key_check").all())
+        apply(connection, version, name, migration)
+
+        violations = set(connection.exec_driver_sql("PRAGMA foreign_key_check").all()) - before
+        if violations:
+            raise RuntimeError(f"Migration {version} : {len(violations)} clé(s) étrangère(s) invalide(s)")
+
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.exec_driver_sql("PRAGMA foreign_keys=ON")
+
+
+def migrate(engine=None):
+    engine = engine or get_engine()
+    pending = pending_migrations(engine)
+
+    for version, name, migration in pending:
+        with engine.connect() as connection:
+            if connection.dialect.name == "sqlite":
+                apply_sqlite(connection, version, name, migration)
+            else:
+                with connection.begin():
+                    apply(connection, version, name, migration)
+
+    return [(version, name) for version, name, _ in pending]
+
+
+@click.command()
+@click.option("--check", is_flag=True, help="Liste les migrations en attente sans les appliquer (code 1 s'il y en a).")
+def main(check):
+    """Met à jour le schéma de la base principale et de chaque shard (DB_SHARDS)."""
+    if check:
+        pending = [(shard, migration) for shard in shard_names() for migration in pending_migrations(get_engine(shard))]
+
+        for shard, (version, name, _) in pending:
+            click.echo(f"En attente ({shard}) : {version} {name}")
+
+        if pending:
+            raise SystemExit(1)
+
+        click.echo("Schéma à jour.")
+        return
+
+    total = 0
+
+    for shard in shard_names():
+        applied = migrate(get_engine(shard))
+        total += len(applied)
+
+        for version, name in applied:
+            click.echo(f"Appliquée ({shard}) : {version} {name}")
+
+    click.echo(f"{total} migration(s) appliquée(s).")
+
+
+if __name__ == "__main__":
+    main()
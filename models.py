@@ -1,5 +1,6 @@
 from flask_login import UserMixin
-from sqlalchemy import Column, Date, Float, ForeignKey, Integer, String, Text
+from sqlalchemy import Boolean, Column, Date, DateTime, Float, ForeignKey, Index, Integer, String, Text
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
@@ -7,42 +8,58 @@ Base = declarative_base()
 class User(Base, UserMixin):
     __tablename__ = 'users'
 
-    id = Column(Integer, primary_key=True, index=True)
-    lastname = Column(String(150), nullable=False, index=True)
-    firstname = Column(String(150), nullable=False, index=True)
+    id = Column(Integer, primary_key=True)
+    lastname = Column(String(150), nullable=False)
+    firstname = Column(String(150), nullable=False)
     email = Column(String(150), nullable=False, index=True, unique=True)
     password = Column(String(200), nullable=False)
 
-    clients = relationship("Client", back_populates="user", cascade="all, delete-orphan")
-    projects = relationship("Project", back_populates="user", cascade="all, delete-orphan")
+    # Compte en cours de suppression par lots (voir purge.py) : plus de connexion possible
+    deleted_at = Column(DateTime)
+
+    # passive_deletes : les enfants ne sont pas chargés, la base les supprime (ON DELETE CASCADE)
+    clients = relationship("Client", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    projects = relationship("Project", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    api_tokens = relationship("ApiToken", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class Client(Base):
     __tablename__ = 'clients'
+    # Id jamais réutilisés : un id supprimé ne désigne pas une autre ligne (voir fragments.py)
+    __table_args__ = {"sqlite_autoincrement": True}
 
-    id = Column(Integer, primary_key=True, index=True)
-    lastname = Column(String(150), nullable=False, index=True)
-    firstname = Column(String(150), nullable=False, index=True)
-    enterprise = Column(String(150), index=True)
+    id = Column(Integer, primary_key=True)
+    lastname = Column(String(150), nullable=False)
+    firstname = Column(String(150), nullable=False)
+    enterprise = Column(String(150))
     address = Column(String(250))
-    zip_code = Column(String(20), index=True)
+    zip_code = Column(String(20))
     city = Column(String(150))
     country = Column(String(150))
-    phone_number = Column(String(20), index=True)
-    email = Column(String(150), index=True)
+    phone_number = Column(String(20))
+    email = Column(String(150))
     note = Column(Text)
 
-    user_id = Column(Integer, ForeignKey("users.id"))
+    # Incrémenté par trigger à chaque modification (voir fragments.py)
+    row_version = Column(Integer, default=0, server_default="0", nullable=False)
+
+    # Listes et tableau de bord : les clients d'un utilisateur, par id
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True)
 
     user = relationship("User", back_populates="clients")
 
-    projects = relationship("Project", back_populates="client", cascade="all, delete-orphan")
+    projects = relationship("Project", back_populates="client", cascade="all, delete-orphan", passive_deletes=True)
 
 class Project(Base):
     __tablename__ = 'projects'
-
-    id = Column(Integer, primary_key=True, index=True)
-    name_project = Column(String(150), nullable=False, index=True)
+    __table_args__ = (
+        # Tableau de bord : comptes par statut sans lire les lignes
+        Index("ix_projects_user_id_status", "user_id", "status"),
+        {"sqlite_autoincrement": True},
+    )
+
+    id = Column(Integer, primary_key=True)
+    name_project = Column(String(150), nullable=False)
     description = Column(Text)
     url = Column(String(250))
     hosting_server = Column(String(150))
@@ -50,30 +67,150 @@ class Project(Base):
     
     hourly_rate = Column(Float, default=0.0, nullable=False)
 
-    user_id = Column(Integer, ForeignKey("users.id"))
-    client_id = Column(Integer, ForeignKey("clients.id"))
+    # Somme des time_spent des tâches, tenue à jour par des triggers (voir totals.py)
+    total_time = Column(Float, default=0.0, server_default="0", nullable=False)
+
+    # Incrémenté par trigger à chaque modification (voir fragments.py)
+    row_version = Column(Integer, default=0, server_default="0", nullable=False)
+
+    # Listes paginées par id (l'id suit user_id dans l'index), fiche client
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    client_id = Column(Integer, ForeignKey("clients.id", ondelete="CASCADE"), index=True)
 
     user = relationship("User", back_populates="projects")
     client = relationship("Client", back_populates="projects")
 
-    tasks = relationship("Task", back_populates="projects", cascade="all, delete-orphan")
+    tasks = relationship("Task", back_populates="projects", cascade="all, delete-orphan", passive_deletes=True)
 
-    @property
-    def total_time(self):
-        return sum(task.time_spent for task in self.tasks)
-    
-    @property
+    @hybrid_property
     def total_cost(self):
         return self.total_time * self.hourly_rate
-    
+
 class Task(Base):
     __tablename__ = 'tasks'
+    __table_args__ = {"sqlite_autoincrement": True}
 
-    id = Column(Integer, primary_key=True, index=True)
-    name_task = Column(String(150), nullable=False, index=True)
+    id = Column(Integer, primary_key=True)
+    name_task = Column(String(150), nullable=False)
     status = Column(String(50))
     time_spent = Column(Float, default=0.0, nullable=False)
-    
-    project_id = Column(Integer, ForeignKey("projects.id"))
 
-    projects = relationship("Project", back_populates="tasks")
\ No newline at end of file
+    # Incrémenté par trigger à chaque modification (voir fragments.py)
+    row_version = Column(Integer, default=0, server_default="0", nullable=False)
+
+    project_id = Column(Integer, ForeignKey("projects.id", ondelete="CASCADE"), index=True)
+
+    projects = relationship("Project", back_populates="tasks")
+
+
+class ApiToken(Base):
+    __tablename__ = 'api_tokens'
+
+    id = Column(Integer, primary_key=True)
+    # Seul le SHA-256 du jeton est stocké
+    token_hash = Column(String(64), nullable=False, unique=True, index=True)
+    created_at = Column(DateTime, nullable=False)
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+
+    user = relationship("User", back_populates="api_tokens")
+
+
+class OutboxEmail(Base):
+    __tablename__ = 'outbox_emails'
+
+    id = Column(Integer, primary_key=True)
+    recipient = Column(String(150), nullable=False)
+    subject = Column(String(250), nullable=False)
+    html = Column(Text, nullable=False)
+
+    # pending -> sent, ou failed après MAIL_OUTBOX_MAX_ATTEMPTS essais
+    status = Column(String(20), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text)
+    next_attempt_at = Column(DateTime, nullable=False, index=True)
+    claimed_by = Column(String(32))
+    claimed_until = Column(DateTime)
+    created_at = Column(DateTime, nullable=False)
+    sent_at = Column(DateTime)
+
+
+class TimeEntry(Base):
+    __tablename__ = 'time_entries'
+
+    id = Column(Integer, primary_key=True)
+    started_at = Column(DateTime, nullable=False)
+    # En heures ; une correction peut être négative
+    duration = Column(Float, nullable=False)
+
+    task_id = Column(Integer, ForeignKey("tasks.id", ondelete="CASCADE"), nullable=False, index=True)
+
+    # Recopiés depuis la tâche pour mettre à jour les agrégats sans jointure
+    project_id = Column(Integer, nullable=False)
+    client_id = Column(Integer)
+    user_id = Column(Integer, nullable=False)
+
+
+# Agrégats tenus à jour par des triggers sur time_entries (voir rollups.py)
+# Clé (user_id, jour, projet) : un rapport sur une période est un parcours d'index
+class DailyRollup(Base):
+    __tablename__ = 'daily_rollups'
+
+    user_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    project_id = Column(Integer, primary_key=True)
+    client_id = Column(Integer)
+    hours = Column(Float, nullable=False, default=0.0)
+
+
+class WeeklyRollup(Base):
+    __tablename__ = 'weekly_rollups'
+
+    user_id = Column(Integer, primary_key=True)
+    # Lundi de la semaine
+    week = Column(Date, primary_key=True)
+    project_id = Column(Integer, primary_key=True)
+    client_id = Column(Integer)
+    hours = Column(Float, nullable=False, default=0.0)
+
+
+
+class UserVersion(Base):
+    __tablename__ = 'user_versions'
+
+    # Sans clé étrangère : la version reste croissante même après suppression du compte
+    user_id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False)
+
+
+# Suppression d'un gros compte, par lots, en tâche de fond (voir purge.py)
+class PurgeJob(Base):
+    __tablename__ = 'purge_jobs'
+
+    id = Column(Integer, primary_key=True)
+    # Sans clé étrangère : le compte est supprimé à la fin du travail
+    user_id = Column(Integer, nullable=False)
+
+    # pending -> done
+    status = Column(String(20), nullable=False, default="pending")
+    # Clients, projets et tâches à supprimer / déjà supprimés
+    total = Column(Integer, nullable=False, default=0)
+    deleted = Column(Integer, nullable=False, default=0)
+    claimed_by = Column(String(32))
+    claimed_until = Column(DateTime)
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime)
+
+
+# Annuaire des shards (voir shards.py), dans la base principale.
+# Sans ligne : les données de l'utilisateur sont dans la base principale.
+class UserShard(Base):
+    __tablename__ = 'user_shards'
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    shard = Column(String(50), nullable=False)
+    # Déplacement en cours (flask move-user) : lectures sur l'ancien shard, écritures refusées
+    moving = Column(Boolean, nullable=False, default=False, server_default="0")
+    updated_at = Column(DateTime, nullable=False)
@@ -0,0 +1,67 @@
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+from pools import ProcessPool
+
+import os
+
+
+# ==========================================
+# Hachage des mots de passe hors du thread
+# ==========================================
+# scrypt / pbkdf2 sont volontairement lents : ils tournent dans un pool de processus
+# de taille fixe (voir pools.py). Au-delà de PASSWORD_HASH_WORKERS calculs en cours et
+# d'autant en attente, une requête attend au plus PASSWORD_HASH_TIMEOUT secondes puis
+# reçoit PasswordBusy.
+# PASSWORD_HASH_WORKERS=0 calcule directement dans le thread de la requête.
+HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+HASH_TIMEOUT = float(os.environ.get("PASSWORD_HASH_TIMEOUT", 2))
+
+
+class PasswordBusy(Exception):
+    pass
+
+
+def normalized_method(method):
+    # Préfixe complet tel que werkzeug l'écrit dans le hash ("scrypt:32768:8:1$...")
+    name, *params = method.split(":")
+
+    if name == "scrypt":
+        return method if params else "scrypt:32768:8:1"
+    if name == "pbkdf2":
+        params = params or ["sha256"]
+        return ":".join([name, params[0], params[1] if len(params) > 1 else str(DEFAULT_PBKDF2_ITERATIONS)])
+
+    return method
+
+
+METHOD = normalized_method(HASH_METHOD)
+
+
+def needs_rehash(stored, method=METHOD):
+    return stored.split("$", 1)[0] != method
+
+
+# Fonctions exécutées dans les processus du pool
+def hash_job(password, method):
+    return generate_password_hash(password, method)
+
+
+def verify_job(stored, password, method):
+    # Vérification et, si les paramètres ont changé, nouveau hash dans le même aller-retour
+    if not check_password_hash(stored, password):
+        return False, None
+
+    return True, generate_password_hash(password, method) if needs_rehash(stored, method) else None
+
+
+hash_pool = ProcessPool(HASH_WORKERS, HASH_TIMEOUT, PasswordBusy)
+
+
+def hash_password(password):
+    return hash_pool.run(hash_job, password, METHOD)
+
+
+def verify_password(stored, password):
+    # Renvoie (mot de passe correct, nouveau hash à enregistrer ou None)
+    return hash_pool.run(verify_job, stored, password, METHOD)
@@ -0,0 +1,56 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import BoundedSemaphore, Lock
+
+import multiprocessing
+import os
+
+
+# ================================
+# Pool de processus de taille fixe
+# ================================
+# Calculs lourds (hachage des mots de passe, rendu des rapports) exécutés hors du thread
+# de la requête. Au-delà de `workers` calculs en cours et d'autant en attente, une requête
+# attend au plus `timeout` secondes puis reçoit l'exception `busy`.
+# workers=0 calcule directement dans le thread de la requête.
+class ProcessPool:
+    def __init__(self, workers, timeout, busy):
+        self.workers = workers
+        self.timeout = timeout
+        self.busy = busy
+        self._pool = None
+        self._pid = None
+        self._lock = Lock()
+        self._slots = BoundedSemaphore(max(workers, 1) * 2)
+
+    def pool(self):
+        # Créé à la première utilisation, dans le worker gunicorn (après le fork)
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+                self._pid = os.getpid()
+
+            return self._pool
+
+    def run(self, job, *args):
+        if not self.workers:
+            return job(*args)
+
+        if not self._slots.acquire(timeout=self.timeout):
+            raise self.busy()
+
+        try:
+            return self.pool().submit(job, *args).result()
+        except BrokenProcessPool:
+            # Un processus a été tué : le pool sera recréé à la prochaine demande
+            with self._lock:
+                self._pool = None
+            raise self.busy()
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
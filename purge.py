@@ -0,0 +1,219 @@
+from datetime import timedelta
+from sqlalchemy import delete, func, or_, select, update
+from threading import Event, Lock, Thread
+
+from database import MAIN, env_flag, session, utcnow
+from fragments import evict
+from models import ApiToken, Client, Project, PurgeJob, Task, User
+from shards import drop_shard_user, shard_of, use_shard
+from users import user_changed
+
+import click
+import logging
+import os
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Au-delà de PURGE_THRESHOLD clients + projets + tâches, le compte est supprimé en tâche de fond
+PURGE_THRESHOLD = int(os.environ.get("PURGE_THRESHOLD", 5000))
+BATCH_SIZE = int(os.environ.get("PURGE_BATCH_SIZE", 500))
+POLL_INTERVAL = float(os.environ.get("PURGE_POLL_INTERVAL", 30))
+# Pause entre deux lots : les requêtes passent entre deux transactions (un seul écrivain SQLite)
+BATCH_PAUSE = float(os.environ.get("PURGE_BATCH_PAUSE", 0.05))
+CLAIM_TIMEOUT = timedelta(minutes=5)
+
+
+# ======================
+# Suppression de compte
+# ======================
+def account_size(user_id):
+    clients = select(func.count()).select_from(Client).where(Client.user_id == user_id)
+    projects = select(func.count()).select_from(Project).where(Project.user_id == user_id)
+    tasks = (
+        select(func.count()).select_from(Task)
+        .join(Project, Task.project_id == Project.id)
+        .where(Project.user_id == user_id)
+    )
+
+    return session.scalar(select(clients.scalar_subquery() + projects.scalar_subquery() + tasks.scalar_subquery()))
+
+
+def delete_account(user):
+    # Ajouté à la session courante, commit par l'appelant. Renvoie le travail de purge ou None.
+    size = account_size(user.id)
+
+    # Petit compte de la base principale : la base supprime clients, projets, tâches et saisies
+    # (ON DELETE CASCADE). Un compte d'un autre shard passe toujours par la purge.
+    if size < PURGE_THRESHOLD and shard_of(user.id) == MAIN:
+        session.delete(user)
+        return None
+
+    # Gros compte : fermé tout de suite (plus de connexion, e-mail libéré), vidé par lots
+    now = utcnow()
+    user.deleted_at = now
+    user.email = f"supprime-{user.id}@hackdesk.invalid"
+    user.password = "!"
+    session.execute(delete(ApiToken).where(ApiToken.user_id == user.id))
+
+    job = PurgeJob(user_id=user.id, status="pending", total=size, deleted=0, created_at=now, updated_at=now)
+    session.add(job)
+
+    return job
+
+
+# ====================
+# Purge par lots
+# ====================
+def claim_job():
+    # Réserve le plus ancien travail en attente ; sûr entre plusieurs workers
+    now = utcnow()
+    token = uuid.uuid4().hex
+
+    due = (
+        select(PurgeJob.id)
+        .where(
+            PurgeJob.status == "pending",
+            or_(PurgeJob.claimed_until.is_(None), PurgeJob.claimed_until < now)
+        )
+        .order_by(PurgeJob.id)
+        .limit(1)
+    )
+
+    session.execute(
+        update(PurgeJob)
+        .where(PurgeJob.id.in_(due))
+        .values(claimed_by=token, claimed_until=now + CLAIM_TIMEOUT)
+    )
+    session.commit()
+
+    return session.scalars(select(PurgeJob).where(PurgeJob.claimed_by == token)).first()
+
+
+def batch_statements(user_id, limit):
+    # Feuilles d'abord : un lot de tâches n'entraîne que leurs saisies de temps.
+    # Les id supprimés sont renvoyés, pour évincer les lignes du cache de fragments.
+    yield delete(Task).where(Task.id.in_(
+        select(Task.id).join(Project, Task.project_id == Project.id).where(Project.user_id == user_id).limit(limit)
+    )).returning(Task.id)
+    yield delete(Project).where(Project.id.in_(
+        select(Project.id).where(Project.user_id == user_id).limit(limit)
+    )).returning(Project.id)
+    yield delete(Client).where(Client.id.in_(
+        select(Client.id).where(Client.user_id == user_id).limit(limit)
+    )).returning(Client.id)
+
+
+def purge_batch(job, limit=BATCH_SIZE):
+    # Un lot par transaction ; renvoie le nombre de lignes supprimées, 0 une fois le compte vide
+    deleted = 0
+
+    for statement in batch_statements(job.user_id, limit):
+        ids = session.execute(statement, execution_options={"synchronize_session": False}).scalars().all()
+        deleted = len(ids)
+        if deleted:
+            evict(statement.table.name, *ids)
+            break
+
+    now = utcnow()
+    job.updated_at = now
+
+    if deleted:
+        job.deleted += deleted
+        job.claimed_until = now + CLAIM_TIMEOUT
+    else:
+        drop_shard_user(job.user_id)
+        session.execute(delete(User).where(User.id == job.user_id))
+        job.status = "done"
+        job.finished_at = now
+        job.claimed_by = None
+        job.claimed_until = None
+
+    session.commit()
+
+    return deleted
+
+
+class Purger:
+    def __init__(self):
+        self._lock = Lock()
+        self._start_lock = Lock()
+        self._wakeup = Event()
+        self._thread = None
+
+    def purge_next(self):
+        # Traite un travail jusqu'au bout ; False s'il n'y en avait aucun
+        with self._lock:
+            job = claim_job()
+
+            if job is None:
+                return False
+
+            use_shard(job.user_id)
+
+            while purge_batch(job):
+                time.sleep(BATCH_PAUSE)
+
+            user_changed(job.user_id)
+            logger.info("Compte %s purgé : %s ligne(s) supprimée(s)", job.user_id, job.deleted)
+
+            return True
+
+    def wake(self):
+        self._wakeup.set()
+
+    def start(self, app):
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self.run, args=(app,), name="account-purge", daemon=True)
+                self._thread.start()
+
+    def run(self, app):
+        while True:
+            try:
+                with app.app_context():
+                    while self.purge_next():
+                        pass
+
+            except Exception:
+                logger.exception("Erreur dans la purge des comptes supprimés")
+
+            self._wakeup.wait(POLL_INTERVAL)
+            self._wakeup.clear()
+
+
+purger = Purger()
+
+
+def init_purge(app):
+    # Thread de purge démarré à la première requête (après le fork des workers gunicorn)
+    if env_flag("PURGE_WORKER", True):
+        @app.before_request
+        def start_purger():
+            purger.start(app)
+
+    @app.cli.command("purge-accounts")
+    @click.option("--status", is_flag=True, help="Affiche l'avancement des purges sans rien supprimer.")
+    def purge_accounts_command(status):
+        """Purge les comptes supprimés en attente puis s'arrête."""
+        if status:
+            jobs = session.scalars(select(PurgeJob).order_by(PurgeJob.id.desc()).limit(20)).all()
+
+            for job in jobs:
+                progress = job.deleted * 100 // job.total if job.total else 100
+                click.echo(f"Compte {job.user_id} : {job.status}, {job.deleted}/{job.total} ({progress} %)")
+
+            if not jobs:
+                click.echo("Aucune purge.")
+            return
+
+        total = 0
+
+        while purger.purge_next():
+            total += 1
+
+        click.echo(f"{total} compte(s) purgé(s).")
@@ -0,0 +1,229 @@
+from sqlalchemy import delete, func, insert, select
+
+from database import MAIN, get_engine, session, shard_names, utcnow
+from fragments import evict
+from models import Client, DailyRollup, Project, Task, TimeEntry, User, UserShard, UserVersion, WeeklyRollup
+from purge import BATCH_SIZE, batch_statements
+from shards import CACHE_TTL, add_shard_user, directory_changed, directory_query
+
+import click
+import os
+import time
+
+COPY_BATCH_SIZE = int(os.environ.get("SHARD_COPY_BATCH_SIZE", 1000))
+# Au-delà du TTL du cache d'annuaire, tous les workers ont vu le changement
+SETTLE = CACHE_TTL + 1
+
+
+class MoveError(Exception):
+    pass
+
+
+# =====================================
+# Déplacement d'un utilisateur (shards)
+# =====================================
+# flask move-user <id> <shard>, pendant que l'application tourne :
+#   1. l'annuaire marque le compte « en déplacement » : ses écritures sont refusées
+#      (« réessayez »), ses pages restent lisibles sur l'ancien shard ;
+#   2. clients, projets, tâches et saisies sont copiés par paquets dans le nouveau shard,
+#      sous de nouveaux id ; les triggers y recalculent temps passé, totaux, agrégats et
+#      index de recherche ; les nombres de lignes et d'heures sont vérifiés ;
+#   3. l'annuaire bascule vers le nouveau shard, puis l'ancienne copie est supprimée par lots.
+# Les id changent : les pages ouvertes sont rechargées (nouvelle version des données).
+def set_entry(user_id, shard, moving):
+    entry = session.get(UserShard, user_id)
+
+    if entry is None:
+        entry = UserShard(user_id=user_id)
+        session.add(entry)
+
+    entry.shard = shard
+    entry.moving = moving
+    entry.updated_at = utcnow()
+    session.commit()
+    directory_changed(user_id)
+
+
+def user_rows(user_id):
+    projects = select(Project.id).where(Project.user_id == user_id)
+    tasks = select(Task.id).where(Task.project_id.in_(projects))
+
+    return [
+        (Client, Client.user_id == user_id),
+        (Project, Project.user_id == user_id),
+        (Task, Task.project_id.in_(projects)),
+        (TimeEntry, TimeEntry.task_id.in_(tasks)),
+    ]
+
+
+def summary(connection, user_id):
+    # Lignes par table et heures saisies : identiques avant et après la copie
+    counts = [
+        connection.scalar(select(func.count()).select_from(model).where(where))
+        for model, where in user_rows(user_id)
+    ]
+    hours = connection.scalar(
+        select(func.round(func.coalesce(func.sum(TimeEntry.duration), 0), 6)).where(user_rows(user_id)[3][1])
+    )
+
+    return (*counts, hours)
+
+
+def copy_table(source, target, model, where, remap=None, reset=None):
+    # Copie par paquets (executemany) ; renvoie {ancien id: nouvel id}
+    table = model.__table__
+    columns = [column.name for column in table.columns if column.name != "id"]
+    ids = {}
+
+    result = source.execute(
+        select(table).where(where).order_by(table.c.id).execution_options(yield_per=COPY_BATCH_SIZE)
+    )
+
+    for rows in result.partitions():
+        params = []
+
+        for row in rows:
+            values = {name: row._mapping[name] for name in columns}
+
+            for name, mapping in (remap or {}).items():
+                if values[name] is not None:
+                    values[name] = mapping[values[name]]
+
+            values.update(reset or {})
+            params.append(values)
+
+        new_ids = target.scalars(insert(table).returning(table.c.id, sort_by_parameter_order=True), params).all()
+        ids.update(zip((row.id for row in rows), new_ids))
+        target.commit()
+
+    return ids
+
+
+def copy_user(user_id, source, target):
+    with get_engine(source).connect() as src, get_engine(target).connect() as dst:
+        # Lecture cohérente de l'ancien shard (les écritures du compte sont déjà bloquées)
+        src.begin()
+
+        if target != MAIN:
+            add_shard_user(dst, user_id)
+            dst.commit()
+
+        rows = user_rows(user_id)
+
+        # Temps à zéro : les saisies copiées les recalculent par trigger (tâches, projets, agrégats)
+        clients = copy_table(src, dst, Client, rows[0][1])
+        projects = copy_table(src, dst, Project, rows[1][1], remap={"client_id": clients}, reset={"total_time": 0})
+        tasks = copy_table(src, dst, Task, rows[2][1], remap={"project_id": projects}, reset={"time_spent": 0})
+        copy_table(src, dst, TimeEntry, rows[3][1], remap={"task_id": tasks, "project_id": projects, "client_id": clients})
+
+        # Version suivante : ETag et pages ouvertes invalidés (les id ont changé)
+        version = max(
+            src.scalar(select(UserVersion.version).where(UserVersion.user_id == user_id)) or 0,
+            dst.scalar(select(UserVersion.version).where(UserVersion.user_id == user_id)) or 0,
+        )
+        dst.execute(delete(UserVersion).where(UserVersion.user_id == user_id))
+        dst.execute(insert(UserVersion).values(user_id=user_id, version=version + 1, updated_at=utcnow()))
+        dst.commit()
+
+        expected, copied = summary(src, user_id), summary(dst, user_id)
+
+        if expected != copied:
+            raise MoveError(f"Copie incomplète : {copied} au lieu de {expected}")
+
+        return copied
+
+
+def delete_user_data(shard, user_id):
+    # Par lots, une transaction par lot : les autres comptes du shard écrivent entre deux lots
+    engine = get_engine(shard)
+
+    for statement in batch_statements(user_id, BATCH_SIZE):
+        while True:
+            with engine.begin() as connection:
+                ids = connection.execute(statement).scalars().all()
+
+            if not ids:
+                break
+
+            evict(statement.table.name, *ids, shard=shard)
+
+    with engine.begin() as connection:
+        for model in (DailyRollup, WeeklyRollup, UserVersion):
+            connection.execute(delete(model).where(model.user_id == user_id))
+
+        if shard != MAIN:
+            connection.execute(delete(User).where(User.id == user_id))
+
+
+def move_user(user_id, target, echo=lambda message: None):
+    user = session.get(User, user_id)
+
+    if user is None or user.deleted_at is not None:
+        raise MoveError(f"Utilisateur {user_id} introuvable.")
+
+    row = session.execute(directory_query(user_id)).first()
+    source = row.shard if row is not None else MAIN
+
+    if row is not None and row.moving:
+        raise MoveError(f"Utilisateur {user_id} déjà en cours de déplacement.")
+
+    if source == target:
+        echo(f"Utilisateur {user_id} déjà dans le shard {target}.")
+        return None
+
+    with get_engine(target).connect() as connection:
+        if any(summary(connection, user_id)):
+            raise MoveError(f"Le shard {target} contient déjà des données de l'utilisateur {user_id}.")
+
+    set_entry(user_id, source, moving=True)
+    echo(f"Écritures bloquées, attente de {SETTLE:g} s...")
+    time.sleep(SETTLE)
+
+    try:
+        copied = copy_user(user_id, source, target)
+    except BaseException:
+        # Retour à l'ancien shard, copie partielle supprimée
+        delete_user_data(target, user_id)
+        set_entry(user_id, source, moving=False)
+        raise
+
+    set_entry(user_id, target, moving=False)
+    echo(f"{copied[0]} client(s), {copied[1]} projet(s), {copied[2]} tâche(s), {copied[3]} saisie(s) copiés vers {target}.")
+
+    # Requêtes encore orientées vers l'ancien shard (cache d'annuaire) : terminées avant la suppression
+    time.sleep(SETTLE)
+    delete_user_data(source, user_id)
+    echo(f"Ancienne copie supprimée du shard {source}.")
+
+    return copied
+
+
+def init_rebalance(app):
+    @app.cli.command("move-user")
+    @click.argument("user_id", type=int)
+    @click.argument("shard")
+    def move_user_command(user_id, shard):
+        """Déplace les données d'un utilisateur vers un autre shard, sans arrêt."""
+        if shard not in shard_names():
+            raise click.BadParameter(f"shards : {', '.join(shard_names())}", param_hint="SHARD")
+
+        try:
+            move_user(user_id, shard, echo=click.echo)
+        except MoveError as ex:
+            raise click.ClickException(str(ex))
+
+    @app.cli.command("shards")
+    def shards_command():
+        """Affiche le nombre d'utilisateurs de chaque shard."""
+        counts = dict(session.execute(
+            select(UserShard.shard, func.count())
+            .join(User, User.id == UserShard.user_id)
+            .where(User.deleted_at.is_(None))
+            .group_by(UserShard.shard)
+        ).all())
+        users = session.scalar(select(func.count()).select_from(User).where(User.deleted_at.is_(None)))
+        # Sans ligne d'annuaire : base principale
+        counts[MAIN] = users - sum(count for shard, count in counts.items() if shard != MAIN)
+
+        for shard in shard_names():
+            click.echo(f"{shard} : {counts.get(shard, 0)} utilisateur(s)")
@@ -0,0 +1,378 @@
+from calendar import monthrange
+from concurrent.futures import ProcessPoolExecutor, wait
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from sqlalchemy import func, select
+
+from database import get_engine, session
+from models import Client, DailyRollup, Project, User
+from pools import ProcessPool
+from shards import use_shard
+
+import click
+import csv
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+REPORT_WORKERS = int(os.environ.get("REPORT_WORKERS", 2))
+REPORT_TIMEOUT = float(os.environ.get("REPORT_TIMEOUT", 5))
+REPORT_DIR = os.environ.get("REPORT_DIR") or os.path.join(ROOT, ".report-cache")
+# Fichiers non téléchargés depuis REPORT_CACHE_DAYS jours supprimés par flask generate-reports
+REPORT_CACHE_DAYS = int(os.environ.get("REPORT_CACHE_DAYS", 90))
+# Utilisateurs traités par tâche du pool lors d'une génération complète
+BATCH_USERS = 50
+
+FORMATS = {"html": "text/html", "csv": "text/csv"}
+# Incrémenté quand les colonnes CSV changent (les gabarits HTML sont pris en compte seuls)
+CSV_FORMAT = 1
+TEMPLATES_DIR = os.path.join(ROOT, "templates", "reports")
+
+
+class ReportBusy(Exception):
+    pass
+
+
+# =============================
+# Données des rapports (SQL)
+# =============================
+# Factures (par client) et relevés d'activité (par jour) d'un mois, lus dans daily_rollups :
+# parcours de la clé (user_id, jour) et agrégats calculés par la base.
+# Montant = heures × taux horaire actuel du projet (le taux n'est pas historisé).
+# db : session de la requête ou d'un processus du pool, orientée vers le shard de l'utilisateur.
+def month_bounds(period):
+    # "2026-09" -> (1er, dernier jour du mois) ; ValueError si mal formé
+    month = datetime.strptime(period, "%Y-%m").date()
+
+    return month, month.replace(day=monthrange(month.year, month.month)[1])
+
+
+def previous_month(today=None):
+    first = (today or date.today()).replace(day=1)
+
+    return (first - timedelta(days=1)).strftime("%Y-%m")
+
+
+def hours_sum():
+    return func.round(func.sum(DailyRollup.hours), 6)
+
+
+def in_month(user_id, period):
+    start, end = month_bounds(period)
+
+    return DailyRollup.user_id == user_id, DailyRollup.day >= start, DailyRollup.day <= end
+
+
+def amount(hours, rate):
+    return round(hours * rate, 2)
+
+
+def user_header(db, user_id):
+    row = db.execute(select(User.firstname, User.lastname, User.email).where(User.id == user_id)).first()
+
+    return dict(row._mapping) if row is not None else None
+
+
+def client_headers(db, user_id, client_ids=None):
+    query = select(
+        Client.id, Client.lastname, Client.firstname, Client.enterprise, Client.address,
+        Client.zip_code, Client.city, Client.country, Client.email
+    ).where(Client.user_id == user_id)
+
+    if client_ids is not None:
+        query = query.where(Client.id.in_(client_ids))
+
+    clients = {row.id: dict(row._mapping) for row in db.execute(query)}
+
+    for client in clients.values():
+        client["name"] = client["enterprise"] or f"{client['firstname']} {client['lastname']}"
+
+    return clients
+
+
+def invoices(db, user_id, period, client_id=None):
+    # Une facture par client ayant du temps saisi sur le mois ; avec client_id, la facture
+    # de ce client seul (vide s'il n'a rien sur le mois), [] s'il n'appartient pas à l'utilisateur
+    query = (
+        select(DailyRollup.client_id, Project.name_project, Project.hourly_rate, hours_sum().label("hours"))
+        .join(Project, Project.id == DailyRollup.project_id)
+        .where(*in_month(user_id, period))
+        .group_by(DailyRollup.client_id, Project.id, Project.name_project, Project.hourly_rate)
+        .having(func.abs(func.sum(DailyRollup.hours)) > 1e-6)
+        .order_by(DailyRollup.client_id, Project.id)
+    )
+
+    if client_id is not None:
+        query = query.where(DailyRollup.client_id == client_id)
+
+    lines = {}
+    for row in db.execute(query):
+        lines.setdefault(row.client_id, []).append({
+            "project": row.name_project,
+            "hours": row.hours,
+            "rate": row.hourly_rate,
+            "amount": amount(row.hours, row.hourly_rate),
+        })
+
+    clients = client_headers(db, user_id, [client_id] if client_id is not None else list(lines))
+
+    if not clients:
+        return []
+
+    user = user_header(db, user_id)
+
+    return [
+        {
+            "kind": "invoice",
+            "period": period,
+            "user": user,
+            "client": client,
+            "lines": lines.get(client["id"], []),
+            "hours": round(sum(line["hours"] for line in lines.get(client["id"], [])), 6),
+            "amount": round(sum(line["amount"] for line in lines.get(client["id"], [])), 2),
+        }
+        for client in clients.values()
+    ]
+
+
+def activity(db, user_id, period):
+    # Relevé du mois : heures par jour et par projet, tous clients confondus
+    rows = db.execute(
+        select(DailyRollup.day, DailyRollup.client_id, Project.name_project, Project.hourly_rate, hours_sum().label("hours"))
+        .join(Project, Project.id == DailyRollup.project_id)
+        .where(*in_month(user_id, period))
+        .group_by(DailyRollup.day, DailyRollup.client_id, Project.id, Project.name_project, Project.hourly_rate)
+        .having(func.abs(func.sum(DailyRollup.hours)) > 1e-6)
+        .order_by(DailyRollup.day, DailyRollup.client_id, Project.id)
+    ).all()
+
+    clients = client_headers(db, user_id, list({row.client_id for row in rows}))
+    days = [
+        {
+            "day": row.day.isoformat(),
+            "client": clients[row.client_id]["name"] if row.client_id in clients else "",
+            "project": row.name_project,
+            "hours": row.hours,
+            "amount": amount(row.hours, row.hourly_rate),
+        }
+        for row in rows
+    ]
+
+    return {
+        "kind": "activity",
+        "period": period,
+        "user": user_header(db, user_id),
+        "days": days,
+        "hours": round(sum(day["hours"] for day in days), 6),
+        "amount": round(sum(day["amount"] for day in days), 2),
+    }
+
+
+# ===========================
+# Fichiers générés (disque)
+# ===========================
+# Clé de contenu : empreinte des données du rapport. Tant que rien ne change sur le mois
+# (heures, taux, noms, adresse), le fichier déjà généré est renvoyé sans pool ni rendu.
+_environment = None
+
+
+def environment():
+    global _environment
+
+    if _environment is None:
+        _environment = Environment(
+            loader=FileSystemLoader(TEMPLATES_DIR),
+            autoescape=select_autoescape(),
+        )
+
+    return _environment
+
+
+@lru_cache(maxsize=None)
+def templates_release():
+    # Un déploiement qui modifie les gabarits des rapports change aussi les clés
+    digest = hashlib.sha256(str(CSV_FORMAT).encode())
+
+    for name in sorted(os.listdir(TEMPLATES_DIR)):
+        with open(os.path.join(TEMPLATES_DIR, name), "rb") as file:
+            digest.update(file.read())
+
+    return digest.hexdigest()[:8]
+
+
+def report_path(data, fmt):
+    payload = json.dumps([templates_release(), fmt, data], sort_keys=True, separators=(",", ":"))
+    key = hashlib.sha256(payload.encode()).hexdigest()
+
+    return os.path.join(REPORT_DIR, key[:2], f"{key}.{fmt}")
+
+
+def render_csv(data):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    if data["kind"] == "invoice":
+        writer.writerow(["projet", "heures", "taux_horaire", "montant"])
+        writer.writerows([line["project"], line["hours"], line["rate"], line["amount"]] for line in data["lines"])
+        writer.writerow(["total", data["hours"], "", data["amount"]])
+    else:
+        writer.writerow(["jour", "client", "projet", "heures", "montant"])
+        writer.writerows([day["day"], day["client"], day["project"], day["hours"], day["amount"]] for day in data["days"])
+        writer.writerow(["total", "", "", data["hours"], data["amount"]])
+
+    return buffer.getvalue()
+
+
+def render_report(data, fmt):
+    if fmt == "csv":
+        return render_csv(data)
+
+    return environment().get_template(f"{data['kind']}.html").render(**data)
+
+
+def write_report(data, fmt):
+    # Exécuté dans le pool : rendu puis écriture atomique (un lecteur ne voit jamais un fichier partiel)
+    path = report_path(data, fmt)
+
+    if os.path.exists(path):
+        return path, False
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+
+    with open(temporary, "w", encoding="utf-8", newline="") as file:
+        file.write(render_report(data, fmt))
+
+    os.replace(temporary, path)
+
+    return path, True
+
+
+report_pool = ProcessPool(REPORT_WORKERS, REPORT_TIMEOUT, ReportBusy)
+
+
+def report_file(db, user_id, period, fmt, client_id=None):
+    # Chemin du rapport (facture si client_id, relevé d'activité sinon), None s'il n'existe pas.
+    # Les agrégats sont lus dans la requête ; seul le rendu passe par le pool, et seulement
+    # si le fichier n'a pas déjà été généré.
+    if fmt not in FORMATS:
+        return None
+
+    try:
+        month_bounds(period)
+    except ValueError:
+        return None
+
+    if client_id is None:
+        data = activity(db, user_id, period)
+    else:
+        data = next(iter(invoices(db, user_id, period, client_id)), None)
+
+    if data is None or data["user"] is None:
+        return None
+
+    path = report_path(data, fmt)
+
+    if os.path.exists(path):
+        # Date d'accès : les fichiers encore téléchargés échappent au nettoyage
+        os.utime(path)
+        return path
+
+    return report_pool.run(write_report, data, fmt)[0]
+
+
+# ================================
+# Génération de fin de mois
+# ================================
+def generate_job(user_ids, period):
+    # Exécuté dans un processus du pool, avec sa propre session : relevé et factures
+    # (HTML et CSV) de chaque utilisateur. Renvoie (fichiers écrits, fichiers déjà à jour).
+    written = cached = 0
+
+    try:
+        for user_id in user_ids:
+            # Lectures dans le shard de l'utilisateur (voir shards.py)
+            use_shard(user_id)
+            reports = invoices(session, user_id, period)
+
+            # Aucun temps saisi sur le mois : rien à générer
+            if reports:
+                reports.append(activity(session, user_id, period))
+
+            session.close()
+
+            for data in reports:
+                for fmt in FORMATS:
+                    if write_report(data, fmt)[1]:
+                        written += 1
+                    else:
+                        cached += 1
+    finally:
+        session.remove()
+
+    return written, cached
+
+
+def prune_reports(max_age_days=REPORT_CACHE_DAYS):
+    limit = time.time() - max_age_days * 86400
+    removed = 0
+
+    for root, dirs, files in os.walk(REPORT_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+
+            if os.path.getmtime(path) < limit:
+                os.remove(path)
+                removed += 1
+
+    return removed
+
+
+def init_reports(app):
+    @app.cli.command("generate-reports")
+    @click.option("--period", default=previous_month, show_default="mois précédent", help="Mois AAAA-MM.")
+    @click.option("--workers", type=int, default=max(REPORT_WORKERS, 1), show_default=True, help="Processus de rendu.")
+    @click.option("--timeout", type=float, default=600, show_default=True, help="Durée max. (s) de la génération.")
+    def generate_reports_command(period, workers, timeout):
+        """Génère factures et relevés d'activité du mois pour tous les comptes."""
+        try:
+            month_bounds(period)
+        except ValueError:
+            raise click.BadParameter("format attendu : AAAA-MM", param_hint="--period")
+
+        with get_engine().connect() as connection:
+            user_ids = connection.scalars(select(User.id).where(User.deleted_at.is_(None)).order_by(User.id)).all()
+
+        batches = [user_ids[start:start + BATCH_USERS] for start in range(0, len(user_ids), BATCH_USERS)]
+        deadline = time.monotonic() + timeout
+
+        executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+        futures = [executor.submit(generate_job, batch, period) for batch in batches]
+
+        # Durée bornée : les lots pas encore commencés à l'échéance sont annulés. Une nouvelle
+        # exécution reprend là où celle-ci s'est arrêtée (les fichiers à jour sont conservés).
+        wait(futures, timeout=max(deadline - time.monotonic(), 0))
+        executor.shutdown(wait=True, cancel_futures=True)
+
+        finished = [future for future in futures if not future.cancelled()]
+        failed = [future for future in finished if future.exception() is not None]
+        written = sum(future.result()[0] for future in finished if future not in failed)
+        cached = sum(future.result()[1] for future in finished if future not in failed)
+        skipped = len(futures) - len(finished)
+
+        removed = prune_reports()
+
+        click.echo(f"{period} : {written} fichier(s) généré(s), {cached} déjà à jour, {removed} ancien(s) supprimé(s).")
+
+        if failed:
+            raise failed[0].exception()
+
+        if skipped:
+            click.echo(f"Durée dépassée : {skipped} lot(s) sur {len(batches)} non traité(s), relancer la commande.")
+            raise SystemExit(1)
@@ -0,0 +1,144 @@
+from sqlalchemy import func, select, text
+
+from database import utcnow
+from models import DailyRollup, WeeklyRollup
+
+
+# ==============================================
+# Saisies de temps et agrégats jour / semaine
+# ==============================================
+# Le temps passé s'écrit uniquement via time_entries :
+#   - tasks.time_spent est la somme des saisies de la tâche,
+#   - daily_rollups / weekly_rollups cumulent les saisies par utilisateur, jour (ou semaine) et projet.
+# Les triggers ci-dessous appliquent les deltas ; la suppression d'une tâche supprime ses saisies.
+WEEK = "date({0}, '-6 days', 'weekday 1')"
+
+ROLLUP_UPSERT = """
+    INSERT INTO {table} (user_id, {key}, project_id, client_id, hours)
+    VALUES ({row}.user_id, {period}, {row}.project_id, {row}.client_id, {sign}{row}.duration)
+    ON CONFLICT (user_id, {key}, project_id)
+    DO UPDATE SET hours = round(hours + excluded.hours, 6);
+"""
+
+
+def rollup_statements(row, sign):
+    return (
+        ROLLUP_UPSERT.format(table="daily_rollups", key="day", period=f"date({row}.started_at)", row=row, sign=sign)
+        + ROLLUP_UPSERT.format(table="weekly_rollups", key="week", period=WEEK.format(f"{row}.started_at"), row=row, sign=sign)
+    )
+
+
+TRIGGERS = {
+    "time_entries_insert": f"""
+        CREATE TRIGGER IF NOT EXISTS time_entries_insert AFTER INSERT ON time_entries BEGIN
+            UPDATE tasks SET time_spent = round(time_spent + new.duration, 6) WHERE id = new.task_id;
+            {rollup_statements("new", "")}
+        END
+    """,
+    "time_entries_delete": f"""
+        CREATE TRIGGER IF NOT EXISTS time_entries_delete AFTER DELETE ON time_entries BEGIN
+            UPDATE tasks SET time_spent = round(time_spent - old.duration, 6) WHERE id = old.task_id;
+            {rollup_statements("old", "-")}
+        END
+    """,
+    "tasks_entries_delete": """
+        CREATE TRIGGER IF NOT EXISTS tasks_entries_delete AFTER DELETE ON tasks BEGIN
+            DELETE FROM time_entries WHERE task_id = old.id;
+        END
+    """,
+}
+
+# Saisie rattachée au projet, au client et à l'utilisateur de la tâche
+INSERT_ENTRY = text("""
+    INSERT INTO time_entries (task_id, project_id, client_id, user_id, started_at, duration)
+    SELECT tasks.id, projects.id, projects.client_id, projects.user_id, :started_at, :duration
+    FROM tasks JOIN projects ON projects.id = tasks.project_id
+    WHERE tasks.id = :task_id
+""")
+
+
+def install_rollups(connection):
+    installed = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'time_entries_insert'")
+    ).first()
+
+    for ddl in TRIGGERS.values():
+        connection.execute(text(ddl))
+
+    # Base existante : le temps déjà saisi devient une première saisie datée d'aujourd'hui
+    if not installed:
+        reconcile_entries(connection)
+
+
+def log_time(session, entries):
+    # entries : [(task_id, heures, début ou None)], un seul executemany
+    now = utcnow()
+    params = [
+        {"task_id": task_id, "duration": duration, "started_at": started_at or now}
+        for task_id, duration, started_at in entries
+        if duration
+    ]
+
+    if params:
+        session.execute(INSERT_ENTRY, params)
+
+
+def reconcile_entries(connection):
+    # Tâches dont time_spent ne correspond pas à leurs saisies (écriture directe, ancienne base) :
+    # time_spent est ramené à la somme des saisies, puis l'écart est ajouté comme nouvelle saisie
+    drift = connection.execute(text("""
+        SELECT id, time_spent - coalesce((SELECT sum(duration) FROM time_entries WHERE task_id = tasks.id), 0)
+        FROM tasks
+    """)).all()
+    drift = [(task_id, delta) for task_id, delta in drift if abs(delta) > 1e-6]
+
+    for task_id, delta in drift:
+        connection.execute(
+            text("UPDATE tasks SET time_spent = round(time_spent - :delta, 6) WHERE id = :id"),
+            {"delta": delta, "id": task_id}
+        )
+
+    if drift:
+        now = utcnow()
+        connection.execute(INSERT_ENTRY, [
+            {"task_id": task_id, "duration": delta, "started_at": now} for task_id, delta in drift
+        ])
+
+    return len(drift)
+
+
+def rebuild_rollups(connection):
+    connection.execute(text("DELETE FROM daily_rollups"))
+    connection.execute(text("DELETE FROM weekly_rollups"))
+
+    connection.execute(text("""
+        INSERT INTO daily_rollups (user_id, day, project_id, client_id, hours)
+        SELECT user_id, date(started_at), project_id, max(client_id), round(sum(duration), 6)
+        FROM time_entries GROUP BY 1, 2, 3
+    """))
+    connection.execute(text(f"""
+        INSERT INTO weekly_rollups (user_id, week, project_id, client_id, hours)
+        SELECT user_id, {WEEK.format("started_at")}, project_id, max(client_id), round(sum(duration), 6)
+        FROM time_entries GROUP BY 1, 2, 3
+    """))
+
+
+# ==========
+# Rapports
+# ==========
+def hours_report(session, user_id, period, start, end, group):
+    # Lit uniquement les agrégats : parcours de la clé (user_id, jour|semaine)
+    # Pour period="week", start doit être un lundi
+    table = WeeklyRollup if period == "week" else DailyRollup
+    key = table.week if period == "week" else table.day
+    group_column = table.client_id if group == "client" else table.project_id
+
+    rows = session.execute(
+        select(key, group_column, func.round(func.sum(table.hours), 6))
+        .where(table.user_id == user_id, key >= start, key <= end)
+        .group_by(key, group_column)
+        .having(func.abs(func.sum(table.hours)) > 1e-6)
+        .order_by(key, group_column)
+    ).all()
+
+    return [{"period": key_value.isoformat(), group: group_id, "hours": hours} for key_value, group_id, hours in rows]
@@ -0,0 +1,113 @@
+from sqlalchemy import column, select, table, text
+
+from models import Client, Project, Task
+
+import re
+
+
+# =================================
+# Index plein texte SQLite FTS5
+# =================================
+# Tables FTS5 « external content » : l'index ne stocke pas le texte, seulement les tokens
+FTS_TABLES = {
+    "clients_fts": ("clients", ["lastname", "firstname", "enterprise", "email", "city", "note"]),
+    "projects_fts": ("projects", ["name_project", "description", "url", "hosting_server"]),
+    "tasks_fts": ("tasks", ["name_task"]),
+}
+
+SEARCH_LIMIT = 20
+
+
+def fts_table(name):
+    return table(name, column("rowid"), column("rank"), column(name))
+
+
+def install_search(connection):
+    # Crée les tables FTS5 et les triggers qui les gardent à jour ; idempotent
+    created = []
+
+    for fts, (source, columns) in FTS_TABLES.items():
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": fts}
+        ).first()
+
+        cols = ", ".join(columns)
+        new_cols = ", ".join(f"new.{col}" for col in columns)
+        old_cols = ", ".join(f"old.{col}" for col in columns)
+
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, "
+            f"content='{source}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+        ))
+        connection.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {source} BEGIN "
+            f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols}); END"
+        ))
+        connection.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {source} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); END"
+        ))
+        connection.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {cols} ON {source} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); "
+            f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols}); END"
+        ))
+
+        # Base existante : indexer les lignes déjà présentes
+        if not exists:
+            created.append(fts)
+            connection.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+    return created
+
+
+def rebuild_search(connection):
+    for fts in FTS_TABLES:
+        connection.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+        connection.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('optimize')"))
+
+
+def match_query(terms):
+    # Chaque mot devient un préfixe entre guillemets : la syntaxe FTS5 de l'utilisateur est ignorée
+    words = re.findall(r"\w+", terms)
+
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search(session, user_id, terms, limit=SEARCH_LIMIT):
+    query = match_query(terms)
+
+    if not query:
+        return dict(clients=[], projects=[], tasks=[])
+
+    clients_fts = fts_table("clients_fts")
+    projects_fts = fts_table("projects_fts")
+    tasks_fts = fts_table("tasks_fts")
+
+    clients = session.scalars(
+        select(Client)
+        .join(clients_fts, clients_fts.c.rowid == Client.id)
+        .where(clients_fts.c.clients_fts.match(query), Client.user_id == user_id)
+        .order_by(clients_fts.c.rank)
+        .limit(limit)
+    ).all()
+
+    projects = session.scalars(
+        select(Project)
+        .join(projects_fts, projects_fts.c.rowid == Project.id)
+        .where(projects_fts.c.projects_fts.match(query), Project.user_id == user_id)
+        .order_by(projects_fts.c.rank)
+        .limit(limit)
+    ).all()
+
+    tasks = session.scalars(
+        select(Task)
+        .join(tasks_fts, tasks_fts.c.rowid == Task.id)
+        .join(Project, Project.id == Task.project_id)
+        .where(tasks_fts.c.tasks_fts.match(query), Project.user_id == user_id)
+        .order_by(tasks_fts.c.rank)
+        .limit(limit)
+    ).all()
+
+    return dict(clients=clients, projects=projects, tasks=tasks)
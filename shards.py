@@ -0,0 +1,145 @@
+from flask import flash, g, has_app_context, redirect, request, url_for
+from flask_login import current_user
+from sqlalchemy import delete, insert, select
+
+from cache import TTLCache
+from database import MAIN, SHARDS, get_engine, session, shard_names, utcnow
+from models import User, UserShard
+
+import os
+
+# Délai max. de prise en compte d'un déplacement par les autres workers (voir rebalance.py)
+CACHE_TTL = float(os.environ.get("SHARD_CACHE_TTL", 5))
+MOVING_MESSAGE = "Vos données sont en cours de déplacement, veuillez réessayer dans quelques secondes."
+
+directory_cache = TTLCache(maxsize=int(os.environ.get("SHARD_CACHE_SIZE", 4096)), ttl=CACHE_TTL)
+
+
+# ===================
+# Annuaire des shards
+# ===================
+# user_shards (base principale) associe un utilisateur à son shard ; sans ligne, ses données
+# sont dans la base principale. Lu une fois par requête au plus (cache de CACHE_TTL secondes).
+# use_shard oriente ensuite la session : les requêtes sur SHARDED_TABLES vont dans ce shard,
+# le reste (comptes, jetons, e-mails...) dans la base principale (voir database.py).
+def directory_query(user_id):
+    return select(UserShard.shard, UserShard.moving).where(UserShard.user_id == user_id)
+
+
+def cache_entry(user_id, row):
+    # (shard, déplacement en cours)
+    entry = (row.shard, row.moving) if row is not None else (MAIN, False)
+    directory_cache.set(user_id, entry)
+
+    return entry
+
+
+def directory_entry(user_id):
+    if not SHARDS:
+        return MAIN, False
+
+    entry = directory_cache.get(user_id)
+
+    if entry is None:
+        entry = cache_entry(user_id, session.execute(directory_query(user_id)).first())
+
+    return entry
+
+
+def shard_of(user_id):
+    return directory_entry(user_id)[0]
+
+
+def writes_blocked(user_id):
+    return directory_entry(user_id)[1]
+
+
+def pin(shard):
+    # g : clés du cache de fragments (vues synchrones et asynchrones)
+    if has_app_context():
+        g.shard = shard
+
+
+def use_shard(user_id):
+    shard = shard_of(user_id)
+    session.info["shard"] = shard
+    pin(shard)
+
+    return shard
+
+
+async def async_use_shard(db, user_id):
+    # Vues asynchrones (asgi.py) : annuaire lu sans bloquer, sur la session AsyncSession
+    entry = directory_cache.get(user_id) if SHARDS else (MAIN, False)
+
+    if entry is None:
+        entry = cache_entry(user_id, (await db.execute(directory_query(user_id))).first())
+
+    db.sync_session.info["shard"] = entry[0]
+    pin(entry[0])
+
+
+def current_shard():
+    if has_app_context() and "shard" in g:
+        return g.shard
+
+    return session.info.get("shard", MAIN)
+
+
+def directory_changed(user_id):
+    directory_cache.pop(user_id)
+
+
+# ==================
+# Comptes des shards
+# ==================
+def add_shard_user(connection, user_id):
+    # Ligne minimale dans le shard : les clés étrangères user_id des données y pointent.
+    # Le vrai compte (nom, e-mail, mot de passe) reste dans la base principale.
+    if connection.scalar(select(User.id).where(User.id == user_id)) is None:
+        connection.execute(insert(User).values(
+            id=user_id, lastname="", firstname="", email=f"{user_id}@shard.invalid", password="!"
+        ))
+
+
+def drop_shard_user(user_id):
+    # Suppression du compte : la base supprime les données restantes du shard (ON DELETE CASCADE)
+    shard = shard_of(user_id)
+
+    # Dans la transaction de la session, qui a déjà écrit dans ce shard (purge par lots)
+    if shard != MAIN:
+        session.execute(delete(User).where(User.id == user_id), bind_arguments={"bind": get_engine(shard)})
+
+
+def assign_shard(user_id):
+    # Nouveau compte, avant le commit de l'inscription : réparti sur tous les shards
+    if not SHARDS:
+        return MAIN
+
+    names = shard_names()
+    shard = names[user_id % len(names)]
+
+    if shard != MAIN:
+        with get_engine(shard).begin() as connection:
+            add_shard_user(connection, user_id)
+
+        session.add(UserShard(user_id=user_id, shard=shard, moving=False, updated_at=utcnow()))
+
+    directory_changed(user_id)
+
+    return shard
+
+
+def init_shards(app):
+    if not SHARDS:
+        return
+
+    @app.before_request
+    def block_moving_writes():
+        # Pendant un déplacement (flask move-user), les données restent lisibles dans l'ancien shard
+        if request.method in ("GET", "HEAD", "OPTIONS") or request.blueprint == "api":
+            return None
+
+        if current_user.is_authenticated and writes_blocked(current_user.id):
+            flash(MOVING_MESSAGE, "error")
+            return redirect(request.referrer or url_for('main.dashboard'))
@@ -29,3 +29,115 @@ function confirmDeleteTask() {
 function confirmDeleteClient() {
   return confirm("Voulez-vous supprimer ce client ?");
 }
+
+// =====================================
+// Mises à jour en direct (SSE, /events)
+// =====================================
+// Lignes de tableau et compteurs remplacés sans recharger la page (voir events.py)
+function liveMatches(element, data) {
+  return !element.dataset.parent || element.dataset.parent === data.parent;
+}
+
+function reloadWhenVisible() {
+  if (document.visibilityState === "visible") {
+    location.reload();
+  } else {
+    document.addEventListener("visibilitychange", reloadWhenVisible, { once: true });
+  }
+}
+
+function applyRow(data) {
+  const rows = document.querySelectorAll(`tr[data-entity="${data.entity}"]`);
+
+  if (rows.length) {
+    rows.forEach((row) => {
+      row.outerHTML = data.rows[row.dataset.macro];
+    });
+    return;
+  }
+
+  // Nouvelle ligne : en tête ou en fin de tableau selon l'ordre de la page
+  document.querySelectorAll("tbody[data-macro]").forEach((tbody) => {
+    const html = data.rows[tbody.dataset.macro];
+
+    if (html && liveMatches(tbody, data)) {
+      if (tbody.dataset.insert === "first") {
+        tbody.insertAdjacentHTML("afterbegin", html);
+      } else if (tbody.dataset.insert === "last") {
+        tbody.insertAdjacentHTML("beforeend", html);
+      }
+    }
+  });
+
+  // Liste vide : le tableau n'existe pas encore
+  document.querySelectorAll("[data-empty]").forEach((empty) => {
+    if (data.rows[empty.dataset.empty] && liveMatches(empty, data)) {
+      reloadWhenVisible();
+    }
+  });
+}
+
+function applyDelete(data) {
+  data.entities.forEach((entity) => {
+    document.querySelectorAll(`tr[data-entity="${entity}"]`).forEach((row) => row.remove());
+  });
+}
+
+function applyCounters(data) {
+  Object.entries(data).forEach(([name, value]) => {
+    const counter = document.querySelector(`[data-counter="${name}"]`);
+
+    if (counter) {
+      counter.textContent = value;
+    }
+  });
+}
+
+function connectEvents(url) {
+  const source = new EventSource(url);
+
+  source.addEventListener("row", (event) => applyRow(JSON.parse(event.data)));
+  source.addEventListener("delete", (event) => applyDelete(JSON.parse(event.data)));
+  source.addEventListener("counters", (event) => applyCounters(JSON.parse(event.data)));
+  // Changement fait ailleurs (import, API, autre worker) : la page est rechargée
+  source.addEventListener("refresh", reloadWhenVisible);
+
+  // Flux refusé (trop de pages ouvertes sur le worker) : nouvel essai plus tard
+  source.addEventListener("error", () => {
+    if (source.readyState === EventSource.CLOSED) {
+      setTimeout(() => connectEvents(url), 30000);
+    }
+  });
+}
+
+document.addEventListener("DOMContentLoaded", () => {
+  const counters = document.querySelector("[data-counter]");
+
+  // data-live-events : mises à jour en direct activées côté serveur (LIVE_EVENTS)
+  if (window.EventSource && "liveEvents" in document.body.dataset
+      && (counters || document.querySelector("tbody[data-macro], [data-empty]"))) {
+    connectEvents(counters ? "/events?counters=1" : "/events");
+  }
+});
+
+// Suppression depuis une ligne de tableau : envoyée en fetch, la ligne est retirée sur place
+document.addEventListener("submit", (event) => {
+  const form = event.target;
+
+  // Confirmation refusée (onsubmit) ou autre formulaire
+  if (event.defaultPrevented || !form.matches("form[data-live-delete]")) {
+    return;
+  }
+
+  event.preventDefault();
+
+  fetch(form.action, { method: "POST", headers: { "X-Live": "1" }, credentials: "same-origin" })
+    .then((response) => {
+      if (response.status === 204) {
+        applyDelete({ entities: [form.closest("tr[data-entity]").dataset.entity] });
+      } else {
+        location.reload();
+      }
+    })
+    .catch(() => form.submit());
+});
@@ -0,0 +1,92 @@
+from flask import g, has_app_context
+from sqlalchemy import case, func, select
+
+from cache import TTLCache
+from database import session
+from events import publish
+from models import Client, Project
+from versions import bump_version, data_version, version_query
+
+import os
+
+
+# ===================================
+# Statistiques du tableau de bord
+# ===================================
+# Cache par (utilisateur, version des données) : une écriture, même traitée par un autre
+# worker, incrémente user_versions et l'ancienne entrée n'est plus lue.
+# La version est celle déjà lue par @conditional (g.data_version) quand il y en a une.
+dashboard_cache = TTLCache(
+    maxsize=int(os.environ.get("DASHBOARD_CACHE_SIZE", 1024)),
+    ttl=int(os.environ.get("DASHBOARD_CACHE_TTL", 300))
+)
+
+
+def dashboard_query(user_id):
+    # Une seule requête : agrégation conditionnelle sur projects + nombre de clients
+    total_clients = select(func.count(Client.id)).where(Client.user_id == user_id).scalar_subquery()
+
+    return select(
+        func.count(Project.id),
+        func.coalesce(func.sum(case((Project.status == "En cours", 1), else_=0)), 0),
+        func.coalesce(func.sum(case((Project.status == "Terminé", 1), else_=0)), 0),
+        total_clients
+    ).where(Project.user_id == user_id)
+
+
+def cache_stats(key, row):
+    stats = dict(
+        total_projects=row[0],
+        cours_projects=row[1],
+        end_projects=row[2],
+        total_clients=row[3]
+    )
+    dashboard_cache.set(key, stats)
+
+    return stats
+
+
+def request_version(user_id):
+    # (utilisateur, version) notée par @conditional dans la requête en cours
+    known = g.get("data_version") if has_app_context() else None
+
+    return known[1] if known is not None and known[0] == user_id else None
+
+
+def dashboard_stats(user_id, version=None):
+    if version is None:
+        version = request_version(user_id)
+    if version is None:
+        version = data_version(user_id)[0]
+
+    key = (user_id, version)
+    stats = dashboard_cache.get(key)
+
+    if stats is None:
+        stats = cache_stats(key, session.execute(dashboard_query(user_id)).one())
+
+    return stats
+
+
+async def async_dashboard_stats(db, user_id):
+    # Vues asynchrones (asgi.py) : même cache, requêtes sur la session AsyncSession
+    version = request_version(user_id)
+
+    if version is None:
+        row = (await db.execute(version_query(user_id))).first()
+        version = row[0] if row is not None else 0
+
+    key = (user_id, version)
+    stats = dashboard_cache.get(key)
+
+    if stats is None:
+        stats = cache_stats(key, (await db.execute(dashboard_query(user_id))).one())
+
+    return stats
+
+
+def user_data_changed(user_id):
+    # Appelé après chaque écriture sur les données d'un utilisateur
+    version = bump_version(user_id)
+    dashboard_cache.pop((user_id, version - 1))
+    publish(user_id, "version", {"version": version})
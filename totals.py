@@ -0,0 +1,66 @@
+from sqlalchemy import text
+
+
+# ==========================================
+# Temps total dénormalisé sur les projets
+# ==========================================
+# projects.total_time est tenu à jour par des triggers SQLite, à chaque insertion,
+# modification ou suppression de tâche (formulaires, import CSV, API, cascades).
+# round(..., 6) évite l'accumulation d'erreurs d'arrondi sur les additions successives.
+TRIGGERS = {
+    "tasks_total_insert": """
+        CREATE TRIGGER IF NOT EXISTS tasks_total_insert AFTER INSERT ON tasks BEGIN
+            UPDATE projects SET total_time = round(total_time + new.time_spent, 6) WHERE id = new.project_id;
+        END
+    """,
+    "tasks_total_delete": """
+        CREATE TRIGGER IF NOT EXISTS tasks_total_delete AFTER DELETE ON tasks BEGIN
+            UPDATE projects SET total_time = round(total_time - old.time_spent, 6) WHERE id = old.project_id;
+        END
+    """,
+    "tasks_total_update": """
+        CREATE TRIGGER IF NOT EXISTS tasks_total_update AFTER UPDATE OF time_spent, project_id ON tasks BEGIN
+            UPDATE projects SET total_time = round(total_time - old.time_spent, 6) WHERE id = old.project_id;
+            UPDATE projects SET total_time = round(total_time + new.time_spent, 6) WHERE id = new.project_id;
+        END
+    """,
+}
+
+ACTUAL_TOTAL = "(SELECT coalesce(sum(time_spent), 0) FROM tasks WHERE tasks.project_id = projects.id)"
+
+
+def column_names(connection, table_name):
+    return [row[1] for row in connection.execute(text(f"PRAGMA table_info({table_name})"))]
+
+
+def install_totals(connection):
+    # Base existante : ajouter la colonne puis la remplir une fois
+    if "total_time" not in column_names(connection, "projects"):
+        connection.execute(text("ALTER TABLE projects ADD COLUMN total_time FLOAT NOT NULL DEFAULT 0"))
+        repair_totals(connection)
+
+    for ddl in TRIGGERS.values():
+        connection.execute(text(ddl))
+
+
+def check_totals(connection):
+    # Projets dont le total stocké ne correspond plus à la somme des tâches
+    return connection.execute(text(f"""
+        SELECT id, total_time, {ACTUAL_TOTAL} AS actual
+        FROM projects
+        WHERE abs(total_time - {ACTUAL_TOTAL}) > 1e-6
+        ORDER BY id
+    """)).all()
+
+
+def repair_totals(connection, project_ids=None):
+    statement = f"UPDATE projects SET total_time = round({ACTUAL_TOTAL}, 6)"
+
+    if project_ids is None:
+        return connection.execute(text(statement)).rowcount
+
+    repaired = 0
+    for project_id in project_ids:
+        repaired += connection.execute(text(statement + " WHERE id = :id"), {"id": project_id}).rowcount
+
+    return repaired
@@ -0,0 +1,66 @@
+from flask_login import UserMixin
+from sqlalchemy import select
+
+from cache import TTLCache
+from database import session
+from models import User
+
+import os
+
+
+# ===============================
+# Cache des utilisateurs connectés
+# ===============================
+# Flask-Login recharge l'utilisateur à chaque requête : on garde une copie légère,
+# détachée de la session, pour éviter une requête par page.
+# Le cache est propre à chaque processus : le TTL borne le délai de prise en compte
+# d'une modification faite par un autre worker.
+user_cache = TTLCache(
+    maxsize=int(os.environ.get("USER_CACHE_SIZE", 4096)),
+    ttl=int(os.environ.get("USER_CACHE_TTL", 300))
+)
+
+
+class CachedUser(UserMixin):
+    # Pas de mot de passe ni de relations : seulement ce que les pages affichent
+    __slots__ = ("id", "lastname", "firstname", "email")
+
+    def __init__(self, id, lastname, firstname, email):
+        self.id = id
+        self.lastname = lastname
+        self.firstname = firstname
+        self.email = email
+
+
+def cached_user_query(user_id):
+    # Compte en cours de purge (voir purge.py) : déconnecté
+    return select(User.id, User.lastname, User.firstname, User.email).where(User.id == user_id, User.deleted_at.is_(None))
+
+
+def load_cached_user(user_id):
+    user = user_cache.get(user_id)
+
+    if user is None:
+        row = session.execute(cached_user_query(user_id)).first()
+
+        if row is None:
+            return None
+
+        user = CachedUser(*row)
+        user_cache.set(user_id, user)
+
+    return user
+
+
+async def warm_cached_user(db, user_id):
+    # Vues asynchrones (asgi.py) : lu sans bloquer, Flask-Login le trouve ensuite dans le cache
+    if user_cache.get(user_id) is None:
+        row = (await db.execute(cached_user_query(user_id))).first()
+
+        if row is not None:
+            user_cache.set(user_id, CachedUser(*row))
+
+
+def user_changed(user_id):
+    # Appelé après toute modification ou suppression d'un compte
+    user_cache.pop(user_id)
@@ -0,0 +1,133 @@
+from flask import Response, g, make_response, request, session as flask_session
+from flask_login import current_user
+from functools import wraps
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from assets import DIST, MANIFEST, STATIC_DIR
+from database import session, utcnow
+from models import UserVersion
+
+import hashlib
+import os
+
+
+# ===================================
+# Version des données par utilisateur
+# ===================================
+# Chaque écriture sur les données d'un utilisateur incrémente user_versions.version.
+# Les pages de lecture en dérivent un ETag / Last-Modified : si le navigateur a déjà
+# cette version, la réponse est un 304 sans requête ORM ni rendu Jinja.
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+
+def release():
+    # Un déploiement qui modifie les gabarits ou les fichiers statiques invalide aussi les pages
+    # en cache : elles citent les noms empreintes de static/dist/, supprimés par `python assets.py`
+    digest = hashlib.sha256()
+
+    for root, dirs, files in sorted(os.walk(TEMPLATES_DIR)):
+        for name in sorted(files):
+            with open(os.path.join(root, name), "rb") as file:
+                digest.update(file.read())
+
+    manifest = os.path.join(STATIC_DIR, DIST, MANIFEST)
+
+    if os.path.exists(manifest):
+        with open(manifest, "rb") as file:
+            digest.update(file.read())
+
+    return digest.hexdigest()[:8]
+
+
+RELEASE = os.environ.get("APP_RELEASE") or release()
+
+
+def version_query(user_id):
+    return select(UserVersion.version, UserVersion.updated_at).where(UserVersion.user_id == user_id)
+
+
+def data_version(user_id):
+    row = session.execute(version_query(user_id)).first()
+
+    return row if row is not None else (0, None)
+
+
+def bump_version(user_id):
+    # Renvoie la nouvelle version (publiée aux pages ouvertes, voir events.py)
+    values = dict(version=UserVersion.version + 1, updated_at=utcnow())
+    increment = update(UserVersion).where(UserVersion.user_id == user_id).values(**values).returning(UserVersion.version)
+    version = session.execute(increment).scalar()
+
+    if version is None:
+        try:
+            session.execute(insert(UserVersion).values(user_id=user_id, version=1, updated_at=values["updated_at"]))
+            version = 1
+        except IntegrityError:
+            # Créée entre-temps par une autre requête
+            session.rollback()
+            version = session.execute(increment).scalar()
+
+    session.commit()
+
+    return version
+
+
+def skip_conditional():
+    # Un message flash en attente doit être affiché : pas de 304
+    return request.method != "GET" or "_flashes" in flask_session
+
+
+def is_fresh(etag, updated_at):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+
+    return updated_at is not None and request.if_modified_since is not None \
+        and request.if_modified_since.replace(tzinfo=None) >= updated_at.replace(microsecond=0)
+
+
+def validated(response, etag, updated_at):
+    response.set_etag(etag, weak=True)
+    if updated_at is not None:
+        response.last_modified = updated_at
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.vary.add("Cookie")
+
+    return response
+
+
+def conditional(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if skip_conditional():
+            return view(*args, **kwargs)
+
+        version, updated_at = data_version(current_user.id)
+        etag = f"{current_user.id}-{version}-{RELEASE}"
+        # Relue par les caches de la vue (voir stats.py)
+        g.data_version = (current_user.id, version)
+
+        response = Response(status=304) if is_fresh(etag, updated_at) else make_response(view(*args, **kwargs))
+
+        return validated(response, etag, updated_at)
+
+    return wrapper
+
+
+def async_conditional(view):
+    # Même chose pour les vues asynchrones (asgi.py) : db est la session AsyncSession de la requête
+    @wraps(view)
+    async def wrapper(db, *args, **kwargs):
+        if skip_conditional():
+            return await view(db, *args, **kwargs)
+
+        row = (await db.execute(version_query(current_user.id))).first()
+        version, updated_at = row if row is not None else (0, None)
+        etag = f"{current_user.id}-{version}-{RELEASE}"
+        g.data_version = (current_user.id, version)
+
+        response = Response(status=304) if is_fresh(etag, updated_at) else make_response(await view(db, *args, **kwargs))
+
+        return validated(response, etag, updated_at)
+
+    return wrapper